@@ -1,22 +1,20 @@
 import os
 import asyncio
-import json
-import base64
-import numpy as np
+import atexit
 from dotenv import load_dotenv
 from flask import Flask, request
 from flask_sock import Sock
 from hume import AsyncHumeClient
-from hume.empathic_voice.types import SubscribeEvent
-from hume.empathic_voice import AudioInput, ToolResponseMessage, ToolErrorMessage, SessionSettings
-from audio_processors import TwilioAudioProcessor, EviAudioProcessor
-from tools import supportAssistant
+from dsp_pool import dsp_backend_from_env
+from media_stream import build_twiml, handle_media_stream, hume_evi_connector
+from metrics import CONTENT_TYPE, REGISTRY
 
 # Load environment variables from .env file
 load_dotenv()
 hume_api_key = os.environ["HUME_API_KEY"]
 
 hume_client = AsyncHumeClient(api_key=hume_api_key)
+dsp_backend = dsp_backend_from_env()
 app = Flask(__name__)
 sock = Sock(app)
 
@@ -26,6 +24,12 @@ def serve_homepage():
     return "EVI + Twilio Integration Server"
 
 
+@app.route("/metrics")
+def serve_metrics():
+    """Latency histograms and other proxy metrics in the Prometheus text format."""
+    return REGISTRY.render(), 200, {"Content-Type": CONTENT_TYPE}
+
+
 @app.route("/twiml", methods=["POST"])
 def twiml_response():
     """
@@ -35,14 +39,7 @@ def twiml_response():
     server_url = request.url_root.replace(
         "http://", "wss://").replace("https://", "wss://")
 
-# Response is what Twilio voice will pronounce at the beginning of the call.
-    twiml = f"""<?xml version="1.0" encoding="UTF-8"?>
-<Response>
-    <Say>Connecting you to Hume AI EVI customer support assistant</Say>
-    <Connect>
-        <Stream url="{server_url}media-stream" />
-    </Connect>
-</Response>"""
+    twiml = build_twiml(server_url)
 
     print(f"📞 Incoming call")
     print(f"   Media Stream URL: {server_url}media-stream")
@@ -50,272 +47,35 @@ def twiml_response():
     return twiml, 200, {"Content-Type": "application/xml"}
 
 
-@sock.route("/media-stream")
-def media_stream(ws):
-    loop = asyncio.new_event_loop()
-    asyncio.set_event_loop(loop)
-    try:
-        loop.run_until_complete(handle_media_stream(ws))
-    finally:
-        loop.close()
-
+class FlaskSockMediaStream:
+    """Adapts the blocking flask_sock websocket by running each receive/send in the default executor."""
 
-async def handle_media_stream(ws):
-    from asyncio import Queue
+    def __init__(self, ws) -> None:
+        self.ws = ws
 
-    # Queues for passing audio between tasks
-    twilio_to_evi_queue = Queue()
-    evi_to_twilio_queue = Queue()
+    async def receive(self):
+        return await asyncio.get_running_loop().run_in_executor(None, self.ws.receive)
 
-    # Audio processors for format conversion
-    twilio_audio_processor = TwilioAudioProcessor()
-    evi_audio_processor = EviAudioProcessor(
-        audio_numpy_dtype=np.dtype(np.int16),
-        target_frames=8000
-    )
+    async def send(self, message: str) -> None:
+        await asyncio.get_running_loop().run_in_executor(None, self.ws.send, message)
 
-    stream_sid = None
-    evi_socket = None
 
+@sock.route("/media-stream")
+def media_stream(ws):
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
     try:
-        async def receive_from_twilio():
-            """Receives audio from Twilio, converts μ-law to linear16, and queues for EVI."""
-            nonlocal stream_sid
-            loop = asyncio.get_event_loop()
-
-            while True:
-                message = await loop.run_in_executor(None, ws.receive)
-                if message is None:
-                    break
-
-                data = json.loads(message)
-                event_type = data.get("event")
-
-                if event_type == "connected":
-                    print("✅ Twilio connected")
-
-                elif event_type == "start":
-                    stream_sid = data.get("streamSid")
-                    print(f"🎤 Call started: {stream_sid}")
-
-                elif event_type == "media":
-                    # Queue Twilio audio for conversion and sending to EVI
-                    media_data = data.get("media", {})
-                    await twilio_audio_processor.queue_twilio_audio(
-                        twilio_media_payload={
-                            "payload": media_data.get("payload"),
-                            "track": "inbound",
-                            "timestamp": media_data.get("timestamp")
-                        },
-                        twilio_to_evi_queue=twilio_to_evi_queue
-                    )
-
-                elif event_type == "stop":
-                    print("🛑 Call ended")
-                    break
-
-        async def send_to_evi():
-            """Sends queued audio chunks to EVI."""
-            nonlocal evi_socket
-            while True:
-                chunk = await twilio_to_evi_queue.get()
-                if evi_socket:
-                    audio_input = AudioInput(
-                        data=base64.b64encode(chunk).decode("utf-8"))
-                    await evi_socket.send_publish(audio_input)
-
-        async def handle_tool_call(message: SubscribeEvent):
-            """Handles tool calls from EVI."""
-            tool_name = message.name
-            call_id = message.tool_call_id
-
-            print(f"🔧 Tool call: {tool_name}")
-
-            try:
-                tool_parameters = json.loads(message.parameters)
-                print(f"📋 Tool parameters: {tool_parameters}")
-
-                if tool_name == "supportAssistant":
-                    ticket_id = tool_parameters.get("ticket_id", "")
-
-                    if not ticket_id:
-                        raise ValueError("ticket_id parameter is required")
-
-                    # Call the tool function
-                    result = await supportAssistant(ticket_id)
-
-                    # Send success response back to EVI
-                    await evi_socket.send_publish(
-                        ToolResponseMessage(
-                            tool_call_id=call_id,
-                            content=result
-                        )
-                    )
-                    print(f"✅ Tool response sent: {result}")
-
-                else:
-                    # Unknown tool
-                    await evi_socket.send_publish(
-                        ToolErrorMessage(
-                            tool_call_id=call_id,
-                            error="Tool not found",
-                            content=f"Unknown tool: {tool_name}"
-                        )
-                    )
-                    print(f"❌ Unknown tool: {tool_name}")
-
-            except Exception as e:
-                # Send error response back to EVI
-                await evi_socket.send_publish(
-                    ToolErrorMessage(
-                        tool_call_id=call_id,
-                        error="Tool execution failed",
-                        content=str(e)
-                    )
-                )
-                print(f"❌ Tool error: {e}")
-
-        async def on_evi_message(message: SubscribeEvent):
-            """Handles messages received from EVI."""
-            if message.type == "chat_metadata":
-                print(f"📨 Chat ID: {message.chat_id}")
-
-            elif message.type == "audio_output":
-                # Convert EVI audio to Twilio μ-law format and queue
-                evi_audio_bytes = base64.b64decode(
-                    message.data.encode("utf-8"))
-                twilio_audio = evi_audio_processor.postprocess_audio(
-                    evi_audio_bytes)
-                evi_to_twilio_queue.put_nowait(
-                    base64.b64encode(twilio_audio).decode("utf-8"))
-                print("🔊 EVI audio received")
-
-            elif message.type == "user_message":
-                print(f"👤 User: {message.message.content}")
-
-            elif message.type == "assistant_message":
-                print(f"💬 EVI: {message.message.content}")
-
-            elif message.type == "tool_call":
-                # Handle tool calls from EVI
-                await handle_tool_call(message)
-
-            elif message.type == "error":
-                print(f"❌ EVI Error: {message.message}")
-
-        async def send_to_twilio():
-            """Sends queued audio chunks to Twilio."""
-            loop = asyncio.get_event_loop()
-            while True:
-                audio_b64 = await evi_to_twilio_queue.get()
-                if stream_sid:
-                    payload = {
-                        "event": "media",
-                        "streamSid": stream_sid,
-                        "media": {"payload": audio_b64}
-                    }
-                    await loop.run_in_executor(None, ws.send, json.dumps(payload))
-
-        # Connect to EVI
-        print("🔌 Connecting to EVI...")
-
-        # You can provide query parameters to EVI on handshake:
-        # https://dev.hume.ai/reference/speech-to-speech-evi/chat#request.query
-        session_variables = {
-            "name": "Joshua"
-        }
-
-        session_settings_config = {
-            # Do not delete the audio settings, as they are needed for audio streaming.
-            "audio": {
-                "encoding": "linear16",
-                "sample_rate": 8000,
-                "channels": 1
-            },
-            "variables": json.dumps(session_variables),
-            # Add user context (optional)
-            # See: https://dev.hume.ai/reference/speech-to-speech-evi/chat#send.SessionSettings.context
-            "context": {
-                "type": "persistent",
-                "text": (
-                    "You are a helpful customer support assistant. Use their name and ask "
-                    "them for their support ticket ID, so you can give them an update on "
-                    "their ticket status."
-                )
-            }
-        }
-
-        async with hume_client.empathic_voice.chat.connect(
-            config_id="2e7ba66e-db54-4772-ad5f-1a58a95ebc78",
-            session_settings=session_settings_config
-        ) as socket:
-            print("✅ EVI connected")
-            evi_socket = socket
-
-            async def listen_to_evi():
-                try:
-                    async for message in socket:
-                        await on_evi_message(message)
-                except asyncio.CancelledError:
-                    raise
-                except Exception as err:
-                    print(f"❌ EVI Error: {err}")
-                    raise
-                finally:
-                    print("👋 EVI disconnected")
-
-            async def update_session_settings():
-                try:
-                    await asyncio.sleep(10)
-                    if evi_socket:
-                        session_settings_message = SessionSettings(
-                            voice_id="ebba4902-69de-4e01-9846-d8feba5a1a3f" # TikTok Fashion Influencer
-                        )
-                        await evi_socket.send_publish(session_settings_message)
-                        print("🎛️ Session settings updated with new voice: TikTok Fashion Influencer")
-                except asyncio.CancelledError:
-                    raise
-                except Exception as err:
-                    print(f"❌ Failed to update session settings: {err}")
-                    raise
-
-            # Run all audio streaming tasks concurrently
-            streaming_tasks = [
-                asyncio.create_task(receive_from_twilio()),
-                asyncio.create_task(send_to_evi()),
-                asyncio.create_task(send_to_twilio()),
-                asyncio.create_task(listen_to_evi()),
-            ]
-            voice_update_task = asyncio.create_task(update_session_settings())
-
-            # Wait for any core streaming task to complete, then clean up
-            await asyncio.wait(streaming_tasks, return_when=asyncio.FIRST_COMPLETED)
-
-            for task in streaming_tasks:
-                task.cancel()
-
-            voice_update_task.cancel()
-
-            for task in streaming_tasks:
-                try:
-                    await task
-                except asyncio.CancelledError:
-                    pass
-
-            try:
-                await voice_update_task
-            except asyncio.CancelledError:
-                pass
-
-    except Exception as e:
-        print(f"❌ Error: {e}")
-        import traceback
-        traceback.print_exc()
+        loop.run_until_complete(handle_media_stream(
+            FlaskSockMediaStream(ws), hume_evi_connector(hume_client), dsp_backend))
     finally:
-        print("👋 Call ended")
+        loop.close()
 
 
 # Start the server
 if __name__ == "__main__":
+    # Start the DSP workers, if any, before the first call and stop them when the server exits. Only here: spawned
+    # workers import this module too
+    dsp_backend.start()
+    atexit.register(dsp_backend.shutdown)
     port = int(os.environ.get("PORT", 5001))
     app.run(host="0.0.0.0", debug=True, port=port)
@@ -0,0 +1,88 @@
+"""
+ASGI variant of app.py. All calls share one event loop and the websocket is read and written natively, without
+the per-call event loop and executor hops of the Flask server.
+
+Run with: uv run uvicorn asgi_app:create_app --factory --port 5001
+"""
+import asyncio
+import contextlib
+import os
+from typing import AsyncIterator, Optional
+
+from dotenv import load_dotenv
+from hume import AsyncHumeClient
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import PlainTextResponse, Response
+from starlette.routing import Route, WebSocketRoute
+from starlette.websockets import WebSocket, WebSocketDisconnect
+from dsp_pool import dsp_backend_from_env
+from evi_pool import evi_pool_from_env
+from media_stream import EVI_AUDIO_SETTINGS, EviConnector, build_twiml, handle_media_stream, hume_evi_connector
+from metrics import CONTENT_TYPE, REGISTRY
+
+
+class StarletteMediaStream:
+    def __init__(self, websocket: WebSocket) -> None:
+        self.websocket = websocket
+
+    async def receive(self) -> Optional[str]:
+        try:
+            return await self.websocket.receive_text()
+        except WebSocketDisconnect:
+            return None
+
+    async def send(self, message: str) -> None:
+        await self.websocket.send_text(message)
+
+
+def create_app(connect_evi: Optional[EviConnector] = None) -> Starlette:
+    """Builds the server. connect_evi defaults to a Hume client authenticated with HUME_API_KEY."""
+    if connect_evi is None:
+        load_dotenv()
+        connect_evi = hume_evi_connector(AsyncHumeClient(api_key=os.environ["HUME_API_KEY"]))
+    dsp_backend = dsp_backend_from_env()
+    # With EVI_POOL_SIZE set, calls take an EVI chat that is already connected
+    evi_pool = evi_pool_from_env(connect_evi, EVI_AUDIO_SETTINGS)
+    connect_call_evi = evi_pool.connect if evi_pool is not None else connect_evi
+
+    @contextlib.asynccontextmanager
+    async def lifespan(app: Starlette) -> AsyncIterator[None]:
+        # Starting DSP workers blocks until they are up, so it runs off the event loop
+        await asyncio.get_running_loop().run_in_executor(None, dsp_backend.start)
+        if evi_pool is not None:
+            evi_pool.start()
+        try:
+            yield
+        finally:
+            if evi_pool is not None:
+                await evi_pool.close()
+            await asyncio.get_running_loop().run_in_executor(None, dsp_backend.shutdown)
+
+    async def serve_homepage(request: Request) -> Response:
+        return PlainTextResponse("EVI + Twilio Integration Server")
+
+    async def serve_metrics(request: Request) -> Response:
+        """Latency histograms and other proxy metrics in the Prometheus text format."""
+        return Response(REGISTRY.render(), headers={"Content-Type": CONTENT_TYPE})
+
+    async def twiml_response(request: Request) -> Response:
+        """TwiML endpoint that Twilio calls when a phone call comes in, see app.py."""
+        server_url = str(request.base_url).replace(
+            "http://", "wss://").replace("https://", "wss://")
+
+        print(f"📞 Incoming call")
+        print(f"   Media Stream URL: {server_url}media-stream")
+
+        return Response(build_twiml(server_url), media_type="application/xml")
+
+    async def media_stream(websocket: WebSocket) -> None:
+        await websocket.accept()
+        await handle_media_stream(StarletteMediaStream(websocket), connect_call_evi, dsp_backend)
+
+    return Starlette(lifespan=lifespan, routes=[
+        Route("/", serve_homepage),
+        Route("/metrics", serve_metrics),
+        Route("/twiml", twiml_response, methods=["POST"]),
+        WebSocketRoute("/media-stream", media_stream),
+    ])
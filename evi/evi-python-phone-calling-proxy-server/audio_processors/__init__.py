@@ -1,7 +1,10 @@
 """Audio processors for converting between Twilio and EVI audio formats."""
 
+from .adaptive_batcher import AdaptiveBatcher, adaptive_batcher_from_env
+from .silence_gate import SilenceGate, silence_gate_from_env
 from .twilio_audio_processor import TwilioAudioProcessor
 from .evi_audio_processor import EviAudioProcessor, AudioProcessingConfig
 
-__all__ = ["TwilioAudioProcessor",
+__all__ = ["AdaptiveBatcher", "adaptive_batcher_from_env",
+           "SilenceGate", "silence_gate_from_env", "TwilioAudioProcessor",
            "EviAudioProcessor", "AudioProcessingConfig"]
@@ -0,0 +1,56 @@
+import logging
+import os
+from typing import ClassVar
+
+logger = logging.getLogger(__name__)
+
+
+class AdaptiveBatcher:
+    """
+    Chooses how much inbound Twilio audio to batch into each chunk sent to EVI. Small windows give EVI the caller's
+    audio sooner (lower end-of-speech latency), large windows mean fewer, bigger messages (higher throughput).
+    The window shrinks one Twilio frame at a time while sends to EVI are fast and nothing is queued, and doubles
+    as soon as sends get slow relative to the window or chunks start piling up.
+    """
+    min_window_ms: int
+    max_window_ms: int
+    window_ms: int
+    # Twilio sends 20 ms of 8 kHz μ-law per message, 8 bytes per ms
+    FRAME_MS: ClassVar[int] = 20
+    BYTES_PER_MS: ClassVar[int] = 8
+
+    def __init__(self, min_window_ms: int = 40, max_window_ms: int = 400) -> None:
+        self.min_window_ms = self._to_frames(min_window_ms)
+        self.max_window_ms = max(self._to_frames(max_window_ms), self.min_window_ms)
+        # Start out safe and let fast sends bring the window down
+        self.window_ms = self.max_window_ms
+
+    @property
+    def window_bytes(self) -> int:
+        return self.window_ms * self.BYTES_PER_MS
+
+    def observe_send(self, send_latency: float, queue_depth: int) -> None:
+        """Records how long one send to EVI took (seconds) and how many chunks were still waiting afterwards."""
+        window_seconds = self.window_ms / 1000
+        if queue_depth > 1 or send_latency > window_seconds / 2:
+            window_ms = min(self.window_ms * 2, self.max_window_ms)
+        elif queue_depth == 0 and send_latency < window_seconds / 4:
+            window_ms = max(self.window_ms - self.FRAME_MS, self.min_window_ms)
+        else:
+            return
+
+        if window_ms != self.window_ms:
+            logger.debug("Inbound batch window %d ms -> %d ms", self.window_ms, window_ms)
+            self.window_ms = window_ms
+
+    def _to_frames(self, window_ms: int) -> int:
+        # Round to whole Twilio frames, at least one
+        return max(round(window_ms / self.FRAME_MS), 1) * self.FRAME_MS
+
+
+def adaptive_batcher_from_env() -> AdaptiveBatcher:
+    """INBOUND_BATCH_MIN_MS and INBOUND_BATCH_MAX_MS bound the window, set both to the same value to fix it."""
+    return AdaptiveBatcher(
+        min_window_ms=int(os.environ.get("INBOUND_BATCH_MIN_MS", "40")),
+        max_window_ms=int(os.environ.get("INBOUND_BATCH_MAX_MS", "400")),
+    )
@@ -1,17 +1,25 @@
-import audioop
 import dataclasses
-import io
+import functools
+import math
+import struct
 import wave
-from typing import Optional
+from typing import Optional, Sequence, Union
 import logging
 
 import numpy as np
 import scipy.signal as signal
 
+from .mulaw import ulaw_encode
+
 logger = logging.getLogger(__name__)
 
+# Resampler outputs computed per block in streaming mode
+RESAMPLE_BLOCK_ROWS = 256
+# Filter banks kept for reuse across calls, one per config and input sample rate
+FILTER_BANK_CACHE_SIZE = 32
 
-@dataclasses.dataclass
+
+@dataclasses.dataclass(frozen=True)
 class AudioProcessingConfig:
     # Default filter design taken from https://help.twilio.com/articles/223180588
     aa_filter_order: int = 5
@@ -22,47 +30,487 @@ class AudioProcessingConfig:
     peak_filter_gain_db: int = 3
     notch_filter_freq: int = 1200
     notch_filter_bandwidth: int = 100
+    # Loudness normalization in streaming mode: gain follows the peak envelope, falling within about attack_ms
+    # when the audio gets louder and rising within about release_ms when it gets quieter, updated every block_ms
+    agc_target_peak_dbfs: float = -1.0
+    agc_max_gain: float = 3.0
+    agc_attack_ms: float = 1.0
+    agc_release_ms: float = 300.0
+    agc_block_ms: float = 2.0
+
+
+@dataclasses.dataclass(frozen=True)
+class _FilterBank:
+    # Filter coefficients for one config and input sample rate, designed once per process and shared by every call
+    # in streaming mode, so they must not be modified. They are float32, like the audio, so that SciPy doesn't
+    # promote every chunk to float64
+    aa_sos: Optional[np.ndarray]
+    resample_taps: Optional[np.ndarray]
+    # Contiguous copy of the taps in reverse, for the dot products of the resampler
+    resample_taps_reversed: Optional[np.ndarray]
+    resample_up: int
+    resample_down: int
+    # High-pass, peak and notch filters at the target sample rate
+    filters_sos: np.ndarray
+
+
+@dataclasses.dataclass
+class _StreamState:
+    # Filter delay lines and resampler phase carried from one chunk to the next
+    original_fs: int
+    aa_zi: Optional[np.ndarray]
+    resample_phase: int
+    filters_zi: np.ndarray
+    # Gain applied at the end of the last chunk
+    agc_gain: float
+    # Work buffers, grown to the largest chunk seen and then reused: the float32 input samples, the resampler
+    # input (its last len(resample_taps) - 1 samples from the previous chunk followed by this chunk, zero-stuffed
+    # when upsampling), a block of resampler input windows, the resampler output, the per-sample AGC gain and the
+    # int16 output
+    samples: np.ndarray
+    resample_buffer: Optional[np.ndarray]
+    resample_windows: Optional[np.ndarray]
+    resampled: np.ndarray
+    gain: np.ndarray
+    pcm: np.ndarray
+
+
+@dataclasses.dataclass
+class _BatchRow:
+    # One call's chunk in EviAudioProcessor.postprocess_audio_batch
+    processor: "EviAudioProcessor"
+    bank: _FilterBank
+    state: _StreamState
+    samples: np.ndarray
+
+
+def _sosfilt_rows(sos: np.ndarray, rows: list[np.ndarray], zis: list[np.ndarray]) -> list[np.ndarray]:
+    """
+    Filters each of `rows` in place, starting from its own initial conditions in `zis`, and returns the final
+    conditions. The prefix that all rows have in common is filtered as a single 2-D array, the rest row by row.
+    Empty rows, which sosfilt can't take, keep their initial conditions.
+    """
+    final_zis = list(zis)
+    filled = [i for i, row in enumerate(rows) if len(row)]
+    if len(filled) <= 1:
+        for i in filled:
+            rows[i][:], final_zis[i] = signal.sosfilt(sos, rows[i], zi=zis[i])
+        return final_zis
+
+    common = min(len(rows[i]) for i in filled)
+    stacked = np.empty((len(filled), common), dtype=rows[filled[0]].dtype)
+    for j, i in enumerate(filled):
+        stacked[j] = rows[i][:common]
+    # sosfilt takes initial conditions shaped (sections, rows, 2) when filtering along the last axis
+    filtered, stacked_zi = signal.sosfilt(sos, stacked, zi=np.stack([zis[i] for i in filled], axis=1))
+
+    for j, i in enumerate(filled):
+        row = rows[i]
+        row[:common] = filtered[j]
+        final_zi = stacked_zi[:, j]
+        if len(row) > common:
+            row[common:], final_zi = signal.sosfilt(sos, row[common:], zi=final_zi)
+        final_zis[i] = np.ascontiguousarray(final_zi)
+    return final_zis
+
+
+def _grow(buffer: np.ndarray, size: int, keep: int = 0) -> np.ndarray:
+    """Returns `buffer`, or a bigger one with the first `keep` items copied over if it holds fewer than `size`."""
+    if len(buffer) >= size:
+        return buffer
+    grown = np.empty(max(size, 2 * len(buffer)), dtype=buffer.dtype)
+    grown[:keep] = buffer[:keep]
+    return grown
+
+
+@dataclasses.dataclass
+class _WavFormat:
+    # Format of the EVI audio for the session, parsed from the first WAV header
+    sample_rate: int
+    # Size of the header in front of the samples
+    header_bytes: int
+    # Header bytes that are the same for every chunk of the session: everything but the RIFF and data sizes
+    header_fields: bytes
+
+
+def _parse_wav_header(data: bytes) -> Optional[_WavFormat]:
+    """Parses a RIFF/WAVE header up to the start of the samples, or returns None if `data` ends before that."""
+    if len(data) < 12:
+        return None
+    if data[:4] != b"RIFF" or data[8:12] != b"WAVE":
+        raise wave.Error("EVI audio is not a WAV file")
+
+    sample_rate = None
+    offset = 12
+    while offset + 8 <= len(data):
+        chunk_id = data[offset: offset + 4]
+        (chunk_size,) = struct.unpack_from("<I", data, offset + 4)
+        if chunk_id == b"data":
+            if sample_rate is None:
+                raise wave.Error("WAV data chunk before fmt chunk")
+            header_bytes = offset + 8
+            return _WavFormat(sample_rate, header_bytes, bytes(data[8: header_bytes - 4]))
+        if chunk_id == b"fmt " and offset + 16 <= len(data):
+            (sample_rate,) = struct.unpack_from("<I", data, offset + 12)
+        # Chunks are padded to an even size
+        offset += 8 + chunk_size + (chunk_size & 1)
+    return None
+
+
+def _design_anti_aliasing_filter(config: AudioProcessingConfig, original_fs: int, target_fs: int) -> np.ndarray:
+    nyquist_freq = target_fs / 2.0
+    cutoff_freq = nyquist_freq * 0.9
+
+    return signal.butter(config.aa_filter_order, cutoff_freq,
+                         btype="lowpass", fs=original_fs, output="sos")
+
+
+def _design_high_pass_filter(config: AudioProcessingConfig, fs: int) -> np.ndarray:
+    return signal.butter(
+        config.high_pass_filter_order,
+        config.high_pass_filter_cutoff_freq,
+        btype="highpass",
+        fs=fs,
+        output="sos",
+    )
+
+
+def _design_peak_filter(config: AudioProcessingConfig, fs: int) -> tuple[np.ndarray, np.ndarray]:
+    min_freq = config.peak_filter_min_freq
+    max_freq = config.peak_filter_max_freq
+
+    peak_center_freq = (min_freq + max_freq) / 2
+    peak_bandwith = max_freq - min_freq
+    peak_gain_db = config.peak_filter_gain_db
+
+    q_peak = peak_center_freq / peak_bandwith
+    peak_gain_linear = 10 ** (peak_gain_db / 20)
+    peak_b, peak_a = signal.iirpeak(peak_center_freq, q_peak, fs=fs)
+    peak_b += peak_gain_linear
+
+    return peak_b, peak_a
+
+
+def _design_notch_filter(config: AudioProcessingConfig, fs: int) -> tuple[np.ndarray, np.ndarray]:
+    notch_freq = config.notch_filter_freq
+    notch_bandwith = config.notch_filter_bandwidth
+    q_notch = notch_freq / notch_bandwith
+    return signal.iirnotch(notch_freq, q_notch, fs=fs)
+
+
+@functools.lru_cache(maxsize=FILTER_BANK_CACHE_SIZE)
+def _filter_bank(config: AudioProcessingConfig, fs: int, original_fs: int) -> _FilterBank:
+    """Designs the streaming filters for one config, output and input sample rate, shared by every call using them."""
+    aa_sos = resample_taps = None
+    up = down = 1
+    if original_fs != fs and original_fs > fs:
+        aa_sos = _design_anti_aliasing_filter(config, original_fs, fs)
+        g = math.gcd(fs, original_fs)
+        up, down = fs // g, original_fs // g
+        # Same linear-phase low-pass FIR that resample_poly designs by default
+        max_rate = max(up, down)
+        resample_taps = signal.firwin(
+            2 * 10 * max_rate + 1, 1.0 / max_rate, window=("kaiser", 5.0)) * up
+
+    # High-pass, peak and notch filters as one cascade of second-order sections
+    filters_sos = np.vstack([
+        _design_high_pass_filter(config, fs),
+        signal.tf2sos(*_design_peak_filter(config, fs)),
+        signal.tf2sos(*_design_notch_filter(config, fs)),
+    ])
+
+    def float32(coefficients: Optional[np.ndarray]) -> Optional[np.ndarray]:
+        return None if coefficients is None else coefficients.astype(np.float32)
+
+    return _FilterBank(
+        aa_sos=float32(aa_sos),
+        resample_taps=float32(resample_taps),
+        resample_taps_reversed=None if resample_taps is None else float32(resample_taps[::-1]),
+        resample_up=up,
+        resample_down=down,
+        filters_sos=float32(filters_sos),
+    )
 
 
 class EviAudioProcessor:
     audio_numpy_dtype: np.dtype
     target_frames: int
     config: AudioProcessingConfig
+    streaming: bool
 
     def __init__(
-        self, audio_numpy_dtype: np.dtype, target_frames: int, config: Optional[AudioProcessingConfig] = None
+        self,
+        audio_numpy_dtype: np.dtype,
+        target_frames: int,
+        config: Optional[AudioProcessingConfig] = None,
+        streaming: bool = False,
+        pcm_sample_rate: Optional[int] = None,
     ) -> None:
         self.audio_numpy_dtype = audio_numpy_dtype
         self.target_frames = target_frames
         self.config = config if config is not None else AudioProcessingConfig()
+        # In streaming mode, one processor handles the chunks of a single call in order: filters are designed once
+        # per config and input sample rate and their state is carried across chunks, so chunk boundaries don't click
+        self.streaming = streaming
+        self._stream_state: Optional[_StreamState] = None
+        # The EVI audio format is fixed for the session: it is taken from the first WAV header (or given up front as
+        # pcm_sample_rate, for headerless PCM), after which samples are read straight out of each chunk
+        self._wav_format: Optional[_WavFormat] = (
+            _WavFormat(pcm_sample_rate, 0, b"") if pcm_sample_rate is not None else None)
+        # Start of a WAV header that was split across chunks, and a trailing partial sample of headerless PCM
+        self._partial_header = b""
+        self._partial_sample = b""
 
     def postprocess_audio(self, evi_audio: bytes) -> bytes:
+        return ulaw_encode(self.postprocess_pcm(evi_audio))
+
+    def postprocess_pcm(self, evi_audio: bytes) -> np.ndarray:
+        """
+        postprocess_audio without the final μ-law encoding: int16 PCM at target_frames. `evi_audio` can be any
+        bytes-like object, which is only read during the call. With streaming, the result is a view of a per-call
+        buffer that the next chunk reuses.
+        """
         audio, original_fs = self._read_audio(evi_audio)
-        audio = self._ensure_float(audio)
-
-        if original_fs != self.target_frames and original_fs > self.target_frames:
-            audio = self._resample_audio(
-                audio=audio, original_fs=original_fs, target_fs=self.target_frames)
-
-        audio = self._apply_filters(audio, self.target_frames)
-
-        int16_audio = self._normalize_audio(audio)
-
-        audio_bytes = int16_audio.tobytes()
-
-        ulaw_audio = audioop.lin2ulaw(audio_bytes, 2)
-
-        return ulaw_audio
+        if len(audio) == 0:
+            return np.empty(0, dtype=np.int16)
+
+        if self.streaming:
+            int16_audio = self._process_streaming(audio, original_fs)
+        else:
+            audio = self._ensure_float(audio)
+            if original_fs != self.target_frames and original_fs > self.target_frames:
+                audio = self._resample_audio(
+                    audio=audio, original_fs=original_fs, target_fs=self.target_frames)
+
+            audio = self._apply_filters(audio, self.target_frames)
+            int16_audio = self._normalize_audio(audio)
+
+        return int16_audio
+
+    @staticmethod
+    def postprocess_audio_batch(
+        processors: Sequence["EviAudioProcessor"], evi_audio: Sequence[bytes]
+    ) -> list[Union[bytes, Exception]]:
+        """
+        postprocess_audio for one chunk from each of several calls, each with its own streaming processor. The
+        filters of calls with the same config and input sample rate run as one 2-D pass over all of their chunks,
+        so the SciPy call overhead is paid once per batch rather than once per call. A chunk that can't be read
+        gets the exception in place of its audio, so that it doesn't fail the other calls' chunks.
+        """
+        rows: list[Union[_BatchRow, Exception, None]] = []
+        for processor, chunk in zip(processors, evi_audio):
+            try:
+                audio, original_fs = processor._read_audio(chunk)
+            except Exception as e:
+                rows.append(e)
+                continue
+            if len(audio) == 0:
+                rows.append(None)
+                continue
+            bank, state, samples = processor._start_streaming_chunk(audio, original_fs)
+            rows.append(_BatchRow(processor, bank, state, samples))
+
+        groups: dict[int, list[_BatchRow]] = {}
+        for row in rows:
+            if isinstance(row, _BatchRow):
+                groups.setdefault(id(row.bank), []).append(row)
+
+        for group in groups.values():
+            bank = group[0].bank
+            if bank.resample_taps is not None:
+                zis = _sosfilt_rows(bank.aa_sos, [row.samples for row in group], [row.state.aa_zi for row in group])
+                for row, zi in zip(group, zis):
+                    row.state.aa_zi = zi
+                    row.samples = row.processor._resample_chunk(row.samples, bank, row.state)
+
+            zis = _sosfilt_rows(
+                bank.filters_sos, [row.samples for row in group], [row.state.filters_zi for row in group])
+            for row, zi in zip(group, zis):
+                row.state.filters_zi = zi
+
+        results: list[Union[bytes, Exception]] = []
+        for row in rows:
+            if isinstance(row, _BatchRow):
+                results.append(ulaw_encode(row.processor._finish_streaming_chunk(row.samples, row.state)))
+            else:
+                # No samples yet, or the chunk couldn't be read
+                results.append(b"" if row is None else row)
+        return results
+
+    def _process_streaming(self, audio: np.ndarray, original_fs: int) -> np.ndarray:
+        # float32 throughout, in the per-call work buffers where the SciPy filters allow it. Returns a view of the
+        # int16 output buffer, valid until the next chunk
+        bank, state, samples = self._start_streaming_chunk(audio, original_fs)
+
+        if bank.resample_taps is not None:
+            samples, state.aa_zi = signal.sosfilt(bank.aa_sos, samples, zi=state.aa_zi)
+            samples = self._resample_chunk(samples, bank, state)
+            if len(samples) == 0:
+                # Too short to reach the next output sample: its input is in the resampler history, and sosfilt
+                # can't take an empty chunk
+                return state.pcm[:0]
+
+        samples, state.filters_zi = signal.sosfilt(bank.filters_sos, samples, zi=state.filters_zi)
+        return self._finish_streaming_chunk(samples, state)
+
+    def _start_streaming_chunk(
+        self, audio: np.ndarray, original_fs: int
+    ) -> tuple[_FilterBank, _StreamState, np.ndarray]:
+        bank = _filter_bank(self.config, self.target_frames, original_fs)
+        state = self._stream_state
+        if state is None or state.original_fs != original_fs:
+            state = self._stream_state = self._init_stream_state(bank, original_fs)
+
+        state.samples = _grow(state.samples, len(audio))
+        samples = state.samples[: len(audio)]
+        np.copyto(samples, audio)
+        return bank, state, samples
+
+    def _finish_streaming_chunk(self, samples: np.ndarray, state: _StreamState) -> np.ndarray:
+        if len(samples) == 0:
+            return state.pcm[:0]
+
+        self._apply_agc(samples, state)
+        np.clip(samples, np.iinfo(np.int16).min, np.iinfo(np.int16).max, out=samples)
+        state.pcm = _grow(state.pcm, len(samples))
+        pcm = state.pcm[: len(samples)]
+        np.copyto(pcm, samples, casting="unsafe")
+        return pcm
+
+    def _apply_agc(self, audio: np.ndarray, state: _StreamState) -> None:
+        # Streaming replacement for _normalize_audio: each block's gain is set from its peak, smoothed with attack
+        # and release time constants, and carried over to the next chunk, so loudness doesn't jump at chunk
+        # boundaries and no sample has to wait for the rest of its chunk. Within a block the gain is ramped
+        # linearly from the previous block's; the clip that follows catches what the attack lets through.
+        config = self.config
+        block = max(1, round(self.target_frames * config.agc_block_ms / 1000))
+        block_seconds = block / self.target_frames
+        attack = math.exp(-block_seconds / (config.agc_attack_ms / 1000))
+        release = math.exp(-block_seconds / (config.agc_release_ms / 1000))
+        target_peak = np.iinfo(np.int16).max * 10 ** (config.agc_target_peak_dbfs / 20)
+
+        n = len(audio)
+        state.gain = _grow(state.gain, n)
+        gain = state.gain[:n]
+        block_starts = np.arange(0, n, block)
+        block_peaks = np.maximum.reduceat(np.abs(audio, out=gain), block_starts)
+
+        block_gains = []
+        current = state.agc_gain
+        for peak in block_peaks.tolist():
+            wanted = min(target_peak / peak, config.agc_max_gain) if peak > 0 else config.agc_max_gain
+            coefficient = attack if wanted < current else release
+            current = wanted + coefficient * (current - wanted)
+            block_gains.append(current)
+
+        ends = np.array(block_gains, dtype=np.float32)
+        starts = np.empty_like(ends)
+        starts[0] = state.agc_gain
+        starts[1:] = ends[:-1]
+        state.agc_gain = current
+
+        # Per-sample gain: a ramp from starts to ends over each block, the last one possibly shorter
+        n_full = n // block
+        ramp = np.arange(1, block + 1, dtype=np.float32) / block
+        full_gain = gain[: n_full * block].reshape(n_full, block)
+        np.multiply((ends - starts)[:n_full, None], ramp, out=full_gain)
+        full_gain += starts[:n_full, None]
+        if n_full < len(ends):
+            tail = n - n_full * block
+            tail_ramp = np.arange(1, tail + 1, dtype=np.float32) / tail
+            gain[n_full * block:] = starts[-1] + (ends[-1] - starts[-1]) * tail_ramp
+        np.multiply(audio, gain, out=audio)
+
+    def _resample_chunk(self, audio: np.ndarray, bank: _FilterBank, state: _StreamState) -> np.ndarray:
+        # Polyphase resampling as in resample_poly, but with the FIR history and the decimation phase kept across
+        # chunks instead of zero-padding both ends of every chunk. Only the FIR outputs that survive decimation
+        # are computed, as dot products over a sliding window of the resampler buffer
+        up, down = bank.resample_up, bank.resample_down
+        history = len(bank.resample_taps) - 1
+        n_upsampled = len(audio) * up
+
+        state.resample_buffer = _grow(state.resample_buffer, history + n_upsampled, keep=history)
+        upsampled = state.resample_buffer[: history + n_upsampled]
+        if up > 1:
+            upsampled[history:] = 0
+            upsampled[history::up] = audio
+        else:
+            upsampled[history:] = audio
+
+        windows = np.lib.stride_tricks.sliding_window_view(upsampled, history + 1)[state.resample_phase::down]
+        state.resampled = _grow(state.resampled, len(windows))
+        resampled = state.resampled[: len(windows)]
+        # np.dot would copy all the strided windows into one contiguous matrix first; a block at a time keeps
+        # that copy in a small reused buffer, and is faster too
+        block = state.resample_windows
+        for start in range(0, len(windows), len(block)):
+            stop = min(start + len(block), len(windows))
+            np.copyto(block[: stop - start], windows[start:stop])
+            np.dot(block[: stop - start], bank.resample_taps_reversed, out=resampled[start:stop])
+        state.resample_phase = (state.resample_phase - n_upsampled) % down
+        # Keep the tail as the history for the next chunk
+        upsampled[:history] = upsampled[n_upsampled:]
+        return resampled
+
+    @staticmethod
+    def _init_stream_state(bank: _FilterBank, original_fs: int) -> _StreamState:
+        # Zero initial conditions: the stream starts from silence
+        def sos_zi(sos: np.ndarray) -> np.ndarray:
+            return np.zeros((sos.shape[0], 2), dtype=np.float32)
+
+        has_resampler = bank.resample_taps is not None
+        return _StreamState(
+            original_fs=original_fs,
+            aa_zi=sos_zi(bank.aa_sos) if has_resampler else None,
+            resample_phase=0,
+            filters_zi=sos_zi(bank.filters_sos),
+            agc_gain=1.0,
+            samples=np.empty(0, dtype=np.float32),
+            resample_buffer=np.zeros(len(bank.resample_taps) - 1, dtype=np.float32) if has_resampler else None,
+            resample_windows=np.empty(
+                (RESAMPLE_BLOCK_ROWS, len(bank.resample_taps)), dtype=np.float32) if has_resampler else None,
+            resampled=np.empty(0, dtype=np.float32),
+            gain=np.empty(0, dtype=np.float32),
+            pcm=np.empty(0, dtype=np.int16),
+        )
 
     def _read_audio(self, evi_audio: bytes) -> tuple[np.ndarray, int]:
-        byte_str_io = io.BytesIO(evi_audio)
-        with wave.open(byte_str_io, "rb") as wav_file:
-            n_frames = wav_file.getnframes()
-            framerate = wav_file.getframerate()
-            audio_bytes = wav_file.readframes(n_frames)
-
-        audio = np.frombuffer(audio_bytes, dtype=self.audio_numpy_dtype)
-        return audio, framerate
+        if self._partial_header:
+            evi_audio = self._partial_header + evi_audio
+            self._partial_header = b""
+
+        wav_format = self._wav_format
+        if evi_audio[:4] == b"RIFF":
+            self._partial_sample = b""
+            # Fast path: same header as the previous chunks, apart from the sizes
+            if wav_format is None or wav_format.header_bytes == 0 or \
+                    evi_audio[8: wav_format.header_bytes - 4] != wav_format.header_fields:
+                wav_format = _parse_wav_header(evi_audio)
+                if wav_format is None:
+                    # Copied, since evi_audio may be a view of a buffer the caller reuses
+                    self._partial_header = bytes(evi_audio)
+                    return np.empty(0, dtype=self.audio_numpy_dtype), 0
+                self._wav_format = wav_format
+            samples_start = wav_format.header_bytes
+        elif wav_format is not None:
+            # Headerless PCM in the session format
+            if self._partial_sample:
+                evi_audio = self._partial_sample + evi_audio
+            samples_start = 0
+        else:
+            raise wave.Error("EVI audio has no WAV header and its format isn't known yet")
+
+        sample_bytes = len(evi_audio) - samples_start
+        if samples_start:
+            (data_size,) = struct.unpack_from("<I", evi_audio, samples_start - 4)
+            # Streamed WAVs leave the data size at 0 or 0xFFFFFFFF; otherwise it excludes any trailing chunks
+            if 0 < data_size < sample_bytes:
+                sample_bytes = data_size
+        n_samples = sample_bytes // self.audio_numpy_dtype.itemsize
+        if samples_start == 0:
+            self._partial_sample = bytes(evi_audio[n_samples * self.audio_numpy_dtype.itemsize:])
+        audio = np.frombuffer(evi_audio, dtype=self.audio_numpy_dtype, count=n_samples, offset=samples_start)
+        return audio, wav_format.sample_rate
 
     def _ensure_float(self, audio: np.ndarray) -> np.ndarray:
         # We mainly do this to avoid rounding errors with integer math
@@ -72,11 +520,7 @@ class EviAudioProcessor:
 
     def _resample_audio(self, audio: np.ndarray, original_fs: int, target_fs: int) -> np.ndarray:
         # Apply anti-aliasing low pass filter before resampling with polyphase filtering
-        nyquist_freq = target_fs / 2.0
-        cutoff_freq = nyquist_freq * 0.9
-
-        sos = signal.butter(self.config.aa_filter_order, cutoff_freq,
-                            btype="lowpass", fs=original_fs, output="sos")
+        sos = _design_anti_aliasing_filter(self.config, original_fs, target_fs)
         audio = signal.sosfilt(sos, audio)
 
         audio = signal.resample_poly(audio, up=target_fs, down=original_fs)
@@ -90,49 +534,28 @@ class EviAudioProcessor:
         return audio
 
     def _high_pass_filter(self, audio: np.ndarray, fs: int) -> np.ndarray:
-        high_pass_sos = signal.butter(
-            self.config.high_pass_filter_order,
-            self.config.high_pass_filter_cutoff_freq,
-            btype="highpass",
-            fs=fs,
-            output="sos",
-        )
-        return signal.sosfilt(high_pass_sos, audio)
+        return signal.sosfilt(_design_high_pass_filter(self.config, fs), audio)
 
     def _peak_filter(self, audio: np.ndarray, fs: int) -> np.ndarray:
-        min_freq = self.config.peak_filter_min_freq
-        max_freq = self.config.peak_filter_max_freq
-
-        peak_center_freq = (min_freq + max_freq) / 2
-        peak_bandwith = max_freq - min_freq
-        peak_gain_db = self.config.peak_filter_gain_db
-
-        q_peak = peak_center_freq / peak_bandwith
-        peak_gain_linear = 10 ** (peak_gain_db / 20)
-        peak_b, peak_a = signal.iirpeak(peak_center_freq, q_peak, fs=fs)
-        peak_b += peak_gain_linear
-
+        peak_b, peak_a = _design_peak_filter(self.config, fs)
         return signal.lfilter(peak_b, peak_a, audio)
 
     def _notch_filter(self, audio: np.ndarray, fs: int) -> np.ndarray:
-        notch_freq = self.config.notch_filter_freq
-        notch_bandwith = self.config.notch_filter_bandwidth
-        q_notch = notch_freq / notch_bandwith
-        notch_b, notch_a = signal.iirnotch(notch_freq, q_notch, fs=fs)
-
+        notch_b, notch_a = _design_notch_filter(self.config, fs)
         return signal.lfilter(notch_b, notch_a, audio)
 
     def _normalize_audio(self, audio: np.ndarray) -> np.ndarray:
+        # Scales and clips `audio` in place
         max_int16 = np.iinfo(np.int16).max
         min_int16 = np.iinfo(np.int16).min
         MAX_ALLOWED_GAIN = 3.0
 
-        max_abs_value = np.max(np.abs(audio))
+        max_abs_value = max(audio.max(), -audio.min())
         if max_abs_value > 0:
             normalization_factor = max_int16 / max_abs_value
             # So that for very silent audio, we don't amplify noise too much. Spoken audio likely shouldn't have a
             # 3x normalization factor
-            audio = audio * min(normalization_factor, MAX_ALLOWED_GAIN)
+            np.multiply(audio, min(normalization_factor, MAX_ALLOWED_GAIN), out=audio)
 
-        audio = np.clip(audio, min_int16, max_int16)
+        np.clip(audio, min_int16, max_int16, out=audio)
         return audio.astype(np.int16)
@@ -0,0 +1,50 @@
+"""G.711 μ-law codec backed by lookup tables."""
+from typing import Optional, Union
+
+import numpy as np
+
+# 0xff is silence for μ-law audio
+ULAW_SILENCE = 0xFF
+
+
+def _build_decode_table() -> np.ndarray:
+    # μ-law bytes are stored inverted: sign bit, 3 exponent bits, 4 mantissa bits
+    ulaw = ~np.arange(256, dtype=np.uint8)
+    exponent = (ulaw >> 4) & 0x07
+    mantissa = (ulaw & 0x0F).astype(np.int32)
+    magnitude = (((mantissa << 3) + 0x84) << exponent) - 0x84
+    return np.where(ulaw & 0x80, -magnitude, magnitude).astype(np.int16)
+
+
+def _build_encode_table() -> np.ndarray:
+    # Indexed by the int16 sample reinterpreted as uint16. Like audioop, only the top 14 bits are encoded.
+    samples = np.arange(-32768, 32768, dtype=np.int32) >> 2
+    sign = np.where(samples < 0, 0x80, 0x00)
+    # clip, then add the bias so that the segment (exponent) is the position of the leading one bit
+    magnitude = np.minimum(np.abs(samples), 8159) + 33
+    exponent = np.floor(np.log2(magnitude >> 5)).astype(np.int32)
+    mantissa = (magnitude >> (exponent + 1)) & 0x0F
+    code = np.where(exponent < 8, (exponent << 4) | mantissa, 0x7F)
+    ulaw = ~(sign | code) & 0xFF
+    return np.roll(ulaw.astype(np.uint8), -32768)
+
+
+# μ-law byte -> PCM16 sample, matches audioop.ulaw2lin(..., 2)
+ULAW_DECODE_TABLE = _build_decode_table()
+# PCM16 sample (as uint16) -> μ-law byte, matches audioop.lin2ulaw(..., 2)
+ULAW_ENCODE_TABLE = _build_encode_table()
+
+
+def ulaw_decode(ulaw_audio, out: Optional[np.ndarray] = None) -> np.ndarray:
+    """Decodes a bytes-like object of μ-law samples to int16 PCM, into `out` if given."""
+    indices = np.frombuffer(ulaw_audio, dtype=np.uint8)
+    if out is None:
+        return ULAW_DECODE_TABLE[indices]
+    return np.take(ULAW_DECODE_TABLE, indices, out=out[: len(indices)])
+
+
+def ulaw_encode(pcm_audio: np.ndarray, out: Optional[np.ndarray] = None) -> Union[bytes, np.ndarray]:
+    """Encodes int16 PCM samples to μ-law bytes, or into the uint8 array `out` if given, returning the part written."""
+    if out is None:
+        return ULAW_ENCODE_TABLE[pcm_audio.view(np.uint16)].tobytes()
+    return np.take(ULAW_ENCODE_TABLE, pcm_audio.view(np.uint16), out=out[: len(pcm_audio)])
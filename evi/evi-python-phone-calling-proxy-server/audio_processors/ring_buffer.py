@@ -0,0 +1,94 @@
+from typing import Union
+
+import numpy as np
+
+BytesLike = Union[bytes, bytearray, memoryview]
+
+
+class RingBuffer:
+    """
+    Fixed-capacity byte FIFO that never reallocates. Writing more than the free space overwrites the oldest
+    bytes, which are counted in dropped_bytes.
+    """
+    capacity: int
+    dropped_bytes: int
+
+    def __init__(self, capacity: int) -> None:
+        self.capacity = capacity
+        self.dropped_bytes = 0
+        self._buffer = bytearray(capacity)
+        self._view = memoryview(self._buffer)
+        self._array = np.frombuffer(self._buffer, dtype=np.uint8)
+        # reads that wrap around the end of the buffer are stitched together here
+        self._scratch = memoryview(bytearray(capacity))
+        self._read_pos = 0
+        self._size = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    def write(self, data: BytesLike) -> None:
+        data = memoryview(data).cast("B")
+        if len(data) > self.capacity:
+            self._drop(self._size)
+            self.dropped_bytes += len(data) - self.capacity
+            data = data[-self.capacity:]
+
+        for start, end in self._reserve(len(data)):
+            self._view[start:end] = data[: end - start]
+            data = data[end - start:]
+
+    def fill(self, value: int, n_bytes: int, headroom: int = 0) -> None:
+        """
+        Appends n_bytes copies of value without building a temporary bytes object. Unlike write(), never overwrites
+        buffered bytes: the copies are all alike, so those that don't fit in the free space are the ones dropped.
+        Copies are also dropped to leave headroom bytes free, for a write that is to follow.
+        """
+        free = max(self.capacity - self._size - headroom, 0)
+        if n_bytes > free:
+            self.dropped_bytes += n_bytes - free
+            n_bytes = free
+
+        for start, end in self._reserve(n_bytes):
+            self._array[start:end] = value
+
+    def read(self, n_bytes: int) -> memoryview:
+        """
+        Removes and returns the oldest n_bytes. The returned view points into the buffer, so it is only valid until
+        the next write or read.
+        """
+        if n_bytes > self._size:
+            raise ValueError(f"Cannot read {n_bytes} bytes, only {self._size} buffered")
+
+        start = self._read_pos
+        end = start + n_bytes
+        if end <= self.capacity:
+            chunk = self._view[start:end]
+        else:
+            head = self.capacity - start
+            self._scratch[:head] = self._view[start:]
+            self._scratch[head:n_bytes] = self._view[: n_bytes - head]
+            chunk = self._scratch[:n_bytes]
+
+        self._read_pos = end % self.capacity
+        self._size -= n_bytes
+        return chunk
+
+    def _drop(self, n_bytes: int) -> None:
+        self._read_pos = (self._read_pos + n_bytes) % self.capacity
+        self._size -= n_bytes
+        self.dropped_bytes += n_bytes
+
+    def _reserve(self, n_bytes: int) -> list[tuple[int, int]]:
+        # Makes room for n_bytes and returns the one or two (start, end) regions to write them to
+        overflow = self._size + n_bytes - self.capacity
+        if overflow > 0:
+            self._drop(overflow)
+
+        write_pos = (self._read_pos + self._size) % self.capacity
+        self._size += n_bytes
+        first_end = min(write_pos + n_bytes, self.capacity)
+        regions = [(write_pos, first_end)]
+        if first_end - write_pos < n_bytes:
+            regions.append((0, n_bytes - (first_end - write_pos)))
+        return regions
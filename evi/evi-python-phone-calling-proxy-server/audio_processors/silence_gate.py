@@ -0,0 +1,75 @@
+import os
+from typing import ClassVar, Optional
+
+import numpy as np
+
+
+class SilenceGate:
+    """
+    Energy / zero-crossing voice activity detection on the PCM16 chunks sent to EVI, used to thin out line silence,
+    hold music pauses and the padding TwilioAudioProcessor inserts for dropped packets.
+
+    Everything is sent while the caller speaks and for hangover_ms afterwards, so EVI still hears the pause that ends
+    a turn. Past that, only one chunk per keepalive_ms goes through and the rest are dropped.
+    """
+    sent_chunks: int
+    suppressed_chunks: int
+    SAMPLE_RATE: ClassVar[int] = 8000
+    FULL_SCALE: ClassVar[float] = 32768.0
+
+    def __init__(
+        self,
+        energy_threshold_dbfs: float = -45.0,
+        zero_crossing_threshold: float = 0.25,
+        hangover_ms: int = 800,
+        keepalive_ms: int = 1000,
+    ) -> None:
+        self.energy_threshold_dbfs = energy_threshold_dbfs
+        self.zero_crossing_threshold = zero_crossing_threshold
+        self.hangover_ms = hangover_ms
+        self.keepalive_ms = keepalive_ms
+        self.sent_chunks = 0
+        self.suppressed_chunks = 0
+        # milliseconds of audio since the last speech, and since the last chunk that was sent
+        self._silence_ms = float("inf")
+        self._since_sent_ms = 0.0
+
+    def is_speech(self, pcm_chunk: bytes) -> bool:
+        audio = np.frombuffer(pcm_chunk, dtype=np.int16).astype(np.float32)
+        if len(audio) == 0:
+            return False
+
+        rms = np.sqrt(np.mean(audio * audio)) / self.FULL_SCALE
+        energy_dbfs = 20 * np.log10(rms) if rms > 0 else -np.inf
+        if energy_dbfs >= self.energy_threshold_dbfs:
+            return True
+
+        # Unvoiced consonants ("s", "f") are quiet but noisy: accept them a little below the energy threshold
+        zero_crossing_rate = np.count_nonzero(np.signbit(audio[1:]) != np.signbit(audio[:-1])) / len(audio)
+        return energy_dbfs >= self.energy_threshold_dbfs - 10 and zero_crossing_rate >= self.zero_crossing_threshold
+
+    def should_send(self, pcm_chunk: bytes, is_speech: Optional[bool] = None) -> bool:
+        """Pass is_speech if the chunk has already been classified with is_speech()."""
+        chunk_ms = len(pcm_chunk) / 2 / self.SAMPLE_RATE * 1000
+        if is_speech is None:
+            is_speech = self.is_speech(pcm_chunk)
+        if is_speech:
+            self._silence_ms = 0.0
+        else:
+            self._silence_ms += chunk_ms
+
+        self._since_sent_ms += chunk_ms
+        send = self._silence_ms <= self.hangover_ms or self._since_sent_ms >= self.keepalive_ms
+        if send:
+            self._since_sent_ms = 0.0
+            self.sent_chunks += 1
+        else:
+            self.suppressed_chunks += 1
+        return send
+
+
+def silence_gate_from_env() -> Optional[SilenceGate]:
+    """SILENCE_GATE=1 enables the gate, SILENCE_GATE_THRESHOLD_DBFS tunes what counts as silence."""
+    if os.environ.get("SILENCE_GATE", "0") != "1":
+        return None
+    return SilenceGate(energy_threshold_dbfs=float(os.environ.get("SILENCE_GATE_THRESHOLD_DBFS", "-45")))
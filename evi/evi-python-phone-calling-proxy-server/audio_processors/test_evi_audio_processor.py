@@ -0,0 +1,100 @@
+# run tests locally with:
+# uv run pytest audio_processors/test_evi_audio_processor.py -v
+
+import io
+import wave
+
+import numpy as np
+import pytest
+
+from audio_processors import EviAudioProcessor
+
+TWILIO_SAMPLE_RATE = 8000
+
+
+def pcm(n_samples: int, seed: int = 0) -> bytes:
+    return np.random.default_rng(seed).integers(-8000, 8000, n_samples, dtype=np.int16).tobytes()
+
+
+def wav(pcm_bytes: bytes, sample_rate: int) -> bytes:
+    wav_bytes = io.BytesIO()
+    with wave.open(wav_bytes, "wb") as wav_file:
+        wav_file.setnchannels(1)
+        wav_file.setsampwidth(2)
+        wav_file.setframerate(sample_rate)
+        wav_file.writeframes(pcm_bytes)
+    return wav_bytes.getvalue()
+
+
+def streaming_processor(sample_rate: int) -> EviAudioProcessor:
+    return EviAudioProcessor(
+        np.dtype(np.int16), TWILIO_SAMPLE_RATE, streaming=True, pcm_sample_rate=sample_rate)
+
+
+def total_samples(processor: EviAudioProcessor, chunks: list[bytes]) -> int:
+    return sum(len(processor.postprocess_pcm(chunk)) for chunk in chunks)
+
+
+def test_chunk_too_short_for_an_output_sample():
+    """
+    a 2-sample 48 kHz chunk after a 961-sample one produces no output instead of failing
+    """
+    audio = pcm(963)
+    processor = streaming_processor(48000)
+
+    assert len(processor.postprocess_pcm(audio[:1922])) == 161
+    assert len(processor.postprocess_pcm(audio[1922:])) == 0
+    # The short chunk's samples are still in the resampler history for the next one
+    assert len(processor.postprocess_pcm(pcm(6, seed=1))) == 1
+
+
+@pytest.mark.parametrize("sample_rate", [48000, 44100, 24000, 16000, 8000])
+def test_tiny_odd_length_chunks(sample_rate):
+    """
+    tiny and odd-length chunks give as many output samples as the same audio in one chunk
+    """
+    audio = pcm(sample_rate // 10)
+    rng = np.random.default_rng(sample_rate)
+    chunks, start = [], 0
+    while start < len(audio):
+        # 0 to 15 bytes: empty chunks, partial samples and chunks shorter than the decimation factor
+        size = int(rng.integers(0, 16))
+        chunks.append(audio[start:start + size])
+        start += size
+
+    expected = total_samples(streaming_processor(sample_rate), [audio])
+    assert total_samples(streaming_processor(sample_rate), chunks) == expected
+    assert expected == -(-(len(audio) // 2) * TWILIO_SAMPLE_RATE // sample_rate)
+
+
+def test_tiny_chunks_after_wav_header():
+    """
+    a WAV chunk followed by headerless chunks of a single sample keeps producing audio
+    """
+    processor = EviAudioProcessor(np.dtype(np.int16), TWILIO_SAMPLE_RATE, streaming=True)
+    audio = pcm(48)
+
+    outputs = [len(processor.postprocess_pcm(wav(audio[:2], 48000)))]
+    outputs += [len(processor.postprocess_pcm(audio[i:i + 2])) for i in range(2, len(audio), 2)]
+
+    assert sum(outputs) == 8
+    assert outputs.count(0) == 40
+
+
+def test_batch_with_chunks_too_short_to_resample():
+    """
+    a batch in which some calls' chunks resample to nothing gives the same audio as processing each call on its own
+    """
+    audio = pcm(4000)
+    batched = [streaming_processor(48000) for _ in range(3)]
+    single = [streaming_processor(48000) for _ in range(3)]
+    batches = [
+        [audio[:1922]] * 3,
+        [audio[1922:1926], audio[:3000], audio[:8]],
+        [audio[:4], audio[:6], audio[:2]],
+        [audio[:4000], audio[:5], audio[:4000]],
+    ]
+
+    for chunks in batches:
+        expected = [processor.postprocess_audio(chunk) for processor, chunk in zip(single, chunks)]
+        assert EviAudioProcessor.postprocess_audio_batch(batched, chunks) == expected
@@ -0,0 +1,124 @@
+# run tests locally with:
+# uv run pytest audio_processors/test_ring_buffer.py -v
+
+import asyncio
+import base64
+
+import pytest
+
+from audio_processors import TwilioAudioProcessor
+from audio_processors.mulaw import ULAW_SILENCE, ulaw_decode
+from audio_processors.ring_buffer import RingBuffer
+
+
+def test_reads_wrap_around():
+    """
+    reads and writes that wrap around the end of the buffer come back in order
+    """
+    ring = RingBuffer(8)
+    ring.write(b"abcdef")
+    assert bytes(ring.read(4)) == b"abcd"
+    ring.write(b"ghijk")
+
+    assert len(ring) == 7
+    assert bytes(ring.read(7)) == b"efghijk"
+    assert ring.dropped_bytes == 0
+
+
+def test_write_overwrites_oldest():
+    """
+    writing more than the free space drops the oldest bytes and counts them
+    """
+    ring = RingBuffer(8)
+    ring.write(b"abcdef")
+    ring.write(b"ghij")
+
+    assert ring.dropped_bytes == 2
+    assert bytes(ring.read(8)) == b"cdefghij"
+
+
+def test_write_larger_than_capacity():
+    """
+    a write larger than the buffer keeps only its newest bytes
+    """
+    ring = RingBuffer(4)
+    ring.write(b"ab")
+    ring.write(b"cdefgh")
+
+    assert ring.dropped_bytes == 4
+    assert bytes(ring.read(4)) == b"efgh"
+
+
+def test_fill_keeps_buffered_bytes():
+    """
+    a fill larger than the free space keeps the buffered bytes and drops the copies that don't fit
+    """
+    ring = RingBuffer(8)
+    ring.write(b"abcde")
+    ring.read(2)
+    ring.fill(0xFF, 10)
+
+    assert ring.dropped_bytes == 5
+    assert bytes(ring.read(8)) == b"cde" + b"\xff" * 5
+
+
+def test_fill_leaves_headroom():
+    """
+    a fill drops the copies that would take the headroom kept for the next write
+    """
+    ring = RingBuffer(8)
+    ring.write(b"ab")
+    ring.fill(0xFF, 10, headroom=2)
+    ring.write(b"yz")
+
+    assert ring.dropped_bytes == 6
+    assert bytes(ring.read(8)) == b"ab" + b"\xff" * 4 + b"yz"
+
+
+def test_read_more_than_buffered():
+    """
+    reading more than is buffered raises instead of returning stale bytes
+    """
+    ring = RingBuffer(8)
+    ring.write(b"abc")
+
+    with pytest.raises(ValueError):
+        ring.read(4)
+
+
+def media(payload: bytes, timestamp: int) -> dict:
+    return {"track": "inbound", "timestamp": str(timestamp), "payload": base64.b64encode(payload).decode("ascii")}
+
+
+async def test_gap_filled_with_silence():
+    """
+    a gap in Twilio timestamps is filled with μ-law silence before the next frame
+    """
+    processor = TwilioAudioProcessor()
+    queue = asyncio.Queue()
+    await processor.queue_twilio_audio(media(b"\x00" * 160, 0), queue)
+    # 40 ms of frames missing
+    await processor.queue_twilio_audio(media(b"\x01" * 160, 60), queue)
+
+    assert len(processor.inbuffer) == 160 + 320 + 160
+    buffered = bytes(processor.inbuffer.read(len(processor.inbuffer)))
+    assert buffered == b"\x00" * 160 + bytes([ULAW_SILENCE]) * 320 + b"\x01" * 160
+
+
+async def test_long_gap_keeps_pending_audio():
+    """
+    silence for a gap longer than the buffer pushes out neither the buffered caller audio nor the frame after the gap
+    """
+    processor = TwilioAudioProcessor()
+    queue = asyncio.Queue()
+    await processor.queue_twilio_audio(media(b"\x00" * 160, 0), queue)
+    await processor.queue_twilio_audio(media(b"\x01" * 160, 60_000), queue)
+
+    capacity = TwilioAudioProcessor.INBUFFER_CAPACITY
+    assert processor.inbuffer.dropped_bytes == 8 * (60_000 - 20) - (capacity - 320)
+    # The full buffer was flushed to the queue, and the caller audio from both sides of the gap is in it
+    assert len(processor.inbuffer) == 0
+    queued = b"".join(queue.get_nowait() for _ in range(queue.qsize()))
+    assert queued[:320] == ulaw_decode(b"\x00" * 160).tobytes()
+    assert queued[-320:] == ulaw_decode(b"\x01" * 160).tobytes()
+    assert len(queued) == 2 * capacity
@@ -1,39 +1,58 @@
-import audioop
 import base64
 from asyncio import Queue
-from typing import ClassVar, Dict, Any
+from typing import ClassVar, Dict, Any, Optional
 import logging
 
-from pydub import AudioSegment
+import numpy as np
+
+from .adaptive_batcher import AdaptiveBatcher
+from .mulaw import ULAW_SILENCE, ulaw_decode
+from .ring_buffer import RingBuffer
 
 logger = logging.getLogger(__name__)
 
 
 class TwilioAudioProcessor:
-    inbuffer: bytearray
+    inbuffer: RingBuffer
     inbound_chunks_started: bool
     latest_inbound_timestamp: int
+    batcher: Optional[AdaptiveBatcher]
     # twilio sends audio data as 160 byte messages containing 20ms of audio each
-    # we will buffer 20 twilio messages corresponding to 0.4 seconds of audio to improve throughput performance
+    # we will buffer up to 20 twilio messages corresponding to 0.4 seconds of audio to improve throughput performance;
+    # with a batcher, the chunk size adapts between its min and max window instead
     BUFFER_SIZE: ClassVar[int] = 20 * 160
+    # 6.4 seconds of μ-law audio; a gap of dropped packets longer than the free space is filled with only as much silence as
+    # fits, so the caller audio still waiting to be flushed is kept
+    INBUFFER_CAPACITY: ClassVar[int] = 16 * BUFFER_SIZE
     TWILIO_FRAME_RATE: ClassVar[int] = 8000
     # (2 bytes = 16 bit) linear PCM 16-bit signed little-endian
     SAMPLE_WIDTH: ClassVar[int] = 2
     CHANNELS: ClassVar[int] = 1
 
-    def __init__(self) -> None:
-        self.inbuffer = bytearray(b"")
+    def __init__(self, batcher: Optional[AdaptiveBatcher] = None) -> None:
+        self.batcher = batcher
+        self.inbuffer = RingBuffer(self.INBUFFER_CAPACITY)
+        # decoded PCM16 for one flushed chunk, reused for every flush
+        self._pcm_chunk = np.empty(self.BUFFER_SIZE, dtype=np.int16)
         self.inbound_chunks_started = False
         self.latest_inbound_timestamp = 0
 
-    def fill_silence(self, current_timestamp: int) -> None:
-        # fills in silence if there have been dropped packets
+    @property
+    def chunk_size(self) -> int:
+        """Bytes of μ-law audio per chunk queued for EVI."""
+        if self.batcher is None:
+            return self.BUFFER_SIZE
+        return min(self.batcher.window_bytes, self.BUFFER_SIZE)
+
+    def fill_silence(self, current_timestamp: int, incoming_bytes: int = 0) -> None:
+        # fills in silence if there have been dropped packets, leaving room for the incoming_bytes of the frame that
+        # ends the gap so that writing it doesn't push out buffered audio either
         if self.inbound_chunks_started:
             if self.latest_inbound_timestamp + 20 < current_timestamp:
                 bytes_to_fill = 8 * (current_timestamp -
                                      (self.latest_inbound_timestamp + 20))
                 # 0xff is silence for ulaw audio and there are 8 bytes per ms of data for our format (8 bit,8000Hz)
-                self.inbuffer.extend(b"\xff" * bytes_to_fill)
+                self.inbuffer.fill(ULAW_SILENCE, bytes_to_fill, headroom=incoming_bytes)
         else:
             self.inbound_chunks_started = True
             self.latest_inbound_timestamp = current_timestamp
@@ -41,24 +60,19 @@ class TwilioAudioProcessor:
 
     def buffer_inbound_audio(self, twilio_media_payload: Dict[str, Any]) -> None:
         current_timestamp = int(twilio_media_payload["timestamp"])
-        self.fill_silence(current_timestamp)
+        ulaw_audio = base64.b64decode(twilio_media_payload["payload"])
+        self.fill_silence(current_timestamp, len(ulaw_audio))
 
         # extend the inbound audio buffer with data
-        self.inbuffer.extend(base64.b64decode(twilio_media_payload["payload"]))
+        self.inbuffer.write(ulaw_audio)
 
     async def queue_twilio_audio(self, twilio_media_payload: Dict[str, Any], twilio_to_evi_queue: Queue) -> None:
         # Reference: https://github.com/deepgram-devs/deepgram-twilio-streaming-python/blob/master/twilio.py
         if twilio_media_payload.get("track") == "inbound":
             self.buffer_inbound_audio(twilio_media_payload)
 
-        while len(self.inbuffer) >= self.BUFFER_SIZE:
-            pcm_chunk = audioop.ulaw2lin(
-                self.inbuffer[: self.BUFFER_SIZE], self.SAMPLE_WIDTH)
-            asinbound = AudioSegment(
-                pcm_chunk, sample_width=self.SAMPLE_WIDTH, frame_rate=self.TWILIO_FRAME_RATE, channels=self.CHANNELS
-            )
-            if asinbound.raw_data is not None:
-                twilio_to_evi_queue.put_nowait(asinbound.raw_data)
-
-            # clearing buffer
-            self.inbuffer = self.inbuffer[self.BUFFER_SIZE:]
+        while len(self.inbuffer) >= self.chunk_size:
+            ulaw_chunk = self.inbuffer.read(self.chunk_size)
+            pcm_chunk = ulaw_decode(ulaw_chunk, out=self._pcm_chunk)
+            # tobytes() is the only copy: the queued chunk must outlive the reused buffers
+            await twilio_to_evi_queue.put(pcm_chunk.tobytes())
@@ -0,0 +1 @@
+"""Benchmarks and load tests for the phone calling proxy. Run them from the project root with `python -m`."""
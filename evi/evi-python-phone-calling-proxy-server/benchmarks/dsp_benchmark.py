@@ -0,0 +1,74 @@
+"""
+Microbenchmark of EviAudioProcessor.postprocess_audio on EVI-sized chunks: CPU time per chunk and the peak memory
+allocated while processing a chunk (tracemalloc), for the streaming processor used by the proxy, the same with the
+chunks of BATCH_CALLS calls processed as one batch (DSP_BATCH_WINDOW_MS), and the original chunk-at-a-time
+processor. NumPy buffers aren't tracked by the garbage collector, so the allocations are what puts
+pressure on the allocator and the CPU caches.
+
+Usage: uv run python -m benchmarks.dsp_benchmark
+"""
+import io
+import timeit
+import tracemalloc
+import wave
+
+import numpy as np
+
+from audio_processors import EviAudioProcessor
+
+# EVI sends 48 kHz 16-bit mono WAV; 20 ms, 100 ms, 500 ms and 1 s chunks
+CHUNK_SECONDS = [0.02, 0.1, 0.5, 1.0]
+EVI_SAMPLE_RATE = 48000
+BATCH_CALLS = 100
+
+
+def wav_chunk(pcm: np.ndarray) -> bytes:
+    wav_bytes = io.BytesIO()
+    with wave.open(wav_bytes, "wb") as wav_file:
+        wav_file.setnchannels(1)
+        wav_file.setsampwidth(2)
+        wav_file.setframerate(EVI_SAMPLE_RATE)
+        wav_file.writeframes(pcm.tobytes())
+    return wav_bytes.getvalue()
+
+
+def report(name: str, process, chunk_seconds: float, n_chunks: int = 1) -> None:
+    # process() handles n_chunks chunks
+    process()
+
+    runs, total = timeit.Timer(process).autorange()
+    per_chunk = total / runs / n_chunks
+
+    tracemalloc.start()
+    for _ in range(runs):
+        process()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    peak /= n_chunks
+
+    print(f"  {name:<12} {per_chunk * 1e6:9.1f} µs/chunk  {chunk_seconds / per_chunk:8.0f}x real time  "
+          f"{peak / 1024:8.1f} KiB peak")
+
+
+def main() -> None:
+    rng = np.random.default_rng(0)
+    for chunk_seconds in CHUNK_SECONDS:
+        n_samples = int(chunk_seconds * EVI_SAMPLE_RATE)
+        t = np.arange(n_samples) / EVI_SAMPLE_RATE
+        pcm = (8000 * np.sin(2 * np.pi * 220 * t) + 500 * rng.standard_normal(n_samples)).astype(np.int16)
+        chunk = wav_chunk(pcm)
+
+        print(f"{chunk_seconds * 1000:.0f} ms chunk")
+        streaming = EviAudioProcessor(np.dtype(np.int16), 8000, streaming=True)
+        report("streaming", lambda: streaming.postprocess_audio(chunk), chunk_seconds)
+
+        calls = [EviAudioProcessor(np.dtype(np.int16), 8000, streaming=True) for _ in range(BATCH_CALLS)]
+        chunks = [chunk] * BATCH_CALLS
+        report("batched", lambda: EviAudioProcessor.postprocess_audio_batch(calls, chunks), chunk_seconds, BATCH_CALLS)
+
+        per_chunk = EviAudioProcessor(np.dtype(np.int16), 8000)
+        report("per-chunk", lambda: per_chunk.postprocess_audio(chunk), chunk_seconds)
+
+
+if __name__ == "__main__":
+    main()
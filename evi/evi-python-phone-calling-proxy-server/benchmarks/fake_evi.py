@@ -0,0 +1,58 @@
+"""A stand-in for the EVI chat websocket, so the proxy can be exercised without calling Hume."""
+import asyncio
+import base64
+import contextlib
+import io
+import wave
+from types import SimpleNamespace
+from typing import Any, AsyncIterator
+
+import numpy as np
+from hume.empathic_voice import AudioInput
+from starlette.applications import Starlette
+
+import asgi_app
+
+
+class FakeEviSocket:
+    """Echoes every audio_input back as an audio_output WAV chunk at EVI's output sample rate."""
+
+    def __init__(self, output_sample_rate: int = 48000) -> None:
+        self.output_sample_rate = output_sample_rate
+        self._messages: asyncio.Queue = asyncio.Queue()
+        self._messages.put_nowait(SimpleNamespace(type="chat_metadata", chat_id="fake-chat"))
+
+    async def send_publish(self, message: Any) -> None:
+        if isinstance(message, AudioInput):
+            pcm = np.frombuffer(base64.b64decode(message.data), dtype=np.int16)
+            # Sample-and-hold upsampling is good enough for load, the proxy filters it back down anyway
+            upsampled = np.repeat(pcm, self.output_sample_rate // 8000)
+            self._messages.put_nowait(SimpleNamespace(
+                type="audio_output",
+                data=base64.b64encode(self._to_wav(upsampled)).decode("utf-8")
+            ))
+
+    def _to_wav(self, audio: np.ndarray) -> bytes:
+        wav_buffer = io.BytesIO()
+        with wave.open(wav_buffer, "wb") as wav_file:
+            wav_file.setnchannels(1)
+            wav_file.setsampwidth(2)
+            wav_file.setframerate(self.output_sample_rate)
+            wav_file.writeframes(audio.tobytes())
+        return wav_buffer.getvalue()
+
+    def __aiter__(self) -> "FakeEviSocket":
+        return self
+
+    async def __anext__(self) -> Any:
+        return await self._messages.get()
+
+
+@contextlib.asynccontextmanager
+async def connect_fake_evi(session_settings: dict[str, Any]) -> AsyncIterator[FakeEviSocket]:
+    yield FakeEviSocket()
+
+
+def create_app() -> Starlette:
+    """ASGI server wired to the fake EVI, for `uvicorn benchmarks.fake_evi:create_app --factory`."""
+    return asgi_app.create_app(connect_evi=connect_fake_evi)
@@ -0,0 +1,138 @@
+"""
+Load test for the ASGI server (asgi_app.py): how many concurrent 8 kHz calls can one core hold?
+
+Starts the server pinned to a single CPU core, with a fake EVI that echoes the caller's audio back, then ramps up
+simulated Twilio calls that each stream 20 ms μ-law frames in real time. A step holds when every call gets at
+least 90% of its echoed audio back and the server core is not saturated.
+
+Usage: uv run python -m benchmarks.load_test --calls 25,50,100,200 --duration 15
+"""
+import argparse
+import asyncio
+import base64
+import json
+import os
+import subprocess
+import sys
+import time
+from typing import Optional
+
+import websockets
+
+FRAME_MS = 20
+FRAME_BYTES = 160
+# Arbitrary non-silent μ-law frame
+FRAME_PAYLOAD = base64.b64encode(bytes((i * 37) % 256 for i in range(FRAME_BYTES))).decode("utf-8")
+
+
+def cpu_seconds(pid: int) -> Optional[float]:
+    # utime + stime of the server process, Linux only
+    try:
+        with open(f"/proc/{pid}/stat") as stat_file:
+            fields = stat_file.read().rsplit(")", 1)[1].split()
+    except OSError:
+        return None
+    return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+
+
+async def simulate_call(url: str, call_index: int, duration: float) -> tuple[int, int]:
+    """Streams `duration` seconds of audio and returns (μ-law bytes sent, μ-law bytes received back)."""
+    received = 0
+
+    async with websockets.connect(url) as ws:
+        async def receive_echo():
+            nonlocal received
+            async for message in ws:
+                data = json.loads(message)
+                if data.get("event") == "media":
+                    received += len(base64.b64decode(data["media"]["payload"]))
+                elif data.get("event") == "mark":
+                    # Like Twilio, echo marks back once the audio before them has "played"
+                    await ws.send(message)
+
+        receiver = asyncio.create_task(receive_echo())
+        await ws.send(json.dumps({"event": "connected"}))
+        await ws.send(json.dumps({"event": "start", "streamSid": f"MZload{call_index}"}))
+
+        n_frames = int(duration * 1000 / FRAME_MS)
+        start = time.monotonic()
+        for i in range(n_frames):
+            delay = start + i * FRAME_MS / 1000 - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            await ws.send(json.dumps({
+                "event": "media",
+                "media": {"payload": FRAME_PAYLOAD, "timestamp": str(i * FRAME_MS)}
+            }))
+
+        # Give the server time to flush the tail of the echo
+        await asyncio.sleep(1.0)
+        await ws.send(json.dumps({"event": "stop"}))
+        receiver.cancel()
+
+    return n_frames * FRAME_BYTES, received
+
+
+async def run_step(url: str, calls: int, duration: float, server_pid: int) -> bool:
+    cpu_before = cpu_seconds(server_pid)
+    wall_before = time.monotonic()
+    results = await asyncio.gather(
+        *(simulate_call(url, i, duration) for i in range(calls)), return_exceptions=True)
+    wall = time.monotonic() - wall_before
+    cpu_after = cpu_seconds(server_pid)
+
+    failed = [r for r in results if isinstance(r, BaseException)]
+    ratios = [received / sent for sent, received in (r for r in results if not isinstance(r, BaseException))]
+    worst_ratio = min(ratios) if ratios else 0.0
+    cpu_load = (cpu_after - cpu_before) / wall if cpu_before is not None and cpu_after is not None else None
+
+    holds = not failed and worst_ratio >= 0.9 and (cpu_load is None or cpu_load < 0.95)
+    cpu_text = f"{cpu_load:.0%}" if cpu_load is not None else "n/a"
+    print(f"{calls:5d} calls | failed {len(failed):4d} | worst echo {worst_ratio:6.1%} | "
+          f"server core {cpu_text:>5} | {'OK' if holds else 'SATURATED'}")
+    return holds
+
+
+async def main(calls_steps: list[int], duration: float, port: int, server_pid: int) -> None:
+    url = f"ws://127.0.0.1:{port}/media-stream"
+    best = 0
+    for calls in calls_steps:
+        if not await run_step(url, calls, duration, server_pid):
+            break
+        best = calls
+    print(f"One core held {best} concurrent calls")
+
+
+def start_server(port: int, core: int) -> subprocess.Popen:
+    def pin_to_core():
+        if hasattr(os, "sched_setaffinity"):
+            os.sched_setaffinity(0, {core})
+
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "benchmarks.fake_evi:create_app", "--factory",
+         "--port", str(port), "--log-level", "warning"],
+        preexec_fn=pin_to_core,
+        stdout=subprocess.DEVNULL,
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--calls", default="25,50,100,200,400",
+                        help="comma separated numbers of concurrent calls to ramp through")
+    parser.add_argument("--duration", type=float, default=15.0, help="seconds of audio per call")
+    parser.add_argument("--port", type=int, default=5099)
+    parser.add_argument("--core", type=int, default=0, help="CPU core to pin the server to")
+    args = parser.parse_args()
+
+    # Keep the simulated callers off the server's core
+    if hasattr(os, "sched_setaffinity") and len(os.sched_getaffinity(0)) > 1:
+        os.sched_setaffinity(0, os.sched_getaffinity(0) - {args.core})
+
+    server = start_server(args.port, args.core)
+    try:
+        time.sleep(2.0)
+        asyncio.run(main([int(n) for n in args.calls.split(",")], args.duration, args.port, server.pid))
+    finally:
+        server.terminate()
+        server.wait()
@@ -0,0 +1,71 @@
+"""
+Microbenchmark of the Twilio media stream codec (media_codec.py) on 20 ms media messages: frames per second one core
+can decode with each installed JSON library, and encode with the string templates, against the json.loads/dict
+lookups and dict/json.dumps the proxy used before. The decoders are only measured where their library is installed
+(`uv sync --extra fast`).
+
+Usage: uv run python -m benchmarks.media_codec_benchmark
+"""
+import base64
+import json
+import timeit
+
+import numpy as np
+
+from media_codec import DECODERS, TwilioFrameEncoder
+
+STREAM_SID = "MZ18ad3ab5a668481ce02b83e7395059f0"
+
+
+def report(name: str, func) -> None:
+    runs, total = timeit.Timer(func).autorange()
+    per_frame = total / runs
+    print(f"  {name:<24} {per_frame * 1e6:9.2f} µs/frame  {1 / per_frame / 1e3:10.0f}k frames/s")
+
+
+def main() -> None:
+    frame = np.random.default_rng(0).integers(0, 256, 160, dtype=np.uint8).tobytes()
+    payload = base64.b64encode(frame).decode("utf-8")
+    # A media message as Twilio sends it, including the fields the proxy ignores
+    message = json.dumps({
+        "event": "media",
+        "sequenceNumber": "42",
+        "media": {"track": "inbound", "chunk": "41", "timestamp": "820", "payload": payload},
+        "streamSid": STREAM_SID,
+    })
+
+    def decode_dict():
+        data = json.loads(message)
+        media_data = data.get("media", {})
+        return data.get("event"), media_data.get("payload"), media_data.get("timestamp")
+
+    print("decode")
+    report("json.loads + dict", decode_dict)
+    for name, decoder_class in DECODERS.items():
+        try:
+            decoder = decoder_class()
+        except ImportError:
+            print(f"  {name:<24} not installed")
+            continue
+        event = decoder.decode(message)
+        assert (event.event, event.stream_sid, event.payload, event.timestamp) == ("media", STREAM_SID, payload, "820")
+        report(name, lambda: decoder.decode(message))
+
+    def encode_dict():
+        return json.dumps({
+            "event": "media",
+            "streamSid": STREAM_SID,
+            "media": {"payload": base64.b64encode(frame).decode("utf-8")}
+        })
+
+    encoder = TwilioFrameEncoder(STREAM_SID)
+    view = memoryview(frame)
+    assert json.loads(encoder.media(view)) == json.loads(encode_dict())
+
+    print("encode")
+    report("dict + json.dumps", encode_dict)
+    report("template", lambda: encoder.media(view))
+
+
+if __name__ == "__main__":
+    main()
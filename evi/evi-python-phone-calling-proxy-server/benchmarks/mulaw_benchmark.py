@@ -0,0 +1,53 @@
+"""
+Microbenchmark of the lookup-table μ-law codec (audio_processors/mulaw.py) against audioop on Twilio-sized frames.
+audioop is only measured where it is still available (Python < 3.13).
+
+Usage: uv run python -m benchmarks.mulaw_benchmark
+"""
+import timeit
+import warnings
+
+import numpy as np
+
+from audio_processors.mulaw import ulaw_decode, ulaw_encode
+
+try:
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", DeprecationWarning)
+        import audioop
+except ImportError:
+    audioop = None
+
+# 20 ms Twilio frame, 400 ms inbound chunk and 1 s of EVI output at 8 kHz
+FRAME_SIZES = [160, 3200, 8000]
+
+
+def report(name: str, n_samples: int, func) -> None:
+    runs, total = timeit.Timer(func).autorange()
+    per_call = total / runs
+    frames_per_second = n_samples / 160 / per_call
+    print(f"  {name:<24} {per_call * 1e6:9.2f} µs/call  {frames_per_second / 1e3:10.0f}k 20ms-frames/s")
+
+
+def main() -> None:
+    rng = np.random.default_rng(0)
+    for n_samples in FRAME_SIZES:
+        pcm = rng.integers(-32768, 32768, n_samples, dtype=np.int16)
+        pcm_bytes = pcm.tobytes()
+        ulaw = ulaw_encode(pcm)
+        decode_out = np.empty(n_samples, dtype=np.int16)
+
+        if audioop is not None:
+            assert audioop.lin2ulaw(pcm_bytes, 2) == ulaw
+            assert audioop.ulaw2lin(ulaw, 2) == ulaw_decode(ulaw).tobytes()
+
+        print(f"{n_samples} samples")
+        report("lut encode", n_samples, lambda: ulaw_encode(pcm))
+        report("lut decode", n_samples, lambda: ulaw_decode(ulaw, out=decode_out))
+        if audioop is not None:
+            report("audioop.lin2ulaw", n_samples, lambda: audioop.lin2ulaw(pcm_bytes, 2))
+            report("audioop.ulaw2lin", n_samples, lambda: audioop.ulaw2lin(ulaw, 2))
+
+
+if __name__ == "__main__":
+    main()
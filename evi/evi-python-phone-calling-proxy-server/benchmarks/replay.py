@@ -0,0 +1,197 @@
+"""
+Offline replay benchmark for handle_media_stream, without Twilio or Hume.
+
+Each simulated call replays a recorded μ-law call through an in-memory stand-in for the Twilio media stream
+websocket, in real time or faster, while the fake EVI echoes the audio back as audio_output WAV chunks. All calls
+run on one event loop in this process. Reports how many real-time calls one core can sustain, the latency of each
+echoed frame (from the caller frame reaching the proxy to the matching frame being sent back to Twilio) and the
+memory used per call.
+
+Frames going back to Twilio are paced in real time, so frame latency is only meaningful with --speed 1; use a
+higher speed to measure CPU cost alone.
+
+Usage:
+  uv run python -m benchmarks.replay --calls 50 --duration 20
+  uv run python -m benchmarks.replay --input call.ulaw --calls 100 --speed 4 --json results.json
+  uv run python -m benchmarks.replay --calls 50 --max-p99-ms 600   # exits with 1 if the p99 is higher
+
+--input takes raw 8 kHz μ-law (e.g. the concatenated payloads of a Twilio media stream) or an 8 kHz 16-bit mono WAV.
+Without it, a synthetic call alternating tone bursts and silence is used. The DSP backend is configured from the
+environment like the servers' (DSP_WORKERS, DSP_BATCH_WINDOW_MS); with DSP_WORKERS the CPU time of the workers is
+not counted.
+"""
+import argparse
+import asyncio
+import base64
+import contextlib
+import json
+import os
+import resource
+import sys
+import time
+import wave
+from typing import Optional
+
+import numpy as np
+
+from audio_processors.mulaw import ulaw_encode
+from benchmarks.fake_evi import connect_fake_evi
+from dsp_pool import DspBackend, dsp_backend_from_env
+from media_stream import handle_media_stream
+
+FRAME_BYTES = 160
+FRAME_SECONDS = 0.02
+MEDIA_MESSAGE_PREFIX = '{"event":"media"'
+MARK_MESSAGE_PREFIX = '{"event":"mark"'
+
+
+def load_call(path: Optional[str], duration: float) -> bytes:
+    """Returns `duration` seconds of 8 kHz μ-law audio, looping the recording if it is shorter."""
+    if path is None:
+        t = np.arange(int(duration * 8000)) / 8000
+        # 1.5 s of a warbling tone, then 1 s of silence
+        talking = (t % 2.5) < 1.5
+        audio = np.where(talking, 6000 * np.sin(2 * np.pi * (300 + 50 * np.sin(2 * np.pi * 3 * t)) * t), 0)
+        return ulaw_encode(audio.astype(np.int16))
+
+    if path.endswith(".wav"):
+        with wave.open(path, "rb") as wav_file:
+            if (wav_file.getframerate(), wav_file.getsampwidth(), wav_file.getnchannels()) != (8000, 2, 1):
+                raise ValueError("WAV input must be 8 kHz, 16-bit, mono")
+            ulaw = ulaw_encode(np.frombuffer(wav_file.readframes(wav_file.getnframes()), dtype=np.int16))
+    else:
+        with open(path, "rb") as ulaw_file:
+            ulaw = ulaw_file.read()
+
+    n_bytes = int(duration * 8000)
+    return (ulaw * (n_bytes // len(ulaw) + 1))[:n_bytes]
+
+
+class ReplayTwilioSocket:
+    """In-memory MediaStreamSocket that plays a recorded call into handle_media_stream like Twilio would."""
+
+    def __init__(self, ulaw_audio: bytes, speed: float, call_index: int) -> None:
+        self.ulaw_audio = ulaw_audio
+        self.speed = speed
+        self.stream_sid = f"MZreplay{call_index}"
+        # Built up front, so that encoding them isn't counted in the CPU time of the proxy
+        self.media_messages = [
+            json.dumps({
+                "event": "media",
+                "streamSid": self.stream_sid,
+                "media": {
+                    "payload": base64.b64encode(ulaw_audio[i: i + FRAME_BYTES]).decode("utf-8"),
+                    "timestamp": str(i // FRAME_BYTES * 20),
+                },
+            })
+            for i in range(0, len(ulaw_audio) - FRAME_BYTES + 1, FRAME_BYTES)
+        ]
+        self.frames_received_at: list[float] = []
+        self.frames_sent_at: list[float] = []
+        self._incoming: asyncio.Queue = asyncio.Queue()
+
+    async def receive(self) -> Optional[str]:
+        message = await self._incoming.get()
+        if message is not None and '"media"' in message:
+            self.frames_received_at.append(time.monotonic())
+        return message
+
+    async def send(self, message: str) -> None:
+        # Told apart by the prefix TwilioFrameEncoder gives them rather than parsed, which would add the benchmark's
+        # own JSON decoding to the CPU time it measures
+        if message.startswith(MEDIA_MESSAGE_PREFIX):
+            self.frames_sent_at.append(time.monotonic())
+        elif message.startswith(MARK_MESSAGE_PREFIX):
+            # Twilio echoes marks once it has played up to them; here audio is "played" as soon as it arrives
+            self._incoming.put_nowait(message)
+
+    async def replay(self) -> None:
+        self._incoming.put_nowait(json.dumps({"event": "connected"}))
+        self._incoming.put_nowait(json.dumps({"event": "start", "streamSid": self.stream_sid}))
+
+        n_frames = len(self.media_messages)
+        start = time.monotonic()
+        for i, message in enumerate(self.media_messages):
+            delay = start + i * FRAME_SECONDS / self.speed - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            self._incoming.put_nowait(message)
+
+        # Let the echo play out; the last partial batch never comes back
+        deadline = time.monotonic() + 2.0 + n_frames * FRAME_SECONDS
+        while len(self.frames_sent_at) < n_frames - 20 and time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+        self._incoming.put_nowait(json.dumps({"event": "stop", "streamSid": self.stream_sid}))
+
+    def frame_latencies(self) -> list[float]:
+        # The echo preserves length, so the n-th frame sent back carries the n-th frame received
+        return [sent - received for received, sent in zip(self.frames_received_at, self.frames_sent_at)]
+
+
+async def run_call(twilio: ReplayTwilioSocket, dsp: Optional[DspBackend] = None) -> ReplayTwilioSocket:
+    await asyncio.gather(handle_media_stream(twilio, connect_fake_evi, dsp), twilio.replay())
+    return twilio
+
+
+def max_rss_bytes() -> int:
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return max_rss if sys.platform == "darwin" else max_rss * 1024
+
+
+async def main(args: argparse.Namespace) -> int:
+    ulaw_audio = load_call(args.input, args.duration)
+    audio_seconds = len(ulaw_audio) / 8000
+
+    dsp = dsp_backend_from_env()
+    dsp.start()
+    twilio_sockets = [ReplayTwilioSocket(ulaw_audio, args.speed, i) for i in range(args.calls)]
+    rss_before = max_rss_bytes()
+    cpu_before = time.process_time()
+    wall_before = time.monotonic()
+    try:
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            calls = await asyncio.gather(*(run_call(twilio, dsp) for twilio in twilio_sockets))
+        wall = time.monotonic() - wall_before
+        cpu = time.process_time() - cpu_before
+    finally:
+        dsp.shutdown()
+    rss_per_call = (max_rss_bytes() - rss_before) / args.calls
+
+    latencies = np.array([latency for call in calls for latency in call.frame_latencies()])
+    results = {
+        "calls": args.calls,
+        "audio_seconds_per_call": audio_seconds,
+        "speed": args.speed,
+        "wall_seconds": wall,
+        "cpu_seconds": cpu,
+        # Real-time calls one core could carry at this CPU cost
+        "calls_per_core": args.calls * audio_seconds / cpu if cpu > 0 else float("inf"),
+        "frame_latency_p50_ms": float(np.percentile(latencies, 50) * 1000) if len(latencies) else None,
+        "frame_latency_p99_ms": float(np.percentile(latencies, 99) * 1000) if len(latencies) else None,
+        "frames_echoed": int(len(latencies)),
+        "memory_per_call_kib": rss_per_call / 1024,
+    }
+
+    for key, value in results.items():
+        print(f"{key:>24}: {value:.2f}" if isinstance(value, float) else f"{key:>24}: {value}")
+    if args.json:
+        with open(args.json, "w") as json_file:
+            json.dump(results, json_file, indent=2)
+
+    p99 = results["frame_latency_p99_ms"]
+    if args.max_p99_ms is not None and (p99 is None or p99 > args.max_p99_ms):
+        print(f"p99 frame latency above {args.max_p99_ms} ms")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--input", help="recorded call, raw 8 kHz μ-law or 8 kHz 16-bit mono WAV")
+    parser.add_argument("--calls", type=int, default=20, help="concurrent calls")
+    parser.add_argument("--duration", type=float, default=20.0, help="seconds of audio per call")
+    parser.add_argument("--speed", type=float, default=1.0, help="replay speed, 1 is real time")
+    parser.add_argument("--json", help="also write the results to this file")
+    parser.add_argument("--max-p99-ms", type=float, help="fail if the p99 frame latency is higher")
+    sys.exit(asyncio.run(main(parser.parse_args())))
@@ -0,0 +1,109 @@
+"""
+Bounded asyncio queues for the audio passed between the tasks of a call, so that a stalled EVI or Twilio socket
+can't make a call's memory and latency grow without limit.
+
+When a queue is full, its overflow policy decides what happens to a new item:
+  drop_oldest  the oldest queued item is dropped to make room (stale audio is the least useful)
+  coalesce     the new item is merged into the newest queued one with the queue's merge function, which can also
+               cap how much the merged item holds
+  block        the producer waits until the consumer catches up, pushing back on the socket it reads from
+"""
+import asyncio
+import os
+from enum import Enum
+from typing import Callable, Generic, Optional, TypeVar
+
+from metrics import QUEUE_DEPTH, QUEUE_OVERFLOWS
+
+T = TypeVar("T")
+
+
+class OverflowPolicy(str, Enum):
+    DROP_OLDEST = "drop_oldest"
+    COALESCE = "coalesce"
+    BLOCK = "block"
+
+
+class BoundedQueue(asyncio.Queue, Generic[T]):
+    """
+    asyncio.Queue with an overflow policy. Producers should use `await put()`, which only waits with the block
+    policy; put_nowait() applies the other policies too, but raises QueueFull with block.
+
+    The depth of all queues with the same name is exported as one gauge, so close() must be called when the call
+    ends to take the items left over out of it.
+    """
+    name: str
+    policy: OverflowPolicy
+
+    def __init__(
+        self,
+        name: str,
+        maxsize: int,
+        policy: OverflowPolicy,
+        merge: Optional[Callable[[T, T], T]] = None,
+        on_put: Optional[Callable[[T], None]] = None,
+        on_drop: Optional[Callable[[T], None]] = None,
+    ) -> None:
+        # on_put is called for every item added as a new entry (not for one coalesced into the newest entry), and
+        # on_drop for every item dropped, so that the caller can keep per-item bookkeeping in step with the queue
+        if maxsize <= 0:
+            raise ValueError("BoundedQueue needs a maxsize")
+        if policy is OverflowPolicy.COALESCE and merge is None:
+            raise ValueError("The coalesce policy needs a merge function")
+        super().__init__(maxsize)
+        self.name = name
+        self.policy = policy
+        self.merge = merge
+        self.on_put = on_put
+        self.on_drop = on_drop
+
+    async def put(self, item: T) -> None:
+        if self.policy is OverflowPolicy.BLOCK:
+            await super().put(item)
+        else:
+            self.put_nowait(item)
+
+    def put_nowait(self, item: T) -> None:
+        if self.full() and self.policy is OverflowPolicy.COALESCE:
+            self._queue[-1] = self.merge(self._queue[-1], item)
+            QUEUE_OVERFLOWS.inc(1, self.name, "coalesced")
+            return
+        if self.full() and self.policy is OverflowPolicy.DROP_OLDEST:
+            dropped = self.get_nowait()
+            QUEUE_OVERFLOWS.inc(1, self.name, "dropped")
+            if self.on_drop is not None:
+                self.on_drop(dropped)
+        super().put_nowait(item)
+
+    def close(self) -> None:
+        QUEUE_DEPTH.dec(self.qsize(), self.name)
+        self._queue.clear()
+
+    # asyncio.Queue calls these for every item that goes in or out
+    def _put(self, item: T) -> None:
+        super()._put(item)
+        QUEUE_DEPTH.inc(1, self.name)
+        if self.on_put is not None:
+            self.on_put(item)
+
+    def _get(self) -> T:
+        QUEUE_DEPTH.dec(1, self.name)
+        return super()._get()
+
+
+def bounded_queue_from_env(
+    name: str,
+    default_maxsize: int,
+    default_policy: OverflowPolicy,
+    merge: Optional[Callable[[T, T], T]] = None,
+    on_put: Optional[Callable[[T], None]] = None,
+    on_drop: Optional[Callable[[T], None]] = None,
+) -> BoundedQueue[T]:
+    """
+    Reads <NAME>_QUEUE_MAX (items) and <NAME>_QUEUE_POLICY (drop_oldest, coalesce or block), e.g.
+    TWILIO_TO_EVI_QUEUE_MAX for the queue named twilio_to_evi.
+    """
+    prefix = name.upper()
+    maxsize = int(os.environ.get(f"{prefix}_QUEUE_MAX", str(default_maxsize)))
+    policy = OverflowPolicy(os.environ.get(f"{prefix}_QUEUE_POLICY", default_policy.value))
+    return BoundedQueue(name, maxsize, policy, merge=merge, on_put=on_put, on_drop=on_drop)
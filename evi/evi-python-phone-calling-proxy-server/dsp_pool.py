@@ -0,0 +1,399 @@
+"""
+Where each call's EVI audio post-processing (EviAudioProcessor) runs.
+
+By default it runs inline on the event loop. With DSP_BATCH_WINDOW_MS=N, it still runs on the event loop, but the
+chunks that calls submit within N ms of each other are processed together, so that with many concurrent calls the
+filters run as one vectorized pass instead of paying Python and SciPy overhead per call. With DSP_WORKERS=N, calls
+are spread over N worker processes so that one call's SciPy filtering doesn't hold up the Twilio frames of every
+other call, and throughput scales with the number of cores. Each call is pinned to one worker for its whole
+lifetime, because its streaming filter state lives there, and audio is handed over through a pair of shared memory
+buffers per call instead of being pickled: the worker reads the EVI audio straight out of one and encodes μ-law
+straight into the other, so the only copies are writing the EVI audio in and taking the μ-law result out, before the
+next chunk reuses the buffer.
+
+Backends are started before the first call and shut down after the last one, which for DSP_WORKERS starts the worker
+processes (spawning them and importing SciPy takes seconds) and later stops them and frees their shared memory.
+
+Scaling out with several uvicorn workers (SO_REUSEPORT) works as well: `uvicorn ... --workers N`.
+"""
+import asyncio
+import concurrent.futures
+import itertools
+import logging
+import multiprocessing
+import os
+import threading
+import uuid
+import weakref
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing.shared_memory import SharedMemory
+from typing import Optional, Protocol, Union
+
+import numpy as np
+
+from audio_processors import EviAudioProcessor
+from audio_processors.mulaw import ulaw_encode
+
+logger = logging.getLogger(__name__)
+
+
+def create_evi_audio_processor() -> EviAudioProcessor:
+    return EviAudioProcessor(
+        audio_numpy_dtype=np.dtype(np.int16),
+        target_frames=8000,
+        streaming=True
+    )
+
+
+class CallDsp(Protocol):
+    """Post-processing for the EVI audio of one call. Chunks must be submitted one at a time, in order."""
+
+    async def postprocess_audio(self, evi_audio: bytes) -> bytes:
+        ...
+
+    def close(self) -> None:
+        ...
+
+
+class DspBackend(Protocol):
+    def start(self) -> None:
+        """Gets the backend ready for calls; blocks until it is."""
+        ...
+
+    def open_call(self) -> CallDsp:
+        ...
+
+    def shutdown(self) -> None:
+        ...
+
+
+class InlineCallDsp:
+    def __init__(self) -> None:
+        self.processor = create_evi_audio_processor()
+
+    async def postprocess_audio(self, evi_audio: bytes) -> bytes:
+        return self.processor.postprocess_audio(evi_audio)
+
+    def close(self) -> None:
+        pass
+
+
+class InlineDsp:
+    """Runs the DSP on the calling event loop."""
+
+    def start(self) -> None:
+        pass
+
+    def open_call(self) -> CallDsp:
+        return InlineCallDsp()
+
+    def shutdown(self) -> None:
+        pass
+
+
+class BatchedCallDsp:
+    def __init__(self, backend: "BatchedDsp") -> None:
+        self.backend = backend
+        self.processor = create_evi_audio_processor()
+
+    async def postprocess_audio(self, evi_audio: bytes) -> bytes:
+        return await self.backend.submit(self.processor, evi_audio)
+
+    def close(self) -> None:
+        pass
+
+
+class _LoopBatch:
+    """The chunks waiting to be batched on one event loop."""
+
+    def __init__(self) -> None:
+        self.pending: list[tuple[EviAudioProcessor, bytes, asyncio.Future]] = []
+        self.flush_handle: Optional[asyncio.TimerHandle] = None
+
+
+class BatchedDsp:
+    """
+    Runs the DSP on the event loop in micro-batches: the first chunk submitted starts a window of `window_ms`,
+    and everything submitted until it ends (or until `max_batch` chunks are waiting) is processed in one
+    EviAudioProcessor.postprocess_audio_batch call. Each call gets its result back from its own
+    postprocess_audio, in order.
+
+    Batches are kept per event loop, since a batch is flushed by a timer on its loop and resolves futures that
+    belong to it. In the Flask server every call runs on its own event loop, so there is nothing to batch there.
+    """
+
+    def __init__(self, window_ms: float = 5.0, max_batch: int = 128) -> None:
+        self.window_ms = window_ms
+        self.max_batch = max_batch
+        # Loops are only weakly referenced, so a loop closed with chunks still waiting doesn't leak its batch
+        self._batches: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, _LoopBatch]" = \
+            weakref.WeakKeyDictionary()
+        self._lock = threading.Lock()
+
+    def start(self) -> None:
+        pass
+
+    def open_call(self) -> CallDsp:
+        return BatchedCallDsp(self)
+
+    def shutdown(self) -> None:
+        pass
+
+    def submit(self, processor: EviAudioProcessor, evi_audio: bytes) -> "asyncio.Future[bytes]":
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            batch = self._batches.get(loop)
+            if batch is None:
+                batch = self._batches[loop] = _LoopBatch()
+        # From here on only this loop's thread touches the batch
+        future = loop.create_future()
+        batch.pending.append((processor, evi_audio, future))
+        if len(batch.pending) >= self.max_batch:
+            self._flush(loop, batch)
+        elif batch.flush_handle is None:
+            batch.flush_handle = loop.call_later(self.window_ms / 1000, self._flush, loop, batch)
+        return future
+
+    def _flush(self, loop: asyncio.AbstractEventLoop, batch: _LoopBatch) -> None:
+        if batch.flush_handle is not None:
+            batch.flush_handle.cancel()
+            batch.flush_handle = None
+
+        # A processor can only take one chunk per batch; a call's later chunks wait for the next one
+        items, seen, deferred = [], set(), []
+        for item in batch.pending:
+            if id(item[0]) in seen:
+                deferred.append(item)
+            else:
+                seen.add(id(item[0]))
+                items.append(item)
+        batch.pending = deferred
+
+        try:
+            results = EviAudioProcessor.postprocess_audio_batch(
+                [processor for processor, _, _ in items], [evi_audio for _, evi_audio, _ in items])
+        except Exception:
+            # Not down to one chunk that couldn't be read, which only fails its own call. Rather than fail every call
+            # in the batch, process each chunk on its own so that only one that fails by itself fails its call; the
+            # calls whose filters the batch had already run through may click once
+            logger.exception("Batched DSP failed, processing the %d chunks one by one", len(items))
+            results = []
+            for processor, evi_audio, _ in items:
+                try:
+                    results.append(processor.postprocess_audio(evi_audio))
+                except Exception as e:
+                    results.append(e)
+
+        for (_, _, future), result in zip(items, results):
+            if future.done():
+                continue
+            if isinstance(result, Exception):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+
+        if batch.pending:
+            batch.flush_handle = loop.call_later(self.window_ms / 1000, self._flush, loop, batch)
+
+
+# Per call shared memory: EVI audio in, μ-law out. Chunks that don't fit are pickled instead.
+INPUT_SLOT_BYTES = 1024 * 1024
+OUTPUT_SLOT_BYTES = 256 * 1024
+
+
+class _WorkerCall:
+    def __init__(self, input_name: str, output_name: str) -> None:
+        self.processor = create_evi_audio_processor()
+        self.input_shm = SharedMemory(name=input_name)
+        self.output_shm = SharedMemory(name=output_name)
+        self.output = np.ndarray(OUTPUT_SLOT_BYTES, dtype=np.uint8, buffer=self.output_shm.buf)
+
+
+# Worker process state: the calls pinned to this worker, by call id
+_worker_calls: dict[str, _WorkerCall] = {}
+
+
+def _worker_ready() -> None:
+    # Submitted to each worker at startup: by the time it runs, the worker has been spawned and imported this module
+    pass
+
+
+def _worker_open_call(call_id: str, input_name: str, output_name: str) -> None:
+    _worker_calls[call_id] = _WorkerCall(input_name, output_name)
+
+
+def _worker_postprocess(call_id: str, evi_audio: Union[int, bytes]) -> Union[int, bytes]:
+    # evi_audio is either the number of bytes written to the input slot, or the audio itself if it didn't fit.
+    # Likewise, returns the number of bytes written to the output slot or the audio itself.
+    call = _worker_calls[call_id]
+    if isinstance(evi_audio, int):
+        evi_audio = call.input_shm.buf[:evi_audio]
+    pcm_audio = call.processor.postprocess_pcm(evi_audio)
+
+    # One μ-law byte per sample
+    if len(pcm_audio) > OUTPUT_SLOT_BYTES:
+        return ulaw_encode(pcm_audio)
+    ulaw_encode(pcm_audio, out=call.output)
+    return len(pcm_audio)
+
+
+def _worker_close_call(call_id: str) -> None:
+    call = _worker_calls.pop(call_id, None)
+    if call is not None:
+        # The array must let go of the buffer before it can be closed
+        del call.output
+        call.input_shm.close()
+        call.output_shm.close()
+
+
+class ProcessPoolCallDsp:
+    def __init__(self, backend: "ProcessPoolDsp", slot: int, executor: ProcessPoolExecutor) -> None:
+        self.backend = backend
+        # The worker the call is pinned to: executor, unless it dies and is replaced in backend's slot
+        self.slot = slot
+        self.executor = executor
+        self.call_id = uuid.uuid4().hex
+        self._closed = False
+        self.input_shm = SharedMemory(create=True, size=INPUT_SLOT_BYTES)
+        self.output_shm = SharedMemory(create=True, size=OUTPUT_SLOT_BYTES)
+        self._open_on_worker()
+
+    async def postprocess_audio(self, evi_audio: bytes) -> bytes:
+        try:
+            return await self._postprocess_audio(evi_audio)
+        except BrokenProcessPool:
+            # The worker died, e.g. killed for running out of memory, and took the call's filter state with it.
+            # The call carries on from fresh state in the worker that replaces it; if the chunk fails that one too,
+            # the call fails
+            self.executor = self.backend._replace_executor(self.slot, self.executor)
+            self._open_on_worker()
+            return await self._postprocess_audio(evi_audio)
+
+    def _open_on_worker(self) -> None:
+        try:
+            self._opened = self.executor.submit(
+                _worker_open_call, self.call_id, self.input_shm.name, self.output_shm.name)
+        except BrokenProcessPool as e:
+            # Raised by the next postprocess_audio, which replaces the worker
+            self._opened = concurrent.futures.Future()
+            self._opened.set_exception(e)
+
+    async def _postprocess_audio(self, evi_audio: bytes) -> bytes:
+        await asyncio.wrap_future(self._opened)
+
+        if len(evi_audio) <= INPUT_SLOT_BYTES:
+            self.input_shm.buf[: len(evi_audio)] = evi_audio
+            request: Union[int, bytes] = len(evi_audio)
+        else:
+            request = evi_audio
+
+        loop = asyncio.get_running_loop()
+        result = await loop.run_in_executor(self.executor, _worker_postprocess, self.call_id, request)
+        if isinstance(result, int):
+            # The one copy on the way out: the next chunk overwrites the output slot
+            return bytes(self.output_shm.buf[:result])
+        return result
+
+    def close(self) -> None:
+        if self._closed:
+            return
+        self._closed = True
+        self.backend._discard_call(self)
+
+        def release_shared_memory(_future) -> None:
+            self.input_shm.close()
+            self.input_shm.unlink()
+            self.output_shm.close()
+            self.output_shm.unlink()
+
+        try:
+            closed = self.executor.submit(_worker_close_call, self.call_id)
+        except BrokenProcessPool:
+            # The worker is gone, and its side of the shared memory with it
+            release_shared_memory(None)
+        else:
+            closed.add_done_callback(release_shared_memory)
+
+
+class ProcessPoolDsp:
+    """
+    Spreads calls over worker processes, each with a single-worker ProcessPoolExecutor so calls stay pinned. A worker
+    that dies is replaced by a new one in its slot, the first time one of its calls finds out.
+
+    Thread-safe, for the Flask server's thread per call.
+    """
+
+    def __init__(self, n_workers: int) -> None:
+        self.n_workers = n_workers
+        self._executors: Optional[list[ProcessPoolExecutor]] = None
+        self._next_worker = itertools.count()
+        # Calls not closed yet, which shutdown() closes so that their shared memory is freed
+        self._calls: set[ProcessPoolCallDsp] = set()
+        self._lock = threading.Lock()
+
+    def start(self) -> None:
+        """Spawns the workers and waits until each is ready, so that the first calls don't pay for it."""
+        with self._lock:
+            self._start()
+
+    def open_call(self) -> CallDsp:
+        with self._lock:
+            # Started on first use if start() wasn't called
+            self._start()
+            slot = next(self._next_worker) % self.n_workers
+            call = ProcessPoolCallDsp(self, slot, self._executors[slot])
+            self._calls.add(call)
+        return call
+
+    def shutdown(self) -> None:
+        """Closes the calls still open and stops the workers, waiting for them to finish."""
+        with self._lock:
+            executors, self._executors = self._executors, None
+            calls = list(self._calls)
+        if executors is not None:
+            for call in calls:
+                call.close()
+            for executor in executors:
+                executor.shutdown()
+
+    def _start(self) -> None:
+        if self._executors is not None:
+            return
+        self._executors = [self._new_executor() for _ in range(self.n_workers)]
+        for future in [executor.submit(_worker_ready) for executor in self._executors]:
+            future.result()
+
+    @staticmethod
+    def _new_executor() -> ProcessPoolExecutor:
+        return ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn"))
+
+    def _replace_executor(self, slot: int, broken: ProcessPoolExecutor) -> ProcessPoolExecutor:
+        # Called by each call that finds its worker dead; the first one replaces it, the others get the replacement.
+        # The new worker is spawned by the first task submitted to it
+        with self._lock:
+            if self._executors is None:
+                raise RuntimeError("DSP workers are shut down")
+            if self._executors[slot] is broken:
+                logger.warning("DSP worker %d died, starting a new one", slot)
+                broken.shutdown(wait=False)
+                self._executors[slot] = self._new_executor()
+            return self._executors[slot]
+
+    def _discard_call(self, call: ProcessPoolCallDsp) -> None:
+        with self._lock:
+            self._calls.discard(call)
+
+
+def dsp_backend_from_env() -> DspBackend:
+    """
+    DSP_WORKERS=N runs the DSP in N worker processes. Otherwise it runs inline, in micro-batches of
+    DSP_BATCH_WINDOW_MS if that is set.
+    """
+    n_workers = int(os.environ.get("DSP_WORKERS", "0"))
+    if n_workers > 0:
+        return ProcessPoolDsp(n_workers)
+    batch_window_ms = float(os.environ.get("DSP_BATCH_WINDOW_MS", "0"))
+    if batch_window_ms > 0:
+        return BatchedDsp(batch_window_ms)
+    return InlineDsp()
@@ -0,0 +1,142 @@
+"""
+A pool of EVI chat connections opened ahead of time, so that an incoming call doesn't wait for the TLS and
+websocket handshake with EVI before the caller can be heard.
+
+Warm connections are opened with the audio settings only, since those can't change mid-chat. When a call takes
+one, the rest of its session settings (variables, context, ...) are sent as a SessionSettings message. A chat can
+only serve one call, so the pool refills itself in the background, and connections that sat idle for longer than
+the idle TTL are closed and replaced before EVI times them out.
+
+The pool lives on one event loop, so it is used by the ASGI server only; the Flask server runs each call on its
+own event loop.
+"""
+import asyncio
+import contextlib
+import dataclasses
+import json
+import os
+import time
+from collections import deque
+from typing import Any, AsyncIterator, Optional
+
+from hume.empathic_voice import SessionSettings
+
+from media_stream import EviConnector
+from metrics import EVI_POOL_ACQUIRES, EVI_POOL_IDLE_CONNECTIONS
+
+
+@dataclasses.dataclass
+class _WarmConnection:
+    socket: Any
+    # Exits the connector's context manager, which closes the chat
+    exit_stack: contextlib.AsyncExitStack
+    connected_at: float
+
+
+class EviConnectionPool:
+    """
+    Keeps `size` EVI chats connected with `audio_settings`. `connect` is an EviConnector for handle_media_stream:
+    it hands out a warm chat when one is ready and the call's audio settings match, and connects directly
+    otherwise.
+    """
+    # Wait before trying again after a failed connection
+    RETRY_SECONDS = 5.0
+
+    def __init__(
+        self, connect_evi: EviConnector, audio_settings: dict[str, Any], size: int = 2, idle_ttl: float = 60.0
+    ) -> None:
+        self.connect_evi = connect_evi
+        self.audio_settings = audio_settings
+        self.size = size
+        self.idle_ttl = idle_ttl
+        self._idle: deque[_WarmConnection] = deque()
+        self._refill_task: Optional[asyncio.Task] = None
+        self._wakeup = asyncio.Event()
+
+    def start(self) -> None:
+        if self._refill_task is None:
+            self._refill_task = asyncio.create_task(self._refill())
+
+    async def close(self) -> None:
+        if self._refill_task is not None:
+            self._refill_task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._refill_task
+            self._refill_task = None
+        while self._idle:
+            EVI_POOL_IDLE_CONNECTIONS.dec()
+            await self._close_connection(self._idle.popleft())
+
+    @contextlib.asynccontextmanager
+    async def connect(self, session_settings: dict[str, Any]) -> AsyncIterator[Any]:
+        self.start()
+        warm = self._take() if session_settings.get("audio") == self.audio_settings else None
+        if warm is None:
+            EVI_POOL_ACQUIRES.inc(1, "miss")
+            async with self.connect_evi(session_settings) as socket:
+                yield socket
+            return
+
+        EVI_POOL_ACQUIRES.inc(1, "hit")
+        async with warm.exit_stack:
+            call_settings = {key: value for key, value in session_settings.items() if key != "audio"}
+            if isinstance(call_settings.get("variables"), str):
+                # The connect query parameter takes variables as JSON, the SessionSettings message as an object
+                call_settings["variables"] = json.loads(call_settings["variables"])
+            if call_settings:
+                await warm.socket.send_publish(SessionSettings(**call_settings))
+            yield warm.socket
+
+    def _take(self) -> Optional[_WarmConnection]:
+        # The newest connection, the furthest from timing out; expired ones are left for the refill task to close
+        if not self._idle or time.monotonic() - self._idle[-1].connected_at >= self.idle_ttl:
+            return None
+        EVI_POOL_IDLE_CONNECTIONS.dec()
+        self._wakeup.set()
+        return self._idle.pop()
+
+    async def _refill(self) -> None:
+        while True:
+            self._wakeup.clear()
+            now = time.monotonic()
+            while self._idle and now - self._idle[0].connected_at >= self.idle_ttl:
+                EVI_POOL_IDLE_CONNECTIONS.dec()
+                await self._close_connection(self._idle.popleft())
+
+            if len(self._idle) < self.size:
+                try:
+                    self._idle.append(await self._open_connection())
+                    EVI_POOL_IDLE_CONNECTIONS.inc()
+                except Exception as e:
+                    print(f"❌ Failed to pre-connect to EVI: {e}")
+                    await asyncio.sleep(self.RETRY_SECONDS)
+                continue
+
+            # Full: sleep until a connection is taken or the oldest one expires
+            timeout = self._idle[0].connected_at + self.idle_ttl - time.monotonic() if self._idle else None
+            with contextlib.suppress(asyncio.TimeoutError):
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+
+    async def _open_connection(self) -> _WarmConnection:
+        exit_stack = contextlib.AsyncExitStack()
+        socket = await exit_stack.enter_async_context(self.connect_evi({"audio": self.audio_settings}))
+        return _WarmConnection(socket, exit_stack, time.monotonic())
+
+    @staticmethod
+    async def _close_connection(warm: _WarmConnection) -> None:
+        try:
+            await warm.exit_stack.aclose()
+        except Exception as e:
+            print(f"❌ Failed to close idle EVI connection: {e}")
+
+
+def evi_pool_from_env(connect_evi: EviConnector, audio_settings: dict[str, Any]) -> Optional[EviConnectionPool]:
+    """
+    EVI_POOL_SIZE=N keeps N EVI chats connected ahead of calls (0, the default, disables the pool), each for at most
+    EVI_POOL_IDLE_TTL_SECONDS (default 60).
+    """
+    size = int(os.environ.get("EVI_POOL_SIZE", "0"))
+    if size <= 0:
+        return None
+    idle_ttl = float(os.environ.get("EVI_POOL_IDLE_TTL_SECONDS", "60"))
+    return EviConnectionPool(connect_evi, audio_settings, size=size, idle_ttl=idle_ttl)
@@ -0,0 +1,137 @@
+"""
+Serialization of the Twilio media stream protocol, the JSON text messages carrying 20 ms of audio each way.
+
+Incoming messages are decoded into TwilioEvent by the fastest JSON library installed: msgspec (decoding straight
+into precompiled structs, skipping the fields we don't use), then orjson, then the standard library. Install the
+`fast` extra to get them, or pick one with MEDIA_CODEC=msgspec|orjson|json.
+
+Outgoing messages are always built from string templates: every value in them is either base64, which never needs
+escaping in JSON, or escaped once per call (the stream SID). Twilio expects text frames, so they stay str.
+"""
+import binascii
+import json
+import os
+from typing import NamedTuple, Optional, Protocol
+
+try:
+    import msgspec
+except ImportError:
+    msgspec = None
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+class TwilioEvent(NamedTuple):
+    """The fields of a Twilio media stream message that the proxy uses."""
+    event: Optional[str]
+    stream_sid: Optional[str] = None
+    # media events: base64 μ-law audio and its timestamp in ms, as a string
+    payload: Optional[str] = None
+    timestamp: Optional[str] = None
+    # mark events
+    mark_name: Optional[str] = None
+
+
+class MediaStreamDecoder(Protocol):
+    name: str
+
+    def decode(self, message: str) -> TwilioEvent:
+        ...
+
+
+def _event_from_dict(data: dict) -> TwilioEvent:
+    media = data.get("media") or {}
+    mark = data.get("mark") or {}
+    return TwilioEvent(
+        data.get("event"), data.get("streamSid"), media.get("payload"), media.get("timestamp"), mark.get("name"))
+
+
+class JsonDecoder:
+    name = "json"
+
+    def decode(self, message: str) -> TwilioEvent:
+        return _event_from_dict(json.loads(message))
+
+
+class OrjsonDecoder:
+    name = "orjson"
+
+    def __init__(self) -> None:
+        if orjson is None:
+            raise ImportError("orjson is not installed")
+        self._loads = orjson.loads
+
+    def decode(self, message: str) -> TwilioEvent:
+        return _event_from_dict(self._loads(message))
+
+
+if msgspec is not None:
+    class _Media(msgspec.Struct):
+        payload: Optional[str] = None
+        timestamp: Optional[str] = None
+
+    class _Mark(msgspec.Struct):
+        name: Optional[str] = None
+
+    class _Message(msgspec.Struct):
+        event: Optional[str] = None
+        streamSid: Optional[str] = None
+        media: Optional[_Media] = None
+        mark: Optional[_Mark] = None
+
+
+class MsgspecDecoder:
+    name = "msgspec"
+
+    def __init__(self) -> None:
+        if msgspec is None:
+            raise ImportError("msgspec is not installed")
+        # Fields not declared in _Message (sequenceNumber, start, track, chunk, ...) are skipped without being built
+        self._decoder = msgspec.json.Decoder(_Message)
+
+    def decode(self, message: str) -> TwilioEvent:
+        data = self._decoder.decode(message)
+        media, mark = data.media, data.mark
+        if media is not None:
+            return TwilioEvent(data.event, data.streamSid, media.payload, media.timestamp)
+        return TwilioEvent(data.event, data.streamSid, mark_name=mark.name if mark is not None else None)
+
+
+DECODERS = {"msgspec": MsgspecDecoder, "orjson": OrjsonDecoder, "json": JsonDecoder}
+
+
+def media_stream_decoder_from_env() -> MediaStreamDecoder:
+    """MEDIA_CODEC picks the JSON library for incoming messages; by default, the fastest one installed."""
+    name = os.environ.get("MEDIA_CODEC", "auto")
+    if name != "auto":
+        return DECODERS[name]()
+    for decoder_class in DECODERS.values():
+        try:
+            return decoder_class()
+        except ImportError:
+            pass
+    return JsonDecoder()
+
+
+class TwilioFrameEncoder:
+    """Builds the messages sent to Twilio on one media stream."""
+
+    def __init__(self, stream_sid: str) -> None:
+        # json.dumps escapes the stream SID and adds its quotes, once
+        sid = json.dumps(stream_sid)
+        self._media_prefix = '{"event":"media","streamSid":' + sid + ',"media":{"payload":"'
+        self._mark_prefix = '{"event":"mark","streamSid":' + sid + ',"mark":{"name":"'
+        self._clear = '{"event":"clear","streamSid":' + sid + '}'
+
+    def media(self, ulaw_audio) -> str:
+        """A media message playing `ulaw_audio`, a bytes-like object of μ-law samples."""
+        return self._media_prefix + binascii.b2a_base64(ulaw_audio, newline=False).decode("ascii") + '"}}'
+
+    def mark(self, name: str) -> str:
+        return self._mark_prefix + json.dumps(name)[1:-1] + '"}}'
+
+    def clear(self) -> str:
+        return self._clear
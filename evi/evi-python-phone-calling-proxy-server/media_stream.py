@@ -0,0 +1,326 @@
+import asyncio
+import json
+import base64
+import time
+from collections import deque
+from typing import Any, AsyncContextManager, Callable, Optional, Protocol
+
+from hume import AsyncHumeClient
+from hume.empathic_voice.types import SubscribeEvent
+from hume.empathic_voice import AudioInput, SessionSettings
+from audio_processors import TwilioAudioProcessor, adaptive_batcher_from_env, silence_gate_from_env
+from bounded_queue import OverflowPolicy, bounded_queue_from_env
+from dsp_pool import DspBackend, InlineDsp
+from media_codec import media_stream_decoder_from_env
+from metrics import ACTIVE_CALLS, INBOUND_BATCH_WINDOW_SECONDS, SILENCE_GATE_CHUNKS, CallLatency
+from twilio_playout import TwilioPlayout
+from tool_calls import tool_call_runner_from_env
+from tools import TOOLS
+
+
+class MediaStreamSocket(Protocol):
+    """The Twilio media stream websocket, as seen by handle_media_stream."""
+
+    async def receive(self) -> Optional[str]:
+        """Returns the next text message, or None once Twilio has disconnected."""
+        ...
+
+    async def send(self, message: str) -> None:
+        ...
+
+
+# Most audio a coalesced queue item keeps, the newest: 2 s of caller PCM16 and 30 s of μ-law for Twilio, since EVI
+# sends its replies faster than real time
+MAX_COALESCED_CALLER_AUDIO_BYTES = 2 * 8000 * 2
+MAX_COALESCED_EVI_AUDIO_BYTES = 30 * 8000
+
+
+def coalesce_caller_audio(older: bytes, newer: bytes) -> bytes:
+    return (older + newer)[-MAX_COALESCED_CALLER_AUDIO_BYTES:]
+
+
+def coalesce_evi_audio(older: tuple[bytes, float], newer: tuple[bytes, float]) -> tuple[bytes, float]:
+    # Keeps the time the older audio was enqueued, for the playout wait
+    return (older[0] + newer[0])[-MAX_COALESCED_EVI_AUDIO_BYTES:], older[1]
+
+
+# Audio sent to EVI: linear16 PCM as decoded from Twilio's μ-law
+EVI_AUDIO_SETTINGS = {
+    "encoding": "linear16",
+    "sample_rate": 8000,
+    "channels": 1
+}
+
+
+# Opens an EVI chat with the given session settings, e.g. hume_client.empathic_voice.chat.connect
+EviConnector = Callable[[dict[str, Any]], AsyncContextManager[Any]]
+
+
+def hume_evi_connector(hume_client: AsyncHumeClient) -> EviConnector:
+    def connect(session_settings: dict[str, Any]) -> AsyncContextManager[Any]:
+        return hume_client.empathic_voice.chat.connect(
+            config_id="2e7ba66e-db54-4772-ad5f-1a58a95ebc78",
+            session_settings=session_settings
+        )
+
+    return connect
+
+
+def build_twiml(server_url: str) -> str:
+    """
+    Response is what Twilio voice will pronounce at the beginning of the call.
+    server_url is the wss:// base URL of this server, ending with a slash.
+    """
+    return f"""<?xml version="1.0" encoding="UTF-8"?>
+<Response>
+    <Say>Connecting you to Hume AI EVI customer support assistant</Say>
+    <Connect>
+        <Stream url="{server_url}media-stream" />
+    </Connect>
+</Response>"""
+
+
+async def handle_media_stream(ws: MediaStreamSocket, connect_evi: EviConnector, dsp: Optional[DspBackend] = None):
+    # Monotonic time each chunk in twilio_to_evi_queue was received from Twilio, in queue order
+    chunk_received_at = deque()
+    # Monotonic time the Twilio media message being queued was received
+    media_received_at = 0.0
+
+    # Queues for passing audio between tasks, bounded so that a stalled socket can't build up audio without limit.
+    # Caller audio that EVI can't take fast enough is stale, so by default the oldest is dropped. EVI audio is
+    # paced out to Twilio in real time while EVI sends it in bursts, so by default it is coalesced into the newest
+    # entry instead of being dropped; making EVI wait would also hold up its user_interruption and tool_call
+    # messages, which arrive on the same socket.
+    twilio_to_evi_queue = bounded_queue_from_env(
+        "twilio_to_evi", 50, OverflowPolicy.DROP_OLDEST,
+        merge=coalesce_caller_audio,
+        on_put=lambda _chunk: chunk_received_at.append(media_received_at),
+        on_drop=lambda _chunk: chunk_received_at.popleft())
+    evi_to_twilio_queue = bounded_queue_from_env(
+        "evi_to_twilio", 64, OverflowPolicy.COALESCE, merge=coalesce_evi_audio)
+
+    # Audio processors for format conversion
+    twilio_audio_processor = TwilioAudioProcessor(batcher=adaptive_batcher_from_env())
+    # Optionally thins out silent caller audio before it is sent to EVI; it also tells caller speech from silence for
+    # the mouth-to-ear latency, which is only measured with the gate on
+    silence_gate = silence_gate_from_env()
+    evi_audio_dsp = (dsp or InlineDsp()).open_call()
+    latency = CallLatency()
+    # Paces μ-law audio from evi_to_twilio_queue out to Twilio
+    twilio_playout = TwilioPlayout(ws, evi_to_twilio_queue, latency=latency)
+    # Decodes Twilio's messages with the fastest JSON library installed
+    decoder = media_stream_decoder_from_env()
+    ACTIVE_CALLS.inc()
+
+    stream_sid = None
+    evi_socket = None
+    tool_calls = None
+
+    try:
+        async def receive_from_twilio():
+            """Receives audio from Twilio, converts μ-law to linear16, and queues for EVI."""
+            nonlocal stream_sid, media_received_at
+
+            while True:
+                message = await ws.receive()
+                if message is None:
+                    break
+                received_at = time.monotonic()
+
+                event = decoder.decode(message)
+                event_type = event.event
+
+                if event_type == "connected":
+                    print("✅ Twilio connected")
+
+                elif event_type == "start":
+                    stream_sid = event.stream_sid
+                    twilio_playout.stream_sid = stream_sid
+                    print(f"🎤 Call started: {stream_sid}")
+
+                elif event_type == "media":
+                    # Queue Twilio audio for conversion and sending to EVI
+                    media_received_at = received_at
+                    await twilio_audio_processor.queue_twilio_audio(
+                        twilio_media_payload={
+                            "payload": event.payload,
+                            "track": "inbound",
+                            "timestamp": event.timestamp
+                        },
+                        twilio_to_evi_queue=twilio_to_evi_queue
+                    )
+                    latency.observe(CallLatency.TWILIO_DECODE, time.monotonic() - received_at)
+
+                elif event_type == "mark":
+                    # Twilio has played the audio up to this mark
+                    twilio_playout.on_mark(event.mark_name)
+
+                elif event_type == "stop":
+                    print("🛑 Call ended")
+                    break
+
+        async def send_to_evi():
+            """Sends queued audio chunks to EVI."""
+            nonlocal evi_socket
+            while True:
+                chunk = await twilio_to_evi_queue.get()
+                received_at = chunk_received_at.popleft()
+                latency.observe(CallLatency.QUEUE_WAIT, time.monotonic() - received_at)
+
+                if silence_gate is not None:
+                    is_speech = silence_gate.is_speech(chunk)
+                    latency.caller_audio(received_at, is_speech)
+                    if not silence_gate.should_send(chunk, is_speech):
+                        SILENCE_GATE_CHUNKS.inc(1, "suppressed")
+                        continue
+                    SILENCE_GATE_CHUNKS.inc(1, "sent")
+                if evi_socket:
+                    audio_input = AudioInput(
+                        data=base64.b64encode(chunk).decode("utf-8"))
+                    send_started = time.monotonic()
+                    await evi_socket.send_publish(audio_input)
+                    send_latency = time.monotonic() - send_started
+                    latency.observe(CallLatency.EVI_PUBLISH, send_latency)
+                    # Adapt how much audio goes into the next chunks to how fast EVI keeps up
+                    twilio_audio_processor.batcher.observe_send(
+                        send_latency, twilio_to_evi_queue.qsize())
+                    INBOUND_BATCH_WINDOW_SECONDS.observe(
+                        twilio_audio_processor.batcher.window_ms / 1000)
+
+        async def on_evi_message(message: SubscribeEvent):
+            """Handles messages received from EVI."""
+            if message.type == "chat_metadata":
+                print(f"📨 Chat ID: {message.chat_id}")
+
+            elif message.type == "audio_output":
+                # Convert EVI audio to Twilio μ-law format and queue
+                decode_started = time.monotonic()
+                evi_audio_bytes = base64.b64decode(
+                    message.data.encode("utf-8"))
+                postprocess_started = time.monotonic()
+                latency.observe(CallLatency.EVI_DECODE, postprocess_started - decode_started)
+                twilio_audio = await evi_audio_dsp.postprocess_audio(
+                    evi_audio_bytes)
+                latency.observe(CallLatency.POSTPROCESS_AUDIO, time.monotonic() - postprocess_started)
+                if twilio_audio:
+                    await twilio_playout.enqueue(twilio_audio)
+                print("🔊 EVI audio received")
+
+            elif message.type == "user_interruption":
+                # The caller started talking over EVI: stop playback right away
+                await twilio_playout.interrupt()
+                print("✋ User interruption")
+
+            elif message.type == "user_message":
+                print(f"👤 User: {message.message.content}")
+
+            elif message.type == "assistant_message":
+                print(f"💬 EVI: {message.message.content}")
+
+            elif message.type == "tool_call":
+                # Runs in its own task, so that EVI's audio keeps flowing while the tool works
+                tool_calls.submit(message)
+
+            elif message.type == "error":
+                print(f"❌ EVI Error: {message.message}")
+
+        # Connect to EVI
+        print("🔌 Connecting to EVI...")
+
+        # You can provide query parameters to EVI on handshake:
+        # https://dev.hume.ai/reference/speech-to-speech-evi/chat#request.query
+        session_variables = {
+            "name": "Joshua"
+        }
+
+        session_settings_config = {
+            # Do not delete the audio settings, as they are needed for audio streaming.
+            "audio": EVI_AUDIO_SETTINGS,
+            "variables": json.dumps(session_variables),
+            # Add user context (optional)
+            # See: https://dev.hume.ai/reference/speech-to-speech-evi/chat#send.SessionSettings.context
+            "context": {
+                "type": "persistent",
+                "text": (
+                    "You are a helpful customer support assistant. Use their name and ask "
+                    "them for their support ticket ID, so you can give them an update on "
+                    "their ticket status."
+                )
+            }
+        }
+
+        async with connect_evi(session_settings_config) as socket:
+            print("✅ EVI connected")
+            evi_socket = socket
+            tool_calls = tool_call_runner_from_env(TOOLS, socket.send_publish)
+
+            async def listen_to_evi():
+                try:
+                    async for message in socket:
+                        await on_evi_message(message)
+                except asyncio.CancelledError:
+                    raise
+                except Exception as err:
+                    print(f"❌ EVI Error: {err}")
+                    raise
+                finally:
+                    print("👋 EVI disconnected")
+
+            async def update_session_settings():
+                try:
+                    await asyncio.sleep(10)
+                    if evi_socket:
+                        session_settings_message = SessionSettings(
+                            voice_id="ebba4902-69de-4e01-9846-d8feba5a1a3f" # TikTok Fashion Influencer
+                        )
+                        await evi_socket.send_publish(session_settings_message)
+                        print("🎛️ Session settings updated with new voice: TikTok Fashion Influencer")
+                except asyncio.CancelledError:
+                    raise
+                except Exception as err:
+                    print(f"❌ Failed to update session settings: {err}")
+                    raise
+
+            # Run all audio streaming tasks concurrently
+            streaming_tasks = [
+                asyncio.create_task(receive_from_twilio()),
+                asyncio.create_task(send_to_evi()),
+                asyncio.create_task(twilio_playout.run()),
+                asyncio.create_task(listen_to_evi()),
+            ]
+            voice_update_task = asyncio.create_task(update_session_settings())
+
+            # Wait for any core streaming task to complete, then clean up
+            await asyncio.wait(streaming_tasks, return_when=asyncio.FIRST_COMPLETED)
+
+            for task in streaming_tasks:
+                task.cancel()
+
+            voice_update_task.cancel()
+            # The caller hung up: nobody is waiting for the tool calls still running
+            await tool_calls.close()
+
+            for task in streaming_tasks:
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
+
+            try:
+                await voice_update_task
+            except asyncio.CancelledError:
+                pass
+
+    except Exception as e:
+        print(f"❌ Error: {e}")
+        import traceback
+        traceback.print_exc()
+    finally:
+        if tool_calls is not None:
+            await tool_calls.close()
+        evi_audio_dsp.close()
+        twilio_to_evi_queue.close()
+        evi_to_twilio_queue.close()
+        ACTIVE_CALLS.dec()
+        print(f"⏱️ Latency: {latency.summary()}")
+        print("👋 Call ended")
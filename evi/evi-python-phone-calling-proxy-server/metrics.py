@@ -0,0 +1,253 @@
+"""
+Process-wide metrics for the phone proxy, rendered in the Prometheus text format by the /metrics endpoint.
+
+Metrics are updated from every call, which in the Flask server means from many threads, so each one has a lock.
+"""
+import bisect
+import math
+import threading
+import time
+from typing import Optional, Sequence, TypeVar
+
+# Prometheus text exposition format
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape_label_value(value: str) -> str:
+    # Backslash, double quote and newline are the characters the text format escapes in label values
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(label_names: Sequence[str], label_values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape_label_value(str(value))}"' for name, value in zip(label_names, label_values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value))
+
+
+class _Metric:
+    metric_type = ""
+
+    def __init__(self, name: str, documentation: str, label_names: Sequence[str] = ()) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self._lock = threading.Lock()
+
+    def render(self) -> list[str]:
+        # HELP text escapes backslash and newline only
+        documentation = self.documentation.replace("\\", "\\\\").replace("\n", "\\n")
+        lines = [f"# HELP {self.name} {documentation}", f"# TYPE {self.name} {self.metric_type}"]
+        with self._lock:
+            lines.extend(self._render_samples())
+        return lines
+
+    def _render_samples(self) -> list[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    metric_type = "counter"
+
+    def __init__(self, name: str, documentation: str, label_names: Sequence[str] = ()) -> None:
+        super().__init__(name, documentation, label_names)
+        self._values: dict[tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1.0, *label_values: str) -> None:
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0.0) + amount
+
+    def _render_samples(self) -> list[str]:
+        return [
+            f"{self.name}{_format_labels(self.label_names, labels)} {_format_value(value)}"
+            for labels, value in self._values.items()
+        ]
+
+
+class Gauge(_Metric):
+    metric_type = "gauge"
+
+    def __init__(self, name: str, documentation: str, label_names: Sequence[str] = ()) -> None:
+        super().__init__(name, documentation, label_names)
+        self._values: dict[tuple[str, ...], float] = {}
+
+    def set(self, value: float, *label_values: str) -> None:
+        with self._lock:
+            self._values[label_values] = value
+
+    def inc(self, amount: float = 1.0, *label_values: str) -> None:
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0.0) + amount
+
+    def dec(self, amount: float = 1.0, *label_values: str) -> None:
+        self.inc(-amount, *label_values)
+
+    def _render_samples(self) -> list[str]:
+        return [
+            f"{self.name}{_format_labels(self.label_names, labels)} {_format_value(value)}"
+            for labels, value in self._values.items()
+        ]
+
+
+class Histogram(_Metric):
+    metric_type = "histogram"
+
+    def __init__(
+        self, name: str, documentation: str, label_names: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS
+    ) -> None:
+        super().__init__(name, documentation, label_names)
+        self.buckets = tuple(sorted(buckets))
+        # per label values: non-cumulative count per bucket (last one is +Inf), sum
+        self._counts: dict[tuple[str, ...], list[int]] = {}
+        self._sums: dict[tuple[str, ...], float] = {}
+
+    def observe(self, value: float, *label_values: str) -> None:
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts = self._counts.get(label_values)
+            if counts is None:
+                counts = self._counts[label_values] = [0] * (len(self.buckets) + 1)
+                self._sums[label_values] = 0.0
+            counts[index] += 1
+            self._sums[label_values] += value
+
+    def _render_samples(self) -> list[str]:
+        lines = []
+        for labels, counts in self._counts.items():
+            cumulative = 0
+            for upper_bound, count in zip(self.buckets + (math.inf,), counts):
+                cumulative += count
+                bucket_labels = _format_labels(self.label_names, labels, f'le="{_format_value(upper_bound)}"')
+                lines.append(f"{self.name}_bucket{bucket_labels} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.label_names, labels)} {_format_value(self._sums[labels])}")
+            lines.append(f"{self.name}_count{_format_labels(self.label_names, labels)} {cumulative}")
+        return lines
+
+
+MetricT = TypeVar("MetricT", bound=_Metric)
+
+
+class Registry:
+    def __init__(self) -> None:
+        self._metrics: list[_Metric] = []
+
+    def register(self, metric: MetricT) -> MetricT:
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+ACTIVE_CALLS = REGISTRY.register(Gauge(
+    "phone_proxy_active_calls", "Calls currently connected to the proxy."))
+STAGE_SECONDS = REGISTRY.register(Histogram(
+    "phone_proxy_stage_seconds",
+    "Time spent in each stage of the audio pipeline.",
+    label_names=("stage",)))
+MOUTH_TO_EAR_SECONDS = REGISTRY.register(Histogram(
+    "phone_proxy_mouth_to_ear_seconds",
+    "Time from the last caller speech received from Twilio to the first frame of EVI's reply sent to Twilio. Only "
+    "measured with the silence gate on, which tells speech from silence.",
+    buckets=(0.25, 0.5, 0.75, 1.0, 1.5, 2.0, 3.0, 5.0, 10.0)))
+INBOUND_BATCH_WINDOW_SECONDS = REGISTRY.register(Histogram(
+    "phone_proxy_inbound_batch_window_seconds",
+    "Inbound batch window chosen by the adaptive batcher, observed on every send to EVI.",
+    buckets=(0.04, 0.06, 0.08, 0.1, 0.16, 0.2, 0.3, 0.4)))
+EVI_POOL_ACQUIRES = REGISTRY.register(Counter(
+    "phone_proxy_evi_pool_acquires_total",
+    "Calls that got a pre-connected EVI chat from the pool (hit) or had to connect (miss).",
+    label_names=("result",)))
+EVI_POOL_IDLE_CONNECTIONS = REGISTRY.register(Gauge(
+    "phone_proxy_evi_pool_idle_connections", "Pre-connected EVI chats waiting for a call."))
+QUEUE_DEPTH = REGISTRY.register(Gauge(
+    "phone_proxy_queue_depth",
+    "Items waiting in the per-call audio queues, summed over all calls.",
+    label_names=("queue",)))
+QUEUE_OVERFLOWS = REGISTRY.register(Counter(
+    "phone_proxy_queue_overflows_total",
+    "Items put into a full audio queue, by what the queue's overflow policy did with them.",
+    label_names=("queue", "action")))
+SILENCE_GATE_CHUNKS = REGISTRY.register(Counter(
+    "phone_proxy_silence_gate_chunks_total",
+    "Caller audio chunks passed or suppressed by the silence gate.",
+    label_names=("result",)))
+TOOL_CALLS = REGISTRY.register(Counter(
+    "phone_proxy_tool_calls_total",
+    "EVI tool calls by tool and outcome (ok, error, timeout, unknown or cancelled at hangup). Calls to tools that "
+    "don't exist are all counted under tool \"unknown\".",
+    label_names=("tool", "result")))
+TOOL_CALL_SECONDS = REGISTRY.register(Histogram(
+    "phone_proxy_tool_call_seconds",
+    "Time from an EVI tool call being received to its result being ready, including waiting for a slot.",
+    label_names=("tool",)))
+TOOL_CACHE_REQUESTS = REGISTRY.register(Counter(
+    "phone_proxy_tool_cache_requests_total",
+    "Tool lookups answered from the cache (hit), by calling the tool (miss) or by joining an identical call in "
+    "flight (coalesced).",
+    label_names=("tool", "result")))
+
+
+class CallLatency:
+    """
+    Per call latency tracking. Stage timings go to the process-wide STAGE_SECONDS histogram; mouth-to-ear latency
+    (as seen by the proxy, without the network legs to and from Twilio) is also kept per call for the summary.
+    """
+    # Stages, in pipeline order
+    TWILIO_DECODE = "twilio_decode"
+    QUEUE_WAIT = "queue_wait"
+    EVI_PUBLISH = "evi_publish"
+    EVI_DECODE = "evi_decode"
+    POSTPROCESS_AUDIO = "postprocess_audio"
+    PLAYOUT_WAIT = "playout_wait"
+    TWILIO_SEND = "twilio_send"
+    # EVI audio frames closer together than this belong to the same reply
+    REPLY_GAP_SECONDS = 0.1
+
+    def __init__(self) -> None:
+        self.mouth_to_ear: list[float] = []
+        self._last_speech_at: Optional[float] = None
+        self._awaiting_reply = False
+        self._last_assistant_audio_at = float("-inf")
+
+    def observe(self, stage: str, seconds: float) -> None:
+        STAGE_SECONDS.observe(seconds, stage)
+
+    def caller_audio(self, received_at: float, is_speech: bool) -> None:
+        """Records a chunk of caller audio, by the time its last Twilio frame was received."""
+        if is_speech:
+            self._last_speech_at = received_at
+            self._awaiting_reply = True
+
+    def assistant_audio_sent(self, sent_at: Optional[float] = None) -> None:
+        """Records a frame of EVI audio sent to Twilio; the first one of a reply after caller speech ends a turn."""
+        sent_at = time.monotonic() if sent_at is None else sent_at
+        starts_reply = sent_at - self._last_assistant_audio_at >= self.REPLY_GAP_SECONDS
+        self._last_assistant_audio_at = sent_at
+        # Caller speech while EVI keeps talking (e.g. "mm-hmm") doesn't make the next frame a reply
+        if not starts_reply or not self._awaiting_reply or self._last_speech_at is None:
+            return
+        latency = sent_at - self._last_speech_at
+        self._awaiting_reply = False
+        self.mouth_to_ear.append(latency)
+        MOUTH_TO_EAR_SECONDS.observe(latency)
+
+    def summary(self) -> str:
+        if not self.mouth_to_ear:
+            return "no completed turns"
+        turns = sorted(self.mouth_to_ear)
+        median = turns[len(turns) // 2]
+        return f"{len(turns)} turns, mouth-to-ear median {median * 1000:.0f} ms, max {turns[-1] * 1000:.0f} ms"
@@ -0,0 +1,111 @@
+# run tests locally with:
+# uv run pytest test_bounded_queue.py -v
+
+import asyncio
+from collections import deque
+
+import pytest
+
+from bounded_queue import BoundedQueue, OverflowPolicy, bounded_queue_from_env
+from media_stream import MAX_COALESCED_CALLER_AUDIO_BYTES, coalesce_caller_audio, coalesce_evi_audio
+from metrics import QUEUE_DEPTH, QUEUE_OVERFLOWS
+
+
+def depth(name: str) -> float:
+    return QUEUE_DEPTH._values.get((name,), 0.0)
+
+
+def overflows(name: str, action: str) -> float:
+    return QUEUE_OVERFLOWS._values.get((name, action), 0.0)
+
+
+def timed_queue(name: str, maxsize: int, policy: OverflowPolicy) -> tuple[BoundedQueue, deque]:
+    # Like twilio_to_evi in handle_media_stream: the time each chunk was received is kept alongside the queue
+    received_at = deque()
+    queue = BoundedQueue(
+        name, maxsize, policy, merge=coalesce_caller_audio,
+        on_put=lambda chunk: received_at.append(chunk[0]),
+        on_drop=lambda _chunk: received_at.popleft())
+    return queue, received_at
+
+
+async def test_drop_oldest():
+    """
+    a full drop_oldest queue drops its oldest items, counts them, and keeps the receive times in step
+    """
+    queue, received_at = timed_queue("test_drop_oldest", 3, OverflowPolicy.DROP_OLDEST)
+    for i in range(5):
+        await queue.put(bytes([i]))
+
+    assert [queue.get_nowait() for _ in range(2)] == [b"\x02", b"\x03"]
+    assert [received_at.popleft() for _ in range(2)] == [2, 3]
+    assert list(received_at) == [4]
+    assert overflows("test_drop_oldest", "dropped") == 2
+    assert depth("test_drop_oldest") == 1
+
+    queue.close()
+    assert depth("test_drop_oldest") == 0
+
+
+async def test_coalesce():
+    """
+    a full coalesce queue merges new items into the newest one, which keeps the receive time of its first item
+    """
+    queue, received_at = timed_queue("test_coalesce", 2, OverflowPolicy.COALESCE)
+    for i in range(4):
+        await queue.put(bytes([i]))
+
+    assert queue.qsize() == 2
+    assert [queue.get_nowait() for _ in range(2)] == [b"\x00", b"\x01\x02\x03"]
+    assert list(received_at) == [0, 1]
+    assert overflows("test_coalesce", "coalesced") == 2
+    assert depth("test_coalesce") == 0
+
+
+def test_coalesced_audio_is_capped():
+    """
+    coalesced audio keeps only the newest bytes, and EVI audio keeps the time its oldest part was enqueued
+    """
+    older, newer = b"\x01" * MAX_COALESCED_CALLER_AUDIO_BYTES, b"\x02" * 10
+    assert coalesce_caller_audio(older, newer) == older[10:] + newer
+    assert coalesce_evi_audio((b"ab", 1.0), (b"cd", 2.0)) == (b"abcd", 1.0)
+
+
+async def test_block():
+    """
+    a full block queue makes put() wait for the consumer, and put_nowait() raise
+    """
+    queue = BoundedQueue("test_block", 1, OverflowPolicy.BLOCK)
+    await queue.put(b"a")
+    with pytest.raises(asyncio.QueueFull):
+        queue.put_nowait(b"b")
+
+    put = asyncio.create_task(queue.put(b"b"))
+    await asyncio.sleep(0)
+    assert not put.done()
+    assert queue.get_nowait() == b"a"
+    await put
+    assert queue.get_nowait() == b"b"
+    assert overflows("test_block", "dropped") == overflows("test_block", "coalesced") == 0
+
+
+def test_invalid_queues():
+    """
+    unbounded queues and coalescing without a merge function are refused
+    """
+    with pytest.raises(ValueError):
+        BoundedQueue("test_invalid", 0, OverflowPolicy.DROP_OLDEST)
+    with pytest.raises(ValueError):
+        BoundedQueue("test_invalid", 1, OverflowPolicy.COALESCE)
+
+
+def test_from_env(monkeypatch):
+    """
+    <NAME>_QUEUE_MAX and <NAME>_QUEUE_POLICY override the defaults
+    """
+    monkeypatch.setenv("TEST_ENV_QUEUE_MAX", "7")
+    monkeypatch.setenv("TEST_ENV_QUEUE_POLICY", "block")
+
+    queue = bounded_queue_from_env("test_env", 50, OverflowPolicy.DROP_OLDEST)
+
+    assert (queue.maxsize, queue.policy) == (7, OverflowPolicy.BLOCK)
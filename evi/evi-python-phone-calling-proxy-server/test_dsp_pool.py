@@ -0,0 +1,105 @@
+# run tests locally with:
+# uv run pytest test_dsp_pool.py -v
+
+import asyncio
+import io
+import os
+import signal
+import threading
+import wave
+
+import numpy as np
+import pytest
+
+from audio_processors import EviAudioProcessor
+from dsp_pool import BatchedDsp, InlineDsp, ProcessPoolDsp
+
+
+def wav_chunk(n_samples: int = 4800, seed: int = 0) -> bytes:
+    pcm = np.random.default_rng(seed).integers(-8000, 8000, n_samples, dtype=np.int16)
+    wav_bytes = io.BytesIO()
+    with wave.open(wav_bytes, "wb") as wav_file:
+        wav_file.setnchannels(1)
+        wav_file.setsampwidth(2)
+        wav_file.setframerate(48000)
+        wav_file.writeframes(pcm.tobytes())
+    return wav_bytes.getvalue()
+
+
+async def postprocess_concurrently(dsp, chunks: list[bytes]) -> list:
+    calls = [dsp.open_call() for _ in chunks]
+    return await asyncio.gather(
+        *(call.postprocess_audio(chunk) for call, chunk in zip(calls, chunks)), return_exceptions=True)
+
+
+async def test_bad_chunk_fails_only_its_call():
+    """
+    in a micro-batch, a chunk that isn't WAV fails its own call and the other calls get their audio
+    """
+    chunks = [wav_chunk(seed=0), b"not a WAV file", wav_chunk(seed=1)]
+
+    results = await postprocess_concurrently(BatchedDsp(window_ms=1), chunks)
+
+    assert isinstance(results[1], wave.Error)
+    assert results[0] == await InlineDsp().open_call().postprocess_audio(chunks[0])
+    assert results[2] == await InlineDsp().open_call().postprocess_audio(chunks[2])
+
+
+async def test_failed_batch_falls_back_to_single_chunks(monkeypatch):
+    """
+    when the batched DSP fails as a whole, each chunk is processed on its own and only the bad one fails
+    """
+    def fail(processors, evi_audio):
+        raise RuntimeError("batch failed")
+
+    monkeypatch.setattr(EviAudioProcessor, "postprocess_audio_batch", staticmethod(fail))
+    chunks = [wav_chunk(seed=0), b"not a WAV file", wav_chunk(seed=1)]
+
+    results = await postprocess_concurrently(BatchedDsp(window_ms=1), chunks)
+
+    assert isinstance(results[1], wave.Error)
+    assert results[0] == await InlineDsp().open_call().postprocess_audio(chunks[0])
+    assert results[2] == await InlineDsp().open_call().postprocess_audio(chunks[2])
+
+
+@pytest.fixture
+def process_pool():
+    dsp = ProcessPoolDsp(1)
+    yield dsp
+    dsp.shutdown()
+
+
+def test_concurrent_first_calls_start_workers_once(process_pool):
+    """
+    calls opened at the same time from several threads share one set of workers
+    """
+    calls = []
+    threads = [threading.Thread(target=lambda: calls.append(process_pool.open_call())) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(calls) == 4
+    assert len(process_pool._executors) == 1
+    assert {id(call.executor) for call in calls} == {id(process_pool._executors[0])}
+
+
+async def test_dead_worker_is_replaced(process_pool):
+    """
+    when a worker is killed, its calls carry on in a new worker instead of failing from then on
+    """
+    process_pool.start()
+    first, second = process_pool.open_call(), process_pool.open_call()
+    chunk = wav_chunk()
+    expected = await InlineDsp().open_call().postprocess_audio(chunk)
+    assert await first.postprocess_audio(chunk) == expected
+
+    os.kill(first.executor.submit(os.getpid).result(), signal.SIGKILL)
+
+    # The first call to notice replaces the worker, from fresh filter state; the other call moves to the same one
+    assert await first.postprocess_audio(chunk) == expected
+    assert await second.postprocess_audio(chunk) == expected
+    assert first.executor is second.executor is process_pool._executors[0]
+    first.close()
+    second.close()
@@ -0,0 +1,110 @@
+# run tests locally with:
+# uv run pytest test_media_codec.py -v
+
+import base64
+import json
+
+import pytest
+
+from media_codec import DECODERS, JsonDecoder, TwilioEvent, TwilioFrameEncoder, media_stream_decoder_from_env
+
+# Twilio media stream messages, with the fields the proxy doesn't use
+MESSAGES = {
+    "connected": {"event": "connected", "protocol": "Call", "version": "1.0.0"},
+    "start": {
+        "event": "start",
+        "sequenceNumber": "1",
+        "start": {
+            "accountSid": "AC123",
+            "streamSid": "MZ123",
+            "callSid": "CA123",
+            "tracks": ["inbound"],
+            "mediaFormat": {"encoding": "audio/x-mulaw", "sampleRate": 8000, "channels": 1},
+            "customParameters": {},
+        },
+        "streamSid": "MZ123",
+    },
+    "media": {
+        "event": "media",
+        "sequenceNumber": "3",
+        "media": {"track": "inbound", "chunk": "1", "timestamp": "5", "payload": "f39/fw=="},
+        "streamSid": "MZ123",
+    },
+    "mark": {"event": "mark", "sequenceNumber": "4", "streamSid": "MZ123", "mark": {"name": "playout-5"}},
+    "stop": {
+        "event": "stop",
+        "sequenceNumber": "5",
+        "stop": {"accountSid": "AC123", "callSid": "CA123"},
+        "streamSid": "MZ123",
+    },
+    "escaped": {"event": "mark", "streamSid": "MZ\"\\é", "mark": {"name": "line\nbreak"}},
+}
+
+EXPECTED = {
+    "connected": TwilioEvent("connected"),
+    "start": TwilioEvent("start", "MZ123"),
+    "media": TwilioEvent("media", "MZ123", payload="f39/fw==", timestamp="5"),
+    "mark": TwilioEvent("mark", "MZ123", mark_name="playout-5"),
+    "stop": TwilioEvent("stop", "MZ123"),
+    "escaped": TwilioEvent("mark", "MZ\"\\é", mark_name="line\nbreak"),
+}
+
+
+def decoder(name: str):
+    try:
+        return DECODERS[name]()
+    except ImportError:
+        pytest.skip(f"{name} is not installed")
+
+
+@pytest.mark.parametrize("name", DECODERS)
+@pytest.mark.parametrize("message", MESSAGES)
+def test_decoders_agree(name, message):
+    """
+    every decoder turns a Twilio message into the same TwilioEvent
+    """
+    text = json.dumps(MESSAGES[message])
+
+    assert decoder(name).decode(text) == EXPECTED[message]
+    assert JsonDecoder().decode(text) == EXPECTED[message]
+
+
+def test_decoder_from_env(monkeypatch):
+    """
+    MEDIA_CODEC picks the decoder, and by default the first one installed
+    """
+    monkeypatch.setenv("MEDIA_CODEC", "json")
+    assert media_stream_decoder_from_env().name == "json"
+
+    monkeypatch.delenv("MEDIA_CODEC")
+    installed = []
+    for decoder_class in DECODERS.values():
+        try:
+            installed.append(decoder_class().name)
+        except ImportError:
+            pass
+    assert media_stream_decoder_from_env().name == (installed + ["json"])[0]
+
+
+def test_encoder_messages():
+    """
+    the encoder's messages are the JSON Twilio expects, with the stream SID and mark names escaped
+    """
+    encoder = TwilioFrameEncoder('MZ"\\é')
+
+    assert json.loads(encoder.media(b"\x7f\xff")) == {
+        "event": "media", "streamSid": 'MZ"\\é', "media": {"payload": base64.b64encode(b"\x7f\xff").decode()}}
+    assert json.loads(encoder.mark('a"b\n')) == {"event": "mark", "streamSid": 'MZ"\\é', "mark": {"name": 'a"b\n'}}
+    assert json.loads(encoder.clear()) == {"event": "clear", "streamSid": 'MZ"\\é'}
+
+
+@pytest.mark.parametrize("name", DECODERS)
+def test_decoding_encoder_messages(name):
+    """
+    the media and mark messages the encoder builds decode back to what was encoded
+    """
+    encoder = TwilioFrameEncoder("MZ123")
+
+    media = decoder(name).decode(encoder.media(b"\x01\x02"))
+    assert (media.event, media.stream_sid, base64.b64decode(media.payload)) == ("media", "MZ123", b"\x01\x02")
+    assert decoder(name).decode(encoder.mark("playout-5")).mark_name == "playout-5"
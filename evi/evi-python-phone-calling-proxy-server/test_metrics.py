@@ -0,0 +1,48 @@
+# run tests locally with:
+# uv run pytest test_metrics.py -v
+
+from metrics import Counter, Gauge, Histogram, Registry
+
+
+def test_label_values_are_escaped():
+    """
+    backslash, double quote and newline in label values are escaped as the Prometheus text format requires
+    """
+    counter = Counter("test_total", "Test counter.", label_names=("tool", "result"))
+    counter.inc(1, 'a\\b"c\nd', "ok")
+
+    assert counter.render()[2] == 'test_total{tool="a\\\\b\\"c\\nd",result="ok"} 1.0'
+
+
+def test_help_is_escaped():
+    """
+    HELP text escapes backslash and newline, but not double quotes
+    """
+    gauge = Gauge("test_gauge", 'Line one\nline "two" \\ three')
+
+    assert gauge.render()[0] == '# HELP test_gauge Line one\\nline "two" \\\\ three'
+
+
+def test_histogram_labels_are_escaped():
+    """
+    histogram series escape their label values next to the le label
+    """
+    histogram = Histogram("test_seconds", "Test histogram.", label_names=("stage",), buckets=(0.1,))
+    histogram.observe(0.05, 'x"y')
+
+    assert histogram.render()[2:] == [
+        'test_seconds_bucket{stage="x\\"y",le="0.1"} 1',
+        'test_seconds_bucket{stage="x\\"y",le="+Inf"} 1',
+        'test_seconds_sum{stage="x\\"y"} 0.05',
+        'test_seconds_count{stage="x\\"y"} 1',
+    ]
+
+
+def test_registry_render():
+    """
+    the registry renders every metric, HELP and TYPE first, and ends with a newline
+    """
+    registry = Registry()
+    registry.register(Gauge("test_calls", "Test calls.")).set(3)
+
+    assert registry.render() == "# HELP test_calls Test calls.\n# TYPE test_calls gauge\ntest_calls 3.0\n"
@@ -0,0 +1,136 @@
+# run tests locally with:
+# uv run pytest test_tool_cache.py -v
+
+import asyncio
+
+import pytest
+
+from metrics import TOOL_CACHE_REQUESTS
+from tool_cache import AsyncTtlCache
+
+
+class Lookup:
+    """A tool function that records its calls and, when gated, waits to be released."""
+
+    def __init__(self, gated: bool = False) -> None:
+        self.calls = []
+        self.cancelled = 0
+        self.release = asyncio.Event()
+        if not gated:
+            self.release.set()
+
+    async def __call__(self, ticket_id: str) -> str:
+        self.calls.append(ticket_id)
+        try:
+            await self.release.wait()
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        if ticket_id == "bad":
+            raise ValueError("no such ticket")
+        return f"status of {ticket_id}"
+
+
+def requests(name: str) -> dict[str, float]:
+    return {result: TOOL_CACHE_REQUESTS._values.get((name, result), 0.0) for result in ("hit", "miss", "coalesced")}
+
+
+async def test_results_are_cached_until_they_expire():
+    """
+    a result is reused until its TTL runs out, and then looked up again
+    """
+    lookup = Lookup()
+    cache = AsyncTtlCache("test_ttl", lookup, ttl=0.05)
+
+    assert await cache("1") == await cache("1") == "status of 1"
+    assert lookup.calls == ["1"]
+    await asyncio.sleep(0.06)
+    assert await cache("1") == "status of 1"
+    assert lookup.calls == ["1", "1"]
+    assert requests("test_ttl") == {"hit": 1, "miss": 2, "coalesced": 0}
+
+
+async def test_least_recently_used_is_evicted():
+    """
+    beyond maxsize, the least recently used result is evicted
+    """
+    lookup = Lookup()
+    cache = AsyncTtlCache("test_lru", lookup, ttl=60, maxsize=2)
+    for ticket_id in ["1", "2", "1", "3", "1", "2"]:
+        await cache(ticket_id)
+
+    assert lookup.calls == ["1", "2", "3", "2"]
+
+
+async def test_concurrent_callers_share_one_call():
+    """
+    concurrent lookups of the same ticket share a single call to the tool
+    """
+    lookup = Lookup(gated=True)
+    cache = AsyncTtlCache("test_single_flight", lookup, ttl=60)
+    callers = [asyncio.create_task(cache("1")) for _ in range(3)]
+    await asyncio.sleep(0.01)
+    lookup.release.set()
+
+    assert await asyncio.gather(*callers) == ["status of 1"] * 3
+    assert lookup.calls == ["1"]
+    assert requests("test_single_flight") == {"hit": 0, "miss": 1, "coalesced": 2}
+
+
+async def test_cancelled_waiter_leaves_the_call_to_the_others():
+    """
+    a caller that is cancelled (e.g. its tool call timed out) doesn't cancel the call another caller is waiting for
+    """
+    lookup = Lookup(gated=True)
+    cache = AsyncTtlCache("test_cancelled_waiter", lookup, ttl=60)
+    first, second = asyncio.create_task(cache("1")), asyncio.create_task(cache("1"))
+    await asyncio.sleep(0.01)
+
+    first.cancel()
+    await asyncio.sleep(0.01)
+    lookup.release.set()
+
+    assert await second == "status of 1"
+    with pytest.raises(asyncio.CancelledError):
+        await first
+    assert lookup.cancelled == 0
+    # The result was cached for later callers all the same
+    assert await cache("1") == "status of 1"
+    assert lookup.calls == ["1"]
+
+
+async def test_call_is_cancelled_when_every_waiter_is():
+    """
+    once every caller has been cancelled, the call is cancelled too and the next caller starts a new one
+    """
+    lookup = Lookup(gated=True)
+    cache = AsyncTtlCache("test_all_cancelled", lookup, ttl=60)
+    callers = [asyncio.create_task(cache("1")) for _ in range(2)]
+    await asyncio.sleep(0.01)
+
+    for caller in callers:
+        caller.cancel()
+    await asyncio.gather(*callers, return_exceptions=True)
+    await asyncio.sleep(0.01)
+    assert lookup.cancelled == 1
+
+    lookup.release.set()
+    assert await cache("1") == "status of 1"
+    assert lookup.calls == ["1", "1"]
+
+
+async def test_errors_are_shared_but_not_cached():
+    """
+    an error is raised to every caller waiting for the call, and the next lookup tries again
+    """
+    lookup = Lookup(gated=True)
+    cache = AsyncTtlCache("test_errors", lookup, ttl=60)
+    callers = [asyncio.create_task(cache("bad")) for _ in range(2)]
+    await asyncio.sleep(0.01)
+    lookup.release.set()
+
+    results = await asyncio.gather(*callers, return_exceptions=True)
+    assert all(isinstance(result, ValueError) for result in results)
+    with pytest.raises(ValueError):
+        await cache("bad")
+    assert lookup.calls == ["bad", "bad"]
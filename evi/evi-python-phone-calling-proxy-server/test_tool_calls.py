@@ -0,0 +1,129 @@
+# run tests locally with:
+# uv run pytest test_tool_calls.py -v
+
+import asyncio
+import json
+
+from hume.empathic_voice import ToolCallMessage, ToolErrorMessage, ToolResponseMessage
+
+from metrics import TOOL_CALLS
+from tool_calls import Tool, ToolCallRunner
+
+
+def tool_call(name: str, call_id: str, **parameters) -> ToolCallMessage:
+    return ToolCallMessage(
+        name=name, parameters=json.dumps(parameters), tool_call_id=call_id, response_required=True,
+        tool_type="function")
+
+
+def calls_counted(tool: str, result: str) -> float:
+    return TOOL_CALLS._values.get((tool, result), 0.0)
+
+
+class Tools:
+    """Test tools, with the messages sent back to EVI."""
+
+    def __init__(self) -> None:
+        self.sent = []
+        self.release = asyncio.Event()
+        self.cancelled = []
+
+    async def send(self, message) -> None:
+        self.sent.append(message)
+
+    async def echo(self, parameters: dict) -> str:
+        return parameters["text"]
+
+    async def fail(self, parameters: dict) -> str:
+        raise ValueError("no such ticket")
+
+    async def wait(self, parameters: dict) -> str:
+        try:
+            await self.release.wait()
+        except asyncio.CancelledError:
+            self.cancelled.append(parameters["text"])
+            raise
+        return parameters["text"]
+
+    def runner(self, max_concurrent: int = 4, timeout: float = 1.0) -> ToolCallRunner:
+        tools = {
+            "test_echo": Tool(self.echo, timeout),
+            "test_fail": Tool(self.fail, timeout),
+            "test_wait": Tool(self.wait, timeout),
+        }
+        return ToolCallRunner(tools, self.send, max_concurrent=max_concurrent)
+
+
+async def settle(runner: ToolCallRunner) -> None:
+    await asyncio.gather(*runner._tasks)
+
+
+async def test_results_in_completion_order():
+    """
+    each tool call's response is sent as soon as it finishes, without waiting for the calls before it
+    """
+    tools = Tools()
+    runner = tools.runner()
+    runner.submit(tool_call("test_wait", "1", text="slow"))
+    runner.submit(tool_call("test_echo", "2", text="fast"))
+    await asyncio.sleep(0.01)
+    tools.release.set()
+    await settle(runner)
+
+    assert [(m.tool_call_id, m.content) for m in tools.sent] == [("2", "fast"), ("1", "slow")]
+    assert all(isinstance(m, ToolResponseMessage) for m in tools.sent)
+
+
+async def test_errors_and_unknown_tools():
+    """
+    a failing tool and a tool that doesn't exist are answered with errors, counted by outcome
+    """
+    tools = Tools()
+    runner = tools.runner()
+    errors_before, unknown_before = calls_counted("test_fail", "error"), calls_counted("unknown", "unknown")
+    runner.submit(tool_call("test_fail", "1"))
+    runner.submit(tool_call("no_such_tool", "2"))
+    await settle(runner)
+
+    sent = {m.tool_call_id: m for m in tools.sent}
+    assert isinstance(sent["1"], ToolErrorMessage) and sent["1"].content == "no such ticket"
+    assert isinstance(sent["2"], ToolErrorMessage) and sent["2"].content == "Unknown tool: no_such_tool"
+    assert calls_counted("test_fail", "error") == errors_before + 1
+    assert calls_counted("unknown", "unknown") == unknown_before + 1
+    assert ("no_such_tool", "unknown") not in TOOL_CALLS._values
+
+
+async def test_timeout_includes_waiting_for_a_slot():
+    """
+    a tool call times out with an error for EVI, including one that is still waiting for a free slot
+    """
+    tools = Tools()
+    runner = tools.runner(max_concurrent=1, timeout=0.05)
+    timeouts_before = calls_counted("test_wait", "timeout") + calls_counted("test_echo", "timeout")
+    runner.submit(tool_call("test_wait", "1", text="stuck"))
+    runner.submit(tool_call("test_echo", "2", text="queued"))
+    await settle(runner)
+
+    assert sorted(m.tool_call_id for m in tools.sent) == ["1", "2"]
+    assert all(isinstance(m, ToolErrorMessage) and m.error == "Tool timed out" for m in tools.sent)
+    assert tools.cancelled == ["stuck"]
+    assert calls_counted("test_wait", "timeout") + calls_counted("test_echo", "timeout") == timeouts_before + 2
+
+
+async def test_close_cancels_running_calls():
+    """
+    close() cancels the tool calls still running and sends EVI nothing for them
+    """
+    tools = Tools()
+    runner = tools.runner()
+    cancelled_before = calls_counted("test_wait", "cancelled")
+    runner.submit(tool_call("test_wait", "1", text="a"))
+    runner.submit(tool_call("test_wait", "2", text="b"))
+    await asyncio.sleep(0.01)
+
+    await runner.close()
+
+    assert sorted(tools.cancelled) == ["a", "b"]
+    assert tools.sent == []
+    assert not runner._tasks
+    assert calls_counted("test_wait", "cancelled") == cancelled_before + 2
@@ -0,0 +1,108 @@
+# run tests locally with:
+# uv run pytest test_twilio_playout.py -v
+
+import asyncio
+import base64
+import json
+
+import pytest
+
+from audio_processors.mulaw import ULAW_SILENCE
+from twilio_playout import TwilioPlayout
+
+FRAME = TwilioPlayout.FRAME_BYTES
+
+
+class FakeTwilioSocket:
+    def __init__(self) -> None:
+        self.messages: list[dict] = []
+
+    async def send(self, message: str) -> None:
+        self.messages.append(json.loads(message))
+
+    def media(self) -> list[bytes]:
+        return [base64.b64decode(m["media"]["payload"]) for m in self.messages if m["event"] == "media"]
+
+    def events(self) -> list[str]:
+        return [m["event"] for m in self.messages]
+
+
+@pytest.fixture
+async def playout():
+    ws = FakeTwilioSocket()
+    playout = TwilioPlayout(ws, asyncio.Queue(), lead_frames=1, mark_every_frames=5, max_buffered_frames=10)
+    # 1 ms frames, to keep the tests short
+    playout.FRAME_SECONDS = 0.001
+    playout.stream_sid = "MZtest"
+    task = asyncio.create_task(playout.run())
+    yield playout
+    task.cancel()
+
+
+async def wait_for_frames(playout: TwilioPlayout, frames: int) -> None:
+    async with asyncio.timeout(2):
+        while playout.frames_sent < frames:
+            await asyncio.sleep(0.001)
+    # Give it the chance to send more than it should
+    await asyncio.sleep(0.05)
+
+
+async def test_sending_waits_for_marks(playout):
+    """
+    no more than max_buffered_frames are sent ahead of the last mark echoed back
+    """
+    await playout.enqueue(bytes(30 * FRAME))
+    await wait_for_frames(playout, 10)
+    assert playout.frames_sent == 10
+    assert [m["mark"]["name"] for m in playout.ws.messages if m["event"] == "mark"] == ["playout-5", "playout-10"]
+
+    playout.on_mark("playout-5")
+    await wait_for_frames(playout, 15)
+    assert playout.frames_sent == 15
+    assert playout.frames_buffered == 10
+
+
+async def test_foreign_marks_are_ignored(playout):
+    """
+    marks the playout didn't send, with other names or beyond the frames sent, don't count as played audio
+    """
+    await playout.enqueue(bytes(12 * FRAME))
+    await wait_for_frames(playout, 10)
+
+    for name in [None, "", "greeting", "playout-", "playout-x", "playout-99", "playout--5", "5"]:
+        playout.on_mark(name)
+    assert playout.frames_played == 0
+    assert playout.frames_sent == 10
+
+
+async def test_interrupt_drops_queued_audio(playout):
+    """
+    interrupt() drops the audio not sent yet, tells Twilio to clear its buffer, and later audio plays again
+    """
+    await playout.enqueue(bytes(20 * FRAME))
+    await playout.enqueue(bytes(20 * FRAME))
+    await wait_for_frames(playout, 10)
+
+    await playout.interrupt()
+    assert playout.queue.empty()
+    await asyncio.sleep(0.05)
+    assert playout.ws.events()[-1] == "clear"
+    assert len(playout.ws.media()) == 10
+
+    await playout.enqueue(b"\x01" * (2 * FRAME))
+    await wait_for_frames(playout, 12)
+    assert playout.ws.media()[10:] == [b"\x01" * FRAME] * 2
+
+
+async def test_partial_frame_is_completed_by_next_chunk(playout):
+    """
+    a chunk that ends mid-frame is completed by the next chunk, and only padded with silence if none follows
+    """
+    await playout.enqueue(b"\x01" * (FRAME + 100))
+    await playout.enqueue(b"\x02" * 60)
+    await wait_for_frames(playout, 2)
+    assert playout.ws.media() == [b"\x01" * FRAME, b"\x01" * 100 + b"\x02" * 60]
+
+    await playout.enqueue(b"\x03" * 100)
+    await wait_for_frames(playout, 3)
+    assert playout.ws.media()[2] == b"\x03" * 100 + bytes([ULAW_SILENCE]) * 60
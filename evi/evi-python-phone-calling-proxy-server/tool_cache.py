@@ -0,0 +1,111 @@
+"""
+A process-wide cache in front of async tool functions, since callers tend to ask about the same ticket again, within
+a call and across calls.
+
+Results are kept for `ttl` seconds, at most `maxsize` of them, evicting the least recently used. Concurrent calls
+with the same arguments share one call to the tool (single-flight) instead of each starting their own, and a shared
+call is only cancelled once every caller waiting for it has gone away. Errors are passed to every waiting caller and
+not cached.
+
+The Flask server runs each call on its own event loop and thread, so the cache is guarded by a lock and calls are
+only shared between callers on the same event loop.
+"""
+import asyncio
+import dataclasses
+import functools
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Generic, Hashable, TypeVar
+
+from metrics import TOOL_CACHE_REQUESTS
+
+T = TypeVar("T")
+
+
+@dataclasses.dataclass
+class _Flight:
+    task: "asyncio.Task"
+    # Callers awaiting the task
+    waiters: int = 0
+
+
+class AsyncTtlCache(Generic[T]):
+    """Wraps the async function `func`; call it like `func`. Arguments must be hashable."""
+
+    def __init__(self, name: str, func: Callable[..., Awaitable[T]], ttl: float, maxsize: int = 1024) -> None:
+        self.name = name
+        self.func = func
+        self.ttl = ttl
+        self.maxsize = maxsize
+        # arguments -> (monotonic expiry time, result), least recently used first
+        self._entries: OrderedDict[Hashable, tuple[float, T]] = OrderedDict()
+        self._in_flight: dict[tuple[asyncio.AbstractEventLoop, Hashable], _Flight] = {}
+        self._lock = threading.Lock()
+        functools.update_wrapper(self, func)
+
+    async def __call__(self, *args: Any, **kwargs: Any) -> T:
+        key = (args, tuple(sorted(kwargs.items())))
+        flight_key = (asyncio.get_running_loop(), key)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > time.monotonic():
+                self._entries.move_to_end(key)
+                TOOL_CACHE_REQUESTS.inc(1, self.name, "hit")
+                return entry[1]
+
+            flight = self._in_flight.get(flight_key)
+            if flight is None:
+                flight = self._in_flight[flight_key] = _Flight(
+                    asyncio.create_task(self._fill(flight_key, key, args, kwargs)))
+                TOOL_CACHE_REQUESTS.inc(1, self.name, "miss")
+            else:
+                TOOL_CACHE_REQUESTS.inc(1, self.name, "coalesced")
+            flight.waiters += 1
+
+        try:
+            # One caller being cancelled (e.g. its tool call timing out) mustn't cancel the call for the others
+            return await asyncio.shield(flight.task)
+        finally:
+            with self._lock:
+                flight.waiters -= 1
+                if flight.waiters == 0 and not flight.task.done():
+                    # Nobody is waiting any more; the next caller starts over
+                    flight.task.cancel()
+                    if self._in_flight.get(flight_key) is flight:
+                        del self._in_flight[flight_key]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    async def _fill(self, flight_key: tuple[asyncio.AbstractEventLoop, Hashable], key: Hashable, args, kwargs) -> T:
+        with self._lock:
+            flight = self._in_flight.get(flight_key)
+        try:
+            value = await self.func(*args, **kwargs)
+        except BaseException:
+            with self._lock:
+                if self._in_flight.get(flight_key) is flight:
+                    del self._in_flight[flight_key]
+            raise
+
+        with self._lock:
+            # Stored and taken out of flight together, so that no caller in between starts another call
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+            if self._in_flight.get(flight_key) is flight:
+                del self._in_flight[flight_key]
+        return value
+
+
+def async_ttl_cache(
+    name: str, ttl: float, maxsize: int = 1024
+) -> Callable[[Callable[..., Awaitable[T]]], AsyncTtlCache[T]]:
+    """Decorator for AsyncTtlCache; `name` labels the cache's requests in phone_proxy_tool_cache_requests_total."""
+    def decorator(func: Callable[..., Awaitable[T]]) -> AsyncTtlCache[T]:
+        return AsyncTtlCache(name, func, ttl, maxsize)
+
+    return decorator
@@ -0,0 +1,117 @@
+"""
+Runs EVI's tool calls next to the call's audio instead of inside the loop that receives EVI's messages, so that a
+slow tool doesn't hold up the audio_output messages queued behind its tool_call.
+
+Each tool call runs in its own task and its ToolResponseMessage or ToolErrorMessage is sent as soon as it finishes,
+in whatever order the calls complete. At most `max_concurrent` tools run at once per call, each under its tool's
+timeout (which includes waiting for a slot), and whatever is still running when the call ends is cancelled.
+"""
+import asyncio
+import json
+import os
+import time
+from typing import Any, Awaitable, Callable, NamedTuple
+
+from hume.empathic_voice import ToolErrorMessage, ToolResponseMessage
+from hume.empathic_voice.types import SubscribeEvent
+
+from metrics import TOOL_CALL_SECONDS, TOOL_CALLS
+
+
+class Tool(NamedTuple):
+    # Takes the tool call's parameters, parsed from JSON, and returns the content of the response
+    run: Callable[[dict[str, Any]], Awaitable[str]]
+    # Seconds before the tool call is abandoned and EVI gets an error instead
+    timeout: float
+
+
+class ToolCallRunner:
+    """Runs the tool calls of one EVI chat. `send` publishes a message on the chat, e.g. its socket's send_publish."""
+
+    def __init__(
+        self,
+        tools: dict[str, Tool],
+        send: Callable[[Any], Awaitable[None]],
+        max_concurrent: int = 4,
+    ) -> None:
+        self.tools = tools
+        self.send = send
+        self._slots = asyncio.Semaphore(max_concurrent)
+        self._tasks: set[asyncio.Task] = set()
+
+    def submit(self, message: SubscribeEvent) -> None:
+        """Starts running a tool_call message and returns right away."""
+        task = asyncio.create_task(self._run(message))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def close(self) -> None:
+        """Cancels the tool calls still running; EVI isn't answered, the chat is going away."""
+        tasks = list(self._tasks)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def _run(self, message: SubscribeEvent) -> None:
+        tool_name = message.name
+        call_id = message.tool_call_id
+        print(f"🔧 Tool call: {tool_name}")
+
+        tool = self.tools.get(tool_name)
+        if tool is None:
+            # Tool names come from EVI, so unknown ones share one label rather than adding a series each
+            TOOL_CALLS.inc(1, "unknown", "unknown")
+            await self._send(ToolErrorMessage(
+                tool_call_id=call_id,
+                error="Tool not found",
+                content=f"Unknown tool: {tool_name}"
+            ))
+            print(f"❌ Unknown tool: {tool_name}")
+            return
+
+        started = time.monotonic()
+        try:
+            tool_parameters = json.loads(message.parameters)
+            print(f"📋 Tool parameters: {tool_parameters}")
+            async with asyncio.timeout(tool.timeout):
+                async with self._slots:
+                    result = await tool.run(tool_parameters)
+        except asyncio.CancelledError:
+            TOOL_CALLS.inc(1, tool_name, "cancelled")
+            raise
+        except TimeoutError:
+            outcome = "timeout"
+            response = ToolErrorMessage(
+                tool_call_id=call_id,
+                error="Tool timed out",
+                content=f"{tool_name} did not finish within {tool.timeout:g} seconds"
+            )
+            print(f"⌛ Tool timed out: {tool_name}")
+        except Exception as e:
+            outcome = "error"
+            response = ToolErrorMessage(
+                tool_call_id=call_id,
+                error="Tool execution failed",
+                content=str(e)
+            )
+            print(f"❌ Tool error: {e}")
+        else:
+            outcome = "ok"
+            response = ToolResponseMessage(tool_call_id=call_id, content=result)
+            print(f"✅ Tool result: {result}")
+
+        TOOL_CALL_SECONDS.observe(time.monotonic() - started, tool_name)
+        TOOL_CALLS.inc(1, tool_name, outcome)
+        await self._send(response)
+
+    async def _send(self, message: Any) -> None:
+        try:
+            await self.send(message)
+        except Exception as e:
+            print(f"❌ Failed to send tool result: {e}")
+
+
+def tool_call_runner_from_env(tools: dict[str, Tool], send: Callable[[Any], Awaitable[None]]) -> ToolCallRunner:
+    """TOOL_CALL_CONCURRENCY (default 4) is how many tool calls of one call run at once."""
+    max_concurrent = int(os.environ.get("TOOL_CALL_CONCURRENCY", "4"))
+    return ToolCallRunner(tools, send, max_concurrent=max_concurrent)
@@ -1,6 +1,25 @@
 # This is a mock function for the ticket status lookup that returns a hardcoded string
 # Rewrite it with you custom logic based on this example: https://github.com/HumeAI/hume-api-examples/blob/main/evi/evi-python-function-calling/main.py
+from typing import Any
 
+from tool_cache import async_ttl_cache
+from tool_calls import Tool
 
+
+# Ticket statuses change, so lookups are only reused for 30 seconds
+@async_ttl_cache("supportAssistant", ttl=30.0, maxsize=1024)
 async def supportAssistant(ticket_id: str) -> str:
     return f"Ticket with ID {ticket_id} has changed status from Pending to Resolved"
+
+
+async def run_support_assistant(tool_parameters: dict[str, Any]) -> str:
+    ticket_id = tool_parameters.get("ticket_id", "")
+    if not ticket_id:
+        raise ValueError("ticket_id parameter is required")
+    return await supportAssistant(ticket_id)
+
+
+# The tools EVI can call, by name, with how long each may take before EVI is told it failed
+TOOLS = {
+    "supportAssistant": Tool(run_support_assistant, timeout=10.0),
+}
@@ -0,0 +1,159 @@
+import asyncio
+import time
+from asyncio import Queue
+from typing import ClassVar, Optional
+
+from audio_processors.mulaw import ULAW_SILENCE
+from media_codec import TwilioFrameEncoder
+from metrics import CallLatency
+
+
+class TwilioPlayout:
+    """
+    Sends EVI audio to Twilio as 20 ms μ-law frames, paced on a monotonic clock so that Twilio only ever holds a
+    few frames that haven't been played yet. Twilio echoes back the mark events sent between frames once playback
+    reaches them, which tells us how much audio the caller has actually heard; when that falls more than
+    `max_buffered_frames` behind what was sent (Twilio playing slower than our clock, or the connection backing up),
+    sending waits for the marks to catch up. On interrupt() the not yet sent audio is dropped and Twilio is told to
+    clear what it has buffered, so barge-in takes effect within a frame.
+
+    A chunk that doesn't end on a frame boundary leaves a partial frame, which is held back until the next chunk
+    completes it. Only if no audio has arrived by the time Twilio would run out of audio to play, i.e. at the end of
+    a reply, is it padded with silence and sent.
+
+    Audio is added with enqueue(); queue items are (μ-law audio, monotonic time it was enqueued). With a bounded
+    queue, enqueue() waits or the queue drops audio when it is full, depending on the queue's overflow policy.
+    """
+    queue: "Queue[tuple[bytes, float]]"
+    frames_sent: int
+    frames_played: int
+    # Twilio plays 8 kHz μ-law, 160 bytes per 20 ms frame
+    FRAME_BYTES: ClassVar[int] = 160
+    FRAME_SECONDS: ClassVar[float] = 0.02
+    # Our marks are named this followed by the number of frames sent before them
+    MARK_PREFIX: ClassVar[str] = "playout-"
+
+    def __init__(
+        self,
+        ws,
+        queue: "Queue[tuple[bytes, float]]",
+        lead_frames: int = 3,
+        mark_every_frames: int = 5,
+        max_buffered_frames: int = 50,
+        latency: Optional[CallLatency] = None,
+    ) -> None:
+        self.ws = ws
+        self.queue = queue
+        self.latency = latency
+        self._stream_sid: Optional[str] = None
+        self._encoder: Optional[TwilioFrameEncoder] = None
+        # how far ahead of real time we let Twilio's buffer run, to absorb network jitter
+        self.lead_frames = lead_frames
+        self.mark_every_frames = mark_every_frames
+        # how far the echoed marks may lag behind the frames sent, which also has to cover the round trip
+        self.max_buffered_frames = max_buffered_frames
+        self.frames_sent = 0
+        self.frames_played = 0
+        self._mark_received = asyncio.Event()
+        self._remainder = b""
+        self._next_frame_time = 0.0
+        # bumped by interrupt(), so frames of an interrupted chunk that are already being sent get dropped
+        self._generation = 0
+
+    @property
+    def stream_sid(self) -> Optional[str]:
+        return self._stream_sid
+
+    @stream_sid.setter
+    def stream_sid(self, stream_sid: Optional[str]) -> None:
+        # The messages for a stream are built from templates with its SID filled in
+        self._stream_sid = stream_sid
+        self._encoder = TwilioFrameEncoder(stream_sid) if stream_sid else None
+
+    @property
+    def frames_buffered(self) -> int:
+        """Frames sent to Twilio that the caller hasn't heard yet."""
+        return self.frames_sent - self.frames_played
+
+    async def enqueue(self, audio: bytes) -> None:
+        await self.queue.put((audio, time.monotonic()))
+
+    async def run(self) -> None:
+        while True:
+            if self._remainder and self.queue.empty():
+                # Wait for the audio that completes this partial frame until Twilio has played everything before it
+                try:
+                    chunk, enqueued_at = await asyncio.wait_for(
+                        self.queue.get(), max(self._next_frame_time - time.monotonic(), 0))
+                except asyncio.TimeoutError:
+                    if self._remainder:
+                        frame = self._remainder.ljust(self.FRAME_BYTES, bytes([ULAW_SILENCE]))
+                        self._remainder = b""
+                        await self._send_frame(frame, self._generation)
+                    continue
+            else:
+                chunk, enqueued_at = await self.queue.get()
+            generation = self._generation
+            audio = memoryview(self._remainder + chunk)
+            n_frames = len(audio) // self.FRAME_BYTES
+            for i in range(n_frames):
+                frame = audio[i * self.FRAME_BYTES: (i + 1) * self.FRAME_BYTES]
+                if not await self._send_frame(frame, generation):
+                    break
+                if i == 0 and self.latency is not None:
+                    self.latency.observe(CallLatency.PLAYOUT_WAIT, time.monotonic() - enqueued_at)
+            else:
+                self._remainder = bytes(audio[n_frames * self.FRAME_BYTES:])
+
+    def on_mark(self, name: Optional[str]) -> None:
+        """Handles a Twilio mark event: the caller has heard everything up to that mark. Other marks are ignored."""
+        if not name or not name.startswith(self.MARK_PREFIX):
+            return
+        try:
+            frames = int(name[len(self.MARK_PREFIX):])
+        except ValueError:
+            return
+        if not 0 < frames <= self.frames_sent:
+            return
+        self.frames_played = max(self.frames_played, frames)
+        self._mark_received.set()
+
+    async def interrupt(self) -> None:
+        """Drops all audio that hasn't been played yet, here and in Twilio's buffer."""
+        self._generation += 1
+        self._remainder = b""
+        while not self.queue.empty():
+            self.queue.get_nowait()
+
+        self.frames_played = self.frames_sent
+        self._mark_received.set()
+        self._next_frame_time = 0.0
+        if self._encoder is not None:
+            await self.ws.send(self._encoder.clear())
+
+    async def _send_frame(self, frame: memoryview, generation: int) -> bool:
+        # Mark-based flow control: don't run further ahead of what the caller has heard
+        while self.frames_buffered >= self.max_buffered_frames and generation == self._generation:
+            self._mark_received.clear()
+            await self._mark_received.wait()
+
+        now = time.monotonic()
+        # After an idle period, restart the clock instead of bursting to catch up
+        self._next_frame_time = max(self._next_frame_time, now)
+        delay = self._next_frame_time - self.lead_frames * self.FRAME_SECONDS - now
+        if delay > 0:
+            await asyncio.sleep(delay)
+        if generation != self._generation or self._encoder is None:
+            return False
+
+        send_started = time.monotonic()
+        await self.ws.send(self._encoder.media(frame))
+        if self.latency is not None:
+            self.latency.observe(CallLatency.TWILIO_SEND, time.monotonic() - send_started)
+            self.latency.assistant_audio_sent(send_started)
+        self._next_frame_time += self.FRAME_SECONDS
+        self.frames_sent += 1
+
+        if self.frames_sent % self.mark_every_frames == 0:
+            await self.ws.send(self._encoder.mark(f"{self.MARK_PREFIX}{self.frames_sent}"))
+        return True
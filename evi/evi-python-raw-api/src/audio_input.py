@@ -0,0 +1,54 @@
+# audio_input.py
+
+import binascii
+import io
+import wave
+
+
+class AudioInputEncoder:
+    """
+    Builds the audio_input messages for one WebSocket connection from raw PCM chunks.
+
+    EVI takes a WAV stream: a header once, then raw PCM. The header is built once and sent in front of the first
+    chunk; every other chunk is base64-encoded straight from the captured buffer into a JSON string template, without
+    going through a WAV/RAW writer or json.dumps. Messages stay strings, since EVI expects text frames.
+    """
+
+    # Everything in the message but the base64 data, which never needs escaping in JSON
+    MESSAGE_PREFIX = '{"type":"audio_input","data":"'
+    MESSAGE_SUFFIX = '"}'
+
+    def __init__(self, sample_rate: int, sample_width: int, num_channels: int):
+        """
+        Initialize the encoder for PCM in the given format.
+
+        Args:
+            sample_rate (int): The sample rate of the audio data.
+            sample_width (int): The sample width of the audio data, in bytes.
+            num_channels (int): The number of audio channels.
+        """
+        header_buffer = io.BytesIO()
+        with wave.open(header_buffer, "wb") as wf:
+            wf.setnchannels(num_channels)
+            wf.setsampwidth(sample_width)
+            wf.setframerate(sample_rate)
+            wf.writeframes(b"")
+        self.header = header_buffer.getvalue()
+        self.headers_sent = False
+
+    def encode(self, pcm) -> str:
+        """
+        Encode a chunk of PCM as an audio_input message, with the WAV header in front of the first one.
+
+        Args:
+            pcm (bytes-like): Raw PCM in the encoder's format.
+
+        Returns:
+            str: The JSON message.
+        """
+        if not self.headers_sent:
+            # The only chunk that is copied
+            pcm = self.header + bytes(pcm)
+            self.headers_sent = True
+        encoded = binascii.b2a_base64(pcm, newline=False).decode("ascii")
+        return self.MESSAGE_PREFIX + encoded + self.MESSAGE_SUFFIX
@@ -0,0 +1,292 @@
+# capture.py
+
+import asyncio
+import logging
+from collections import deque
+from math import gcd
+from typing import Optional
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+from pyaudio import PyAudio, Stream as PyAudioStream, paComplete, paContinue, paInputOverflow, paInt16
+
+logger = logging.getLogger(__name__)
+
+
+class CapturePreprocessor:
+    """
+    Turns microphone chunks into the audio sent to EVI: 16-bit mono PCM at a target sample rate (16 kHz by default),
+    which is plenty for speech and a fraction of the samples of a 44.1 or 48 kHz microphone to encode and upload.
+
+    Stereo is downmixed by averaging the channels in 32-bit integers, so loud samples can't wrap around. Resampling
+    is a streaming polyphase FIR filter: for each output sample only the taps of its filter phase are applied to the
+    input samples it needs, and the last input samples of each chunk are kept for the next one, so there are no
+    clicks at chunk boundaries. Buffers are reused from one chunk to the next.
+    """
+
+    # Kaiser window beta and filter half length in multiples of max(up, down), as in scipy.signal.resample_poly
+    KAISER_BETA = 5.0
+    HALF_LENGTH_FACTOR = 10
+
+    def __init__(self, sample_rate: int, num_channels: int, target_sample_rate: int = 16000):
+        """
+        Initialize the preprocessor for the given microphone format.
+
+        Args:
+            sample_rate (int): The sample rate of the microphone.
+            num_channels (int): The number of microphone channels, 1 or 2.
+            target_sample_rate (int, optional): The sample rate to send at. Defaults to 16000.
+        """
+        self.sample_rate = sample_rate
+        self.num_channels = num_channels
+        self.target_sample_rate = target_sample_rate
+
+        divisor = gcd(sample_rate, target_sample_rate)
+        self.up = target_sample_rate // divisor
+        self.down = sample_rate // divisor
+        self._phases = self._design_phases() if self.up != self.down else None
+        # Input samples consumed and output samples produced so far, which give each output sample its phase
+        self._consumed = 0
+        self._produced = 0
+        # The last n_taps - 1 input samples, followed by the current chunk
+        n_taps = self._phases.shape[1] if self._phases is not None else 1
+        self._input = np.zeros(n_taps - 1, dtype=np.float32)
+        self._mono = np.empty(0, dtype=np.int32)
+        self._output = np.empty(0, dtype=np.int16)
+
+    def process(self, data: bytes) -> memoryview:
+        """
+        Downmix and resample a chunk of 16-bit PCM from the microphone.
+
+        Args:
+            data (bytes): Interleaved 16-bit PCM in the microphone's format.
+
+        Returns:
+            memoryview: 16-bit mono PCM at the target sample rate, valid until the next call.
+        """
+        samples = np.frombuffer(data, dtype=np.int16)
+        if self.num_channels == 2:
+            stereo = samples.reshape(-1, 2)
+            if len(self._mono) != len(stereo):
+                self._mono = np.empty(len(stereo), dtype=np.int32)
+            # The sum of two int16 samples needs 17 bits; halving it brings it back into int16 range
+            np.add(stereo[:, 0], stereo[:, 1], out=self._mono, dtype=np.int32)
+            np.right_shift(self._mono, 1, out=self._mono)
+            mono = self._mono
+        else:
+            mono = samples
+
+        if self._phases is None:
+            return memoryview(mono.astype(np.int16, copy=False)).cast("B")
+        return memoryview(self._resample(mono)).cast("B")
+
+    def _design_phases(self) -> np.ndarray:
+        """
+        Design the anti-aliasing low-pass filter and split it into its polyphase components.
+
+        Returns:
+            np.ndarray: One row per phase, with the taps of that phase in the order they meet the input window.
+        """
+        factor = max(self.up, self.down)
+        half_length = self.HALF_LENGTH_FACTOR * factor
+        n = np.arange(2 * half_length + 1) - half_length
+        # Cut off at the lower of the two Nyquist frequencies, at the upsampled rate; gain `up` makes up for the
+        # zeros that upsampling inserts
+        taps = np.sinc(n / factor) * np.kaiser(len(n), self.KAISER_BETA)
+        taps *= self.up / taps.sum()
+
+        n_taps_per_phase = -(-len(taps) // self.up)
+        padded = np.zeros(n_taps_per_phase * self.up)
+        padded[:len(taps)] = taps
+        # Phase p holds taps p, p + up, p + 2 up, ...; reversed, to line up with windows of increasing time
+        return np.ascontiguousarray(padded.reshape(n_taps_per_phase, self.up).T[:, ::-1], dtype=np.float32)
+
+    def _resample(self, mono: np.ndarray) -> np.ndarray:
+        if not len(mono):
+            return self._output[:0]
+        n_taps = self._phases.shape[1]
+        history = n_taps - 1
+        if len(self._input) != history + len(mono):
+            # The previous call already moved its last input samples to the front
+            carried = self._input[:history].copy()
+            self._input = np.empty(history + len(mono), dtype=np.float32)
+            self._input[:history] = carried
+        self._input[history:] = mono
+
+        # Output sample k is the filter's output at upsampled position k * down: phase k * down % up of the filter
+        # over the input samples up to k * down // up, which must all have arrived
+        end = ((self._consumed + len(mono)) * self.up - 1) // self.down + 1
+        positions = np.arange(self._produced, end, dtype=np.int64) * self.down
+        rows = positions // self.up - self._consumed
+        windows = sliding_window_view(self._input, n_taps)
+        if not len(rows):
+            # Upsampling by less than a sample per chunk, e.g. from a 1-sample chunk
+            resampled = np.empty(0, dtype=np.float32)
+        elif self.up == 1:
+            # Integer decimation: a single phase, and evenly spaced windows that can be strided over without copying
+            resampled = windows[rows[0]::self.down][:len(rows)] @ self._phases[0]
+        else:
+            resampled = np.einsum("ij,ij->i", windows[rows], self._phases[positions % self.up])
+
+        if len(self._output) != len(resampled):
+            self._output = np.empty(len(resampled), dtype=np.int16)
+        np.clip(np.rint(resampled, out=resampled), -32768, 32767, out=resampled)
+        self._output[:] = resampled
+
+        self._input[:history] = self._input[len(self._input) - history:]
+        self._consumed += len(mono)
+        self._produced = end
+        return self._output
+
+
+class CapturedAudioBuffer:
+    """
+    A bounded FIFO of captured audio chunks on the event loop: the capture side puts chunks in without ever
+    waiting, and one consumer awaits them. When it is full the oldest chunk is dropped, and counted.
+
+    Attributes:
+        dropped_chunks (int): Chunks dropped because the buffer was full.
+    """
+
+    def __init__(self, max_chunks: int):
+        """
+        Initialize an empty buffer.
+
+        Args:
+            max_chunks (int): The most chunks the buffer holds.
+        """
+        self.dropped_chunks = 0
+        self._chunks = deque(maxlen=max_chunks)
+        self._waiter: Optional[asyncio.Future] = None
+
+    def __len__(self) -> int:
+        return len(self._chunks)
+
+    def put(self, chunk: bytes) -> None:
+        """
+        Add a chunk, dropping the oldest one if the buffer is full. Must be called on the event loop.
+
+        Args:
+            chunk (bytes): The audio chunk.
+        """
+        if len(self._chunks) == self._chunks.maxlen:
+            self.dropped_chunks += 1
+        self._chunks.append(chunk)
+        if self._waiter is not None and not self._waiter.done():
+            self._waiter.set_result(None)
+
+    async def get(self) -> bytes:
+        """
+        Take the oldest chunk, waiting for one if the buffer is empty.
+
+        Returns:
+            bytes: The audio chunk.
+        """
+        while not self._chunks:
+            self._waiter = asyncio.get_running_loop().create_future()
+            try:
+                await self._waiter
+            finally:
+                self._waiter = None
+        return self._chunks.popleft()
+
+    def put_back(self, chunk: bytes) -> None:
+        """
+        Return a chunk taken by get() to the front of the buffer, e.g. when sending it failed. If the buffer filled up
+        in the meantime, the chunk is the oldest one and is dropped instead.
+
+        Args:
+            chunk (bytes): The audio chunk.
+        """
+        if len(self._chunks) == self._chunks.maxlen:
+            self.dropped_chunks += 1
+            return
+        self._chunks.appendleft(chunk)
+        if self._waiter is not None and not self._waiter.done():
+            self._waiter.set_result(None)
+
+
+class MicrophoneCapture:
+    """
+    Captures the microphone with a PyAudio stream in callback mode. PortAudio hands each chunk to the callback on
+    its own audio thread, which passes it to the event loop with loop.call_soon_threadsafe; there the chunk is
+    preprocessed and added to `buffer`. No thread is blocked reading the stream and no future is created per chunk.
+
+    The buffer keeps `buffer_seconds` of audio, which also holds what is captured while EVI is unreachable.
+
+    Attributes:
+        buffer (CapturedAudioBuffer): The preprocessed chunks, 16-bit mono PCM at target_sample_rate.
+        input_overflows (int): Callbacks for which PortAudio reported lost input, because it wasn't called in time.
+    """
+
+    def __init__(
+        self,
+        pyaudio: PyAudio,
+        input_device_index: int,
+        sample_rate: int,
+        num_channels: int,
+        chunk_size: int,
+        target_sample_rate: int = 16000,
+        buffer_seconds: float = 10,
+    ):
+        """
+        Initialize the capture. The stream is opened by start().
+
+        Args:
+            pyaudio (PyAudio): An instance of PyAudio to open the input stream with.
+            input_device_index (int): The input device to capture.
+            sample_rate (int): The sample rate of the input device.
+            num_channels (int): The number of channels to capture, 1 or 2.
+            chunk_size (int): The size of each audio chunk, in frames.
+            target_sample_rate (int, optional): The sample rate the audio is sent at. Defaults to 16000.
+            buffer_seconds (float, optional): Seconds of audio the buffer holds. Defaults to 10.
+        """
+        self.pyaudio = pyaudio
+        self.input_device_index = input_device_index
+        self.sample_rate = sample_rate
+        self.num_channels = num_channels
+        self.chunk_size = chunk_size
+        self.target_sample_rate = target_sample_rate
+        self.preprocessor = CapturePreprocessor(sample_rate, num_channels, target_sample_rate)
+        self.buffer = CapturedAudioBuffer(max(1, int(buffer_seconds * sample_rate / chunk_size)))
+        self.input_overflows = 0
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._stream: Optional[PyAudioStream] = None
+
+    def start(self) -> None:
+        """Open the input stream and start capturing. Must be called from the event loop that reads the buffer."""
+        self._loop = asyncio.get_running_loop()
+        self._stream = self.pyaudio.open(
+            format=paInt16,
+            channels=self.num_channels,
+            rate=self.sample_rate,
+            frames_per_buffer=self.chunk_size,
+            input=True,
+            input_device_index=self.input_device_index,
+            stream_callback=self._callback,
+        )
+
+    def close(self) -> None:
+        """Stop capturing and close the input stream."""
+        if self._stream is not None:
+            self._stream.stop_stream()
+            self._stream.close()
+            self._stream = None
+
+    def _callback(self, in_data, frame_count, time_info, status):
+        # Runs on PortAudio's audio thread: hand the chunk over and return right away
+        if status & paInputOverflow:
+            self.input_overflows += 1
+        try:
+            self._loop.call_soon_threadsafe(self._on_chunk, in_data)
+        except RuntimeError:
+            # The event loop is closed: nobody will read the audio any more
+            return None, paComplete
+        return None, paContinue
+
+    def _on_chunk(self, data: bytes) -> None:
+        # On the event loop. The preprocessor reuses its output buffer, so the chunk is copied out of it
+        dropped_before = self.buffer.dropped_chunks
+        self.buffer.put(bytes(self.preprocessor.process(data)))
+        if self.buffer.dropped_chunks != dropped_before and self.buffer.dropped_chunks % 100 == 1:
+            logger.warning("Microphone buffer full, %d chunks dropped so far", self.buffer.dropped_chunks)
@@ -3,90 +3,186 @@
 import asyncio
 import base64
 import json
-import tempfile
 import logging
-import io
-import wave
-import numpy as np
+import random
 import websockets
-import soundfile
-from playsound import playsound
-from pyaudio import Stream as PyAudioStream
-from concurrent.futures import ThreadPoolExecutor
-
-# Set up a thread pool executor for non-blocking audio stream reading
-executor = ThreadPoolExecutor(max_workers=1)
+from audio_input import AudioInputEncoder
+from capture import MicrophoneCapture
+from playback import AudioPlayer
 
 # Configure logging
 logging.basicConfig(
     format="%(asctime)s - %(levelname)s - %(message)s", level=logging.DEBUG
 )
 
+class ChatSession:
+    """
+    What survives a reconnection: the chat group to resume. The microphone audio captured while disconnected waits
+    in the MicrophoneCapture's buffer.
+
+    Attributes:
+        chat_group_id (str): The chat group of the current chat, from its chat_metadata message; None until then.
+        established_at (float): When the current connection received its chat_metadata, on the event loop's
+            clock; None until then.
+        fatal_error (str): The code of an EVI error after which the chat can't be resumed, if one was received.
+    """
+
+    def __init__(self):
+        """Initialize the session, before its first connection."""
+        self.chat_group_id = None
+        self.established_at = None
+        self.fatal_error = None
+
+
 class Connection:
     """
     A class to handle the connection to the WebSocket server for streaming audio data.
     """
 
+    # Reconnection delays: the first retry follows almost at once, later ones back off exponentially, with full
+    # jitter so that many clients cut off together don't all come back at the same moment
+    RECONNECT_BASE_DELAY = 0.1
+    RECONNECT_MAX_DELAY = 10.0
+    # Only a connection that stays up this long starts the backoff over, so that a server that accepts the chat
+    # and then drops it right away can't make the client reconnect in a tight loop
+    STABLE_CONNECTION_SECONDS = 30.0
+    # Give up after this many connections in a row that failed or didn't stay up
+    MAX_RECONNECT_ATTEMPTS = 10
+    # EVI errors that end the chat for good: audio it can't transcribe, and the inactivity and duration limits
+    FATAL_ERROR_CODES = frozenset({"I0116", "E0714", "E0715"})
+    # Close codes for which reconnecting won't help: protocol error, unsupported or invalid data, policy violation
+    FATAL_CLOSE_CODES = frozenset({1002, 1003, 1007, 1008})
+    # Handshake statuses for a missing, invalid or expired API key or access token, which a retry won't fix
+    AUTH_FAILURE_STATUS_CODES = frozenset({401, 403})
+    # Handshake statuses with which EVI rejects a resumed_chat_group_id it can't resume (unknown or expired)
+    RESUME_REJECTED_STATUS_CODES = frozenset({400, 404, 422})
+    # Handshake statuses in the 4xx range that are worth retrying: request timeout and rate limiting
+    RETRYABLE_STATUS_CODES = frozenset({408, 429})
+
     @classmethod
     async def connect(
         cls,
         socket_url: str,
-        audio_stream: PyAudioStream,
-        sample_rate: int,
+        microphone: MicrophoneCapture,
+        audio_player: AudioPlayer,
         sample_width: int,
-        num_channels: int,
-        chunk_size: int,
     ):
         """
         Establish and maintain a connection to the WebSocket server, handling reconnections as needed.
 
+        The microphone is captured the whole time. After a disconnection the chat is resumed with
+        resumed_chat_group_id, so EVI keeps the conversation's context, and the audio captured in the meantime is
+        sent first. Returns without reconnecting after a fatal EVI error or close code, when authentication fails
+        (e.g. an expired access token) or the handshake is otherwise rejected, or after MAX_RECONNECT_ATTEMPTS
+        connections in a row that didn't stay up for STABLE_CONNECTION_SECONDS. A chat group that EVI refuses to
+        resume is given up for a new chat.
+
         Args:
             socket_url (str): The URL of the WebSocket server.
-            audio_stream (PyAudioStream): The PyAudio stream to read audio data from.
-            sample_rate (int): The sample rate of the audio data.
+            microphone (MicrophoneCapture): The started microphone capture to send audio from.
+            audio_player (AudioPlayer): The player for the audio received from EVI.
             sample_width (int): The sample width of the audio data.
-            num_channels (int): The number of audio channels.
-            chunk_size (int): The size of each audio chunk.
 
         Raises:
             Exception: If any error occurs during WebSocket connection or data transmission.
         """
+        session = ChatSession()
+        loop = asyncio.get_running_loop()
+        failures = 0
+
         while True:
+            url = socket_url
+            resumed_chat_group_id = session.chat_group_id
+            if resumed_chat_group_id is not None:
+                url = f"{socket_url}&resumed_chat_group_id={resumed_chat_group_id}"
+            session.established_at = None
+            close_code = None
             try:
-                async with websockets.connect(socket_url) as socket:
-                    print("Connected to WebSocket")
+                async with websockets.connect(url) as socket:
+                    if resumed_chat_group_id is not None:
+                        print(f"Reconnected to WebSocket, resuming chat group {resumed_chat_group_id}")
+                    else:
+                        print("Connected to WebSocket")
                     # Create tasks for sending and receiving audio data
                     send_task = asyncio.create_task(
-                        cls._send_audio_data(
-                            socket,
-                            audio_stream,
-                            sample_rate,
-                            sample_width,
-                            num_channels,
-                            chunk_size,
-                        )
+                        cls._send_audio_data(socket, microphone, sample_width)
                     )
-                    receive_task = asyncio.create_task(cls._receive_audio_data(socket))
-                    # Wait for both tasks to complete
-                    await asyncio.gather(receive_task, send_task)
-            except websockets.exceptions.ConnectionClosed:
-                print(
-                    "WebSocket connection closed. Attempting to reconnect in 5 seconds..."
-                )
-                await asyncio.sleep(5)
+                    receive_task = asyncio.create_task(
+                        cls._receive_audio_data(socket, audio_player, session)
+                    )
+                    # Run until either side stops, then stop the other one too
+                    done, pending = await asyncio.wait(
+                        [receive_task, send_task], return_when=asyncio.FIRST_COMPLETED
+                    )
+                    for task in pending:
+                        task.cancel()
+                    await asyncio.gather(*pending, return_exceptions=True)
+                    for task in done:
+                        task.result()
+                close_code = socket.close_code
+                print(f"WebSocket connection closed (code {close_code}).", end=" ")
+            except websockets.exceptions.ConnectionClosed as e:
+                close_code = e.rcvd.code if e.rcvd is not None else None
+                print(f"WebSocket connection closed (code {close_code}).", end=" ")
+            except websockets.exceptions.InvalidStatusCode as e:
+                if e.status_code in cls.AUTH_FAILURE_STATUS_CODES:
+                    print(f"Authentication failed: {e}. Not reconnecting.")
+                    return
+                elif resumed_chat_group_id is not None and e.status_code in cls.RESUME_REJECTED_STATUS_CODES:
+                    # The chat group can't be resumed any more: start a new chat instead
+                    print(f"Could not resume chat group {resumed_chat_group_id} ({e}), starting a new chat.", end=" ")
+                    session.chat_group_id = None
+                elif 400 <= e.status_code < 500 and e.status_code not in cls.RETRYABLE_STATUS_CODES:
+                    print(f"Connection rejected: {e}. Not reconnecting.")
+                    return
+                else:
+                    print(f"An error occurred: {e}.", end=" ")
             except Exception as e:
-                print(
-                    f"An error occurred: {e}. Attempting to reconnect in 5 seconds..."
-                )
-                await asyncio.sleep(5)
+                print(f"An error occurred: {e}.", end=" ")
+
+            if session.fatal_error is not None:
+                print(f"EVI ended the chat with error {session.fatal_error}. Not reconnecting.")
+                return
+            if close_code in cls.FATAL_CLOSE_CODES:
+                print("Not reconnecting.")
+                return
+
+            # Only a connection that stayed up for a while starts the backoff over
+            stable = (
+                session.established_at is not None
+                and loop.time() - session.established_at >= cls.STABLE_CONNECTION_SECONDS
+            )
+            failures = 0 if stable else failures + 1
+            if failures >= cls.MAX_RECONNECT_ATTEMPTS:
+                print(f"Giving up after {failures} failed connections in a row.")
+                return
+            delay = cls._reconnect_delay(failures)
+            print(f"Attempting to reconnect in {delay:.2f} seconds...")
+            await asyncio.sleep(delay)
 
     @classmethod
-    async def _receive_audio_data(cls, socket):
+    def _reconnect_delay(cls, failures: int) -> float:
+        """
+        Pick how long to wait before reconnecting.
+
+        Args:
+            failures (int): The number of connection attempts that have failed in a row before this one.
+
+        Returns:
+            float: The delay in seconds, drawn uniformly up to an exponentially growing cap.
+        """
+        cap = min(cls.RECONNECT_MAX_DELAY, cls.RECONNECT_BASE_DELAY * 2 ** min(failures, 16))
+        return random.uniform(0, cap)
+
+    @classmethod
+    async def _receive_audio_data(cls, socket, audio_player: AudioPlayer, session: ChatSession):
         """
         Receive and process audio data from the WebSocket server.
 
         Args:
             socket (WebSocketClientProtocol): The WebSocket connection.
+            audio_player (AudioPlayer): The player for the audio received from EVI.
+            session (ChatSession): The chat to record the chat group of, for resuming it.
 
         Raises:
             Exception: If any error occurs while receiving or processing audio data.
@@ -98,17 +194,27 @@ class Connection:
                     json_message = json.loads(message)
                     print("Received JSON message:", json_message)
 
+                    # Remember the chat group, to resume this chat if the connection drops
+                    if json_message.get("type") == "chat_metadata":
+                        session.chat_group_id = json_message["chat_group_id"]
+                        session.established_at = asyncio.get_running_loop().time()
+
+                    # Errors that end the chat for good, which must not be retried
+                    elif json_message.get("type") == "error":
+                        if json_message.get("code") in cls.FATAL_ERROR_CODES:
+                            session.fatal_error = json_message["code"]
+
                     # Check if the message type is 'audio_output'
-                    if json_message.get("type") == "audio_output":
+                    elif json_message.get("type") == "audio_output":
                         # Decode the base64 audio data
                         audio_data = base64.b64decode(json_message["data"])
 
-                        # Write the decoded audio data to a temporary file and play it
-                        with tempfile.NamedTemporaryFile(delete=True, suffix=".wav") as tmpfile:
-                            tmpfile.write(audio_data)
-                            tmpfile.flush()  # Ensure all data is written to disk
-                            playsound(tmpfile.name)
-                            print("Audio played")
+                        # Queue it for playback right after the previous chunk, without waiting for it to play
+                        audio_player.play(audio_data)
+
+                    # The user started talking over EVI: stop playing the rest of its reply
+                    elif json_message.get("type") == "user_interruption":
+                        audio_player.clear()
 
                 except ValueError as e:
                     print(f"Failed to parse JSON, error: {e}")
@@ -119,87 +225,31 @@ class Connection:
             print(f"An error occurred while receiving audio: {e}")
 
     @classmethod
-    async def _read_audio_stream_non_blocking(cls, audio_stream, chunk_size):
+    async def _send_audio_data(cls, socket, microphone: MicrophoneCapture, sample_width: int):
         """
-        Read a chunk of audio data from the PyAudio stream in a non-blocking manner.
-
-        Args:
-            audio_stream (PyAudioStream): The PyAudio stream to read audio data from.
-            chunk_size (int): The size of each audio chunk.
-
-        Returns:
-            bytes: The audio data read from the stream.
-        """
-        loop = asyncio.get_running_loop()
-        data = await loop.run_in_executor(
-            executor, audio_stream.read, chunk_size, False
-        )
-        return data
-
-    @classmethod
-    async def _send_audio_data(
-        cls,
-        socket,
-        audio_stream: PyAudioStream,
-        sample_rate: int,
-        sample_width: int,
-        num_channels: int,
-        chunk_size: int,
-    ):
-        """
-        Read audio data from the PyAudio stream and send it to the WebSocket server.
+        Send the captured audio data to the WebSocket server, starting with any captured while disconnected.
 
         Args:
             socket (WebSocketClientProtocol): The WebSocket connection.
-            audio_stream (PyAudioStream): The PyAudio stream to read audio data from.
-            sample_rate (int): The sample rate of the audio data.
+            microphone (MicrophoneCapture): The microphone capture to send audio from.
             sample_width (int): The sample width of the audio data.
-            num_channels (int): The number of audio channels.
-            chunk_size (int): The size of each audio chunk.
         """
-        wav_buffer = io.BytesIO()
-        headers_sent = False
+        encoder = AudioInputEncoder(microphone.target_sample_rate, sample_width, 1)
+        if len(microphone.buffer) > 1:
+            print(
+                f"Sending {len(microphone.buffer)} buffered audio chunks "
+                f"({microphone.buffer.dropped_chunks} dropped, {microphone.input_overflows} input overflows so far)"
+            )
 
         while True:
-            # Read audio data from the stream
-            data = await cls._read_audio_stream_non_blocking(audio_stream, chunk_size)
-            if num_channels == 2:  # Stereo to mono conversion if stereo is detected
-                # Assuming the sample width is 2 bytes, hence 'int16'
-                stereo_data = np.frombuffer(data, dtype=np.int16)
-                # Averaging every two samples (left and right channels)
-                mono_data = ((stereo_data[0::2] + stereo_data[1::2]) / 2).astype(np.int16)
-                data = mono_data.tobytes()
-
-            # Convert audio data to numpy array and write to buffer
-            np_array = np.frombuffer(data, dtype="int16")
-            soundfile.write(
-                wav_buffer,
-                np_array,
-                samplerate=sample_rate,
-                subtype="PCM_16",
-                format="RAW",
-            )
+            # Wait for the next chunk of audio data
+            data = await microphone.buffer.get()
 
-            wav_content = wav_buffer.getvalue()
-            if not headers_sent:
-                # Write WAV header if not already sent
-                header_buffer = io.BytesIO()
-                with wave.open(header_buffer, "wb") as wf:
-                    wf.setnchannels(num_channels)
-                    wf.setsampwidth(sample_width)
-                    wf.setframerate(sample_rate)
-                    wf.setnframes(chunk_size)
-
-                    wf.writeframes(b"")
-
-                headers = header_buffer.getvalue()
-                wav_content = headers + wav_content
-                headers_sent = True
-
-            # Encode audio data to base64 and send as JSON message
-            encoded_audio = base64.b64encode(wav_content).decode('utf-8')
-            json_message = json.dumps({"type": "audio_input", "data": encoded_audio})
-            await socket.send(json_message)
-
-            # Reset buffer for the next chunk of audio data
-            wav_buffer = io.BytesIO()
+            # Send the raw PCM, after the WAV header on the first chunk, base64-encoded in a JSON message
+            try:
+                await socket.send(encoder.encode(data))
+            except BaseException:
+                # The connection failed or is being torn down with the chunk out of the buffer: put it back in front,
+                # so the next connection sends it first instead of losing it
+                microphone.buffer.put_back(data)
+                raise
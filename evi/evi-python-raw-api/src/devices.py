@@ -61,16 +61,18 @@ class AudioDevices:
 
         # Display available devices
         print(f"Available {device_type} devices:")
-        for _, (device_index, name, sample_rate) in enumerate(devices):
+        for device_index, name, _ in devices:
             print(f"{device_index}: {name}")
 
         # Prompt the user to select a device by index
         while True:
             try:
                 choice = int(input(f"Select {device_type} device by index: "))
-                if choice in [d[0] for d in devices]:
+                # The third field of an input device is its default sample rate
+                chosen = next((d for d in devices if d[0] == choice), None)
+                if chosen is not None:
                     if device_type == "input":
-                        return choice, sample_rate
+                        return choice, chosen[2]
                     else:
                         return choice
                 else:
@@ -4,16 +4,19 @@ import asyncio
 import os
 
 from authenticator import Authenticator
+from capture import MicrophoneCapture
 from connection import Connection
 from devices import AudioDevices
 from dotenv import load_dotenv
-from pyaudio import PyAudio, paInt16
+from playback import AudioPlayer
+from pyaudio import PyAudio
 
-# Audio format and parameters
-FORMAT = paInt16
+# Audio format and parameters (16-bit PCM)
 CHANNELS = 1
 SAMPLE_WIDTH = 2  # PyAudio.get_sample_size(pyaudio, format=paInt16)
 CHUNK_SIZE = 1024
+# Microphone audio is downmixed and resampled to this rate before it is sent to EVI
+TARGET_SAMPLE_RATE = 16000
 
 
 async def main():
@@ -34,18 +37,19 @@ async def main():
     # Choose the audio output device
     output_device_index = AudioDevices.choose_device(output_devices, "output")
 
-    # Open the audio stream with the selected parameters
-    audio_stream = pyaudio.open(
-        format=FORMAT,
-        channels=CHANNELS,
-        frames_per_buffer=CHUNK_SIZE,
-        rate=input_device_sample_rate,
-        input=True,
-        output=True,
-        input_device_index=input_device_index,
-        output_device_index=output_device_index,
+    # Capture the microphone with the selected parameters
+    microphone = MicrophoneCapture(
+        pyaudio,
+        input_device_index,
+        input_device_sample_rate,
+        CHANNELS,
+        CHUNK_SIZE,
+        TARGET_SAMPLE_RATE,
     )
 
+    # EVI's audio is played on its own output stream, in the format EVI sends
+    audio_player = AudioPlayer(pyaudio, output_device_index)
+
     # Fetch the access token for authentication
     access_token = get_access_token()
 
@@ -55,19 +59,13 @@ async def main():
         f"access_token={access_token}"
     )
 
-    # Connect to the websocket and start the audio stream
-    await Connection.connect(
-        socket_url,
-        audio_stream,
-        input_device_sample_rate,
-        SAMPLE_WIDTH,
-        CHANNELS,
-        CHUNK_SIZE,
-    )
+    # Start capturing, then connect to the websocket and stream the audio
+    microphone.start()
+    await Connection.connect(socket_url, microphone, audio_player, SAMPLE_WIDTH)
 
-    # Close the PyAudio stream and terminate PyAudio
-    audio_stream.stop_stream()
-    audio_stream.close()
+    # Close the PyAudio streams and terminate PyAudio
+    microphone.close()
+    audio_player.close()
     pyaudio.terminate()
 
 
@@ -0,0 +1,194 @@
+# playback.py
+
+import io
+import logging
+import wave
+from typing import Optional, Tuple
+
+from pyaudio import PyAudio, Stream as PyAudioStream, paContinue
+
+logger = logging.getLogger(__name__)
+
+
+class PcmRingBuffer:
+    """
+    A fixed-capacity ring buffer of PCM bytes, shared by exactly one writer and one reader thread.
+
+    The writer only ever advances `_write_pos` and the reader only ever advances `_read_pos`, each after its copy is
+    done, so neither needs a lock: the reader never sees bytes that are still being written, and the writer never
+    overwrites bytes that haven't been read yet.
+
+    Attributes:
+        capacity (int): The most bytes the buffer can hold.
+        dropped_bytes (int): Bytes that didn't fit when they were written.
+    """
+
+    def __init__(self, capacity: int):
+        """
+        Initialize an empty ring buffer.
+
+        Args:
+            capacity (int): The most bytes the buffer can hold.
+        """
+        self.capacity = capacity
+        self.dropped_bytes = 0
+        self._buffer = bytearray(capacity)
+        # Total bytes ever written and read; their difference is what the buffer holds
+        self._write_pos = 0
+        self._read_pos = 0
+
+    def __len__(self) -> int:
+        return self._write_pos - self._read_pos
+
+    @property
+    def write_pos(self) -> int:
+        """Total bytes ever written: the position the next write starts at."""
+        return self._write_pos
+
+    def write(self, data: bytes) -> int:
+        """
+        Append bytes, as many as fit. Called from the writer thread only.
+
+        Args:
+            data (bytes): The bytes to append.
+
+        Returns:
+            int: The number of bytes written.
+        """
+        n_bytes = min(len(data), self.capacity - len(self))
+        self.dropped_bytes += len(data) - n_bytes
+        start = self._write_pos % self.capacity
+        first = min(n_bytes, self.capacity - start)
+        self._buffer[start:start + first] = data[:first]
+        self._buffer[:n_bytes - first] = data[first:n_bytes]
+        self._write_pos += n_bytes
+        return n_bytes
+
+    def read_into(self, out: memoryview) -> int:
+        """
+        Move up to len(out) bytes into `out`. Called from the reader thread only.
+
+        Args:
+            out (memoryview): Where to copy the bytes.
+
+        Returns:
+            int: The number of bytes read.
+        """
+        n_bytes = min(len(out), len(self))
+        start = self._read_pos % self.capacity
+        first = min(n_bytes, self.capacity - start)
+        out[:first] = self._buffer[start:start + first]
+        out[first:n_bytes] = self._buffer[:n_bytes - first]
+        self._read_pos += n_bytes
+        return n_bytes
+
+    def skip_to(self, position: int) -> None:
+        """
+        Discard the bytes buffered before a write position, and none written after it. Called from the reader thread
+        only.
+
+        Args:
+            position (int): A `write_pos` read earlier; positions already read past are ignored.
+        """
+        self._read_pos = max(self._read_pos, min(position, self._write_pos))
+
+
+class AudioPlayer:
+    """
+    Plays the WAV chunks EVI sends back to back through a PyAudio output stream, without temporary files.
+
+    Each chunk's samples go into a ring buffer, and PyAudio's callback, which runs on PortAudio's own audio thread,
+    drains it in real time. So play() never blocks the event loop, and consecutive chunks are played without a gap
+    between them; only when the buffer runs dry is silence played until the next chunk arrives.
+    """
+
+    # Seconds of audio the ring buffer holds; EVI sends replies faster than real time
+    BUFFER_SECONDS = 60
+    FRAMES_PER_BUFFER = 1024
+
+    def __init__(self, pyaudio: PyAudio, output_device_index: Optional[int] = None):
+        """
+        Initialize the player. The output stream is opened when the first chunk arrives, in that chunk's format.
+
+        Args:
+            pyaudio (PyAudio): An instance of PyAudio to open the output stream with.
+            output_device_index (int, optional): The output device to play on. Defaults to the system default.
+        """
+        self.pyaudio = pyaudio
+        self.output_device_index = output_device_index
+        self.underruns = 0
+        self._stream: Optional[PyAudioStream] = None
+        self._format: Optional[Tuple[int, int, int]] = None
+        self._buffer: Optional[PcmRingBuffer] = None
+        self._out: Optional[bytearray] = None
+        # The write position at the last clear(): the audio thread discards everything buffered before it
+        self._clear_to = 0
+
+    def play(self, wav_chunk: bytes) -> None:
+        """
+        Queue a WAV chunk for playback right after the audio queued before it. Returns immediately.
+
+        Args:
+            wav_chunk (bytes): A complete WAV file, as in an audio_output message.
+        """
+        with wave.open(io.BytesIO(wav_chunk), "rb") as wav_file:
+            audio_format = (wav_file.getframerate(), wav_file.getsampwidth(), wav_file.getnchannels())
+            frames = wav_file.readframes(wav_file.getnframes())
+
+        if audio_format != self._format:
+            self._open_stream(audio_format)
+
+        dropped_before = self._buffer.dropped_bytes
+        self._buffer.write(frames)
+        if self._buffer.dropped_bytes != dropped_before:
+            logger.warning("Playback buffer full, dropped %d bytes", self._buffer.dropped_bytes - dropped_before)
+
+    def clear(self) -> None:
+        """Stop playing the queued audio, e.g. when the user interrupts EVI."""
+        # The audio thread is the only reader, so it does the skipping on its next callback. It skips only up to where
+        # the writer was now: a chunk that arrives before that callback is a new reply and must still be played
+        if self._buffer is not None:
+            self._clear_to = self._buffer.write_pos
+
+    def close(self) -> None:
+        """Stop and close the output stream."""
+        if self._stream is not None:
+            self._stream.stop_stream()
+            self._stream.close()
+            self._stream = None
+            self._format = None
+
+    def _open_stream(self, audio_format: Tuple[int, int, int]) -> None:
+        # Only when the format changes, which EVI doesn't do within a chat
+        self.close()
+        sample_rate, sample_width, num_channels = audio_format
+        self._format = audio_format
+        self._buffer = PcmRingBuffer(self.BUFFER_SECONDS * sample_rate * sample_width * num_channels)
+        self._out = bytearray(self.FRAMES_PER_BUFFER * sample_width * num_channels)
+        self._clear_to = 0
+        self._stream = self.pyaudio.open(
+            format=self.pyaudio.get_format_from_width(sample_width),
+            channels=num_channels,
+            rate=sample_rate,
+            output=True,
+            output_device_index=self.output_device_index,
+            frames_per_buffer=self.FRAMES_PER_BUFFER,
+            stream_callback=self._callback,
+        )
+
+    def _callback(self, in_data, frame_count, time_info, status):
+        # Runs on PortAudio's audio thread: must not block, and must return exactly frame_count frames
+        self._buffer.skip_to(self._clear_to)
+
+        sample_width, num_channels = self._format[1], self._format[2]
+        n_bytes = frame_count * sample_width * num_channels
+        if len(self._out) != n_bytes:
+            self._out = bytearray(n_bytes)
+        out = memoryview(self._out)
+        n_read = self._buffer.read_into(out)
+        if n_read < n_bytes:
+            if n_read > 0:
+                self.underruns += 1
+            # Silence for 16-bit (and wider) signed PCM; 8-bit WAV is unsigned with silence at 128
+            out[n_read:] = (b"\x80" if sample_width == 1 else b"\x00") * (n_bytes - n_read)
+        return bytes(self._out), paContinue
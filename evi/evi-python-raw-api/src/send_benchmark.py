@@ -0,0 +1,92 @@
+# send_benchmark.py
+
+"""
+Benchmark of the audio_input send path: CPU time per second of captured audio to turn microphone chunks into
+audio_input messages, for AudioInputEncoder and for the soundfile RAW re-encoding it replaced (only measured when
+soundfile is installed).
+
+Usage: python send_benchmark.py
+"""
+
+import base64
+import io
+import json
+import time
+import wave
+
+import numpy as np
+
+from audio_input import AudioInputEncoder
+
+try:
+    import soundfile
+except ImportError:
+    soundfile = None
+
+# Common microphone rates, read in chunks of CHUNK_SIZE frames of mono 16-bit PCM
+SAMPLE_RATES = [16000, 44100, 48000]
+CHUNK_SIZE = 1024
+SAMPLE_WIDTH = 2
+CAPTURED_SECONDS = 60
+
+
+def soundfile_messages(chunks, sample_rate: int):
+    """The previous send path: a new RAW file per chunk, a WAV header on the first, then json.dumps."""
+    headers_sent = False
+    for data in chunks:
+        wav_buffer = io.BytesIO()
+        soundfile.write(
+            wav_buffer,
+            np.frombuffer(data, dtype="int16"),
+            samplerate=sample_rate,
+            subtype="PCM_16",
+            format="RAW",
+        )
+        wav_content = wav_buffer.getvalue()
+        if not headers_sent:
+            header_buffer = io.BytesIO()
+            with wave.open(header_buffer, "wb") as wf:
+                wf.setnchannels(1)
+                wf.setsampwidth(SAMPLE_WIDTH)
+                wf.setframerate(sample_rate)
+                wf.setnframes(CHUNK_SIZE)
+                wf.writeframes(b"")
+            wav_content = header_buffer.getvalue() + wav_content
+            headers_sent = True
+        encoded_audio = base64.b64encode(wav_content).decode("utf-8")
+        yield json.dumps({"type": "audio_input", "data": encoded_audio})
+
+
+def encoder_messages(chunks, sample_rate: int):
+    encoder = AudioInputEncoder(sample_rate, SAMPLE_WIDTH, 1)
+    for data in chunks:
+        yield encoder.encode(data)
+
+
+def report(name: str, messages) -> None:
+    started = time.process_time()
+    for _ in messages:
+        pass
+    cpu = time.process_time() - started
+    print(f"  {name:<12} {cpu / CAPTURED_SECONDS * 1e6:8.1f} µs CPU per second of audio")
+
+
+def main():
+    rng = np.random.default_rng(0)
+    for sample_rate in SAMPLE_RATES:
+        n_chunks = CAPTURED_SECONDS * sample_rate // CHUNK_SIZE
+        chunks = [
+            rng.integers(-32768, 32768, CHUNK_SIZE, dtype=np.int16).tobytes() for _ in range(n_chunks)
+        ]
+
+        print(f"{sample_rate} Hz, {CHUNK_SIZE}-frame chunks")
+        report("encoder", encoder_messages(chunks, sample_rate))
+        if soundfile is not None:
+            # Both paths must produce the same messages, up to JSON whitespace
+            old, new = soundfile_messages(chunks[:3], sample_rate), encoder_messages(chunks[:3], sample_rate)
+            assert [json.loads(message) for message in old] == [json.loads(message) for message in new]
+            report("soundfile", soundfile_messages(chunks, sample_rate))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+# run tests locally with:
+# cd src && pytest test_capture.py -v
+
+import asyncio
+import threading
+
+import numpy as np
+import pytest
+from pyaudio import paComplete, paContinue, paInputOverflow
+
+from capture import CapturedAudioBuffer, CapturePreprocessor, MicrophoneCapture
+
+# Chunk sizes in frames: the driver doesn't always deliver the size asked for, and a short chunk right after a long
+# one is what moves the resampler's history around the most
+CHUNK_SIZES = [1024, 1, 1024, 7, 2048, 3, 512, 1000, 1, 1, 4096]
+
+
+def chunks(samples: np.ndarray, num_channels: int, sizes: list[int]) -> list[bytes]:
+    """Split interleaved samples into chunks of the given sizes in frames, then whatever is left as one chunk."""
+    result, start = [], 0
+    for size in sizes:
+        result.append(samples[start * num_channels:(start + size) * num_channels].tobytes())
+        start += size
+    result.append(samples[start * num_channels:].tobytes())
+    return result
+
+
+def process_all(preprocessor: CapturePreprocessor, data: list[bytes]) -> np.ndarray:
+    return np.concatenate([np.frombuffer(bytes(preprocessor.process(chunk)), dtype=np.int16) for chunk in data])
+
+
+@pytest.mark.parametrize("sample_rate", [48000, 44100, 8000])
+@pytest.mark.parametrize("num_channels", [1, 2])
+def test_variable_chunk_sizes_match_one_chunk(sample_rate, num_channels):
+    """
+    resampling in chunks of varying sizes gives the same output as resampling all the audio at once
+    """
+    rng = np.random.default_rng(0)
+    n_frames = sum(CHUNK_SIZES) + 777
+    samples = rng.integers(-20000, 20000, n_frames * num_channels, dtype=np.int16)
+
+    expected = process_all(CapturePreprocessor(sample_rate, num_channels), [samples.tobytes()])
+    actual = process_all(CapturePreprocessor(sample_rate, num_channels), chunks(samples, num_channels, CHUNK_SIZES))
+
+    assert len(actual) == len(expected) == -(-n_frames * 16000 // sample_rate)
+    np.testing.assert_array_equal(actual, expected)
+
+
+def test_random_chunk_sizes_match_one_chunk():
+    """
+    resampling 44.1 kHz stereo in random chunk sizes, empty ones included, gives the same output as one chunk
+    """
+    rng = np.random.default_rng(1)
+    sizes = list(rng.integers(0, 3000, 40))
+    samples = rng.integers(-32768, 32767, (sum(sizes) + 100) * 2, dtype=np.int16)
+
+    expected = process_all(CapturePreprocessor(44100, 2), [samples.tobytes()])
+    actual = process_all(CapturePreprocessor(44100, 2), chunks(samples, 2, sizes))
+
+    np.testing.assert_array_equal(actual, expected)
+
+
+def test_no_resampling_at_target_rate():
+    """
+    mono audio already at the target sample rate passes through unchanged
+    """
+    samples = np.arange(-500, 500, dtype=np.int16)
+    preprocessor = CapturePreprocessor(16000, 1)
+
+    assert bytes(preprocessor.process(samples.tobytes())) == samples.tobytes()
+
+
+class FakePyAudio:
+    """Opens no device: the test calls the capture's stream callback itself, as PortAudio's audio thread would."""
+
+    class Stream:
+        def stop_stream(self) -> None:
+            pass
+
+        def close(self) -> None:
+            pass
+
+    def open(self, **kwargs) -> "FakePyAudio.Stream":
+        return self.Stream()
+
+
+def chunk(i: int) -> bytes:
+    return np.full(160, i, dtype=np.int16).tobytes()
+
+
+def test_stalled_consumer_drops_oldest_chunks():
+    """
+    while nothing reads the buffer, the audio thread keeps handing chunks over; the oldest are dropped and counted,
+    and the consumer resumes with the newest ones in order
+    """
+
+    async def main():
+        # 16 kHz mono is sent as is; the buffer holds 5 chunks of 160 frames
+        microphone = MicrophoneCapture(FakePyAudio(), 0, 16000, 1, 160, buffer_seconds=0.05)
+        microphone.start()
+
+        def audio_thread():
+            for i in range(12):
+                status = paInputOverflow if i in (3, 4) else 0
+                assert microphone._callback(chunk(i), 160, {}, status) == (None, paContinue)
+
+        thread = threading.Thread(target=audio_thread)
+        thread.start()
+        await asyncio.to_thread(thread.join)
+        await asyncio.sleep(0)
+
+        assert len(microphone.buffer) == 5
+        assert microphone.buffer.dropped_chunks == 7
+        assert microphone.input_overflows == 2
+        received = [await microphone.buffer.get() for _ in range(5)]
+        microphone.close()
+        return received
+
+    assert asyncio.run(main()) == [chunk(i) for i in range(7, 12)]
+
+
+def test_get_waits_for_put():
+    """
+    a consumer waiting on an empty buffer is woken by the next chunk, and nothing is dropped
+    """
+
+    async def main():
+        buffer = CapturedAudioBuffer(2)
+        get = asyncio.create_task(buffer.get())
+        await asyncio.sleep(0)
+        assert not get.done()
+
+        buffer.put(b"a")
+        return await get, buffer.dropped_chunks
+
+    assert asyncio.run(main()) == (b"a", 0)
+
+
+def test_callback_completes_once_the_loop_is_closed():
+    """
+    after the event loop is closed, the callback tells PortAudio to stop instead of raising on its thread
+    """
+
+    async def main():
+        microphone = MicrophoneCapture(FakePyAudio(), 0, 16000, 1, 160)
+        microphone.start()
+        return microphone
+
+    microphone = asyncio.run(main())
+
+    assert microphone._callback(chunk(0), 160, {}, 0) == (None, paComplete)
@@ -0,0 +1,215 @@
+# run tests locally with:
+# cd src && pytest test_connection.py -v
+
+import asyncio
+import json
+from http import HTTPStatus
+from types import SimpleNamespace
+
+import pytest
+import websockets
+
+from capture import CapturedAudioBuffer
+from connection import Connection
+
+CHAT_METADATA = {"type": "chat_metadata", "chat_group_id": "group-1", "chat_id": "chat-1"}
+
+
+class FakeEvi:
+    """
+    A local WebSocket server that plays a script, one step per connection: either an HTTP status to reject the
+    handshake with, or the messages to send and the close code to close with. Past the script it closes with 1011.
+    """
+
+    def __init__(self, script: list):
+        self.script = script
+        self.paths = []
+
+    def _step(self):
+        n = len(self.paths) - 1
+        return self.script[n] if n < len(self.script) else ([], 1011)
+
+    async def process_request(self, path, request_headers):
+        self.paths.append(path)
+        if isinstance(self._step(), int):
+            return HTTPStatus(self._step()), [], b""
+
+    async def handler(self, websocket):
+        messages, close_code = self._step()
+        for message in messages:
+            await websocket.send(json.dumps(message))
+        await websocket.close(close_code)
+
+
+class FakePlayer:
+    def play(self, wav_chunk: bytes) -> None:
+        pass
+
+    def clear(self) -> None:
+        pass
+
+
+def microphone(max_chunks: int = 10) -> SimpleNamespace:
+    return SimpleNamespace(buffer=CapturedAudioBuffer(max_chunks), target_sample_rate=16000, input_overflows=0)
+
+
+def run_chat(evi: FakeEvi) -> list[str]:
+    """Run Connection.connect against the fake EVI until it gives up, and return the paths it connected to."""
+
+    async def main():
+        async with websockets.serve(evi.handler, "localhost", 0, process_request=evi.process_request) as server:
+            port = server.sockets[0].getsockname()[1]
+            await asyncio.wait_for(
+                Connection.connect(f"ws://localhost:{port}/v0/evi/chat?api_key=test", microphone(), FakePlayer(), 2),
+                timeout=10)
+
+    asyncio.run(main())
+    return evi.paths
+
+
+@pytest.fixture(autouse=True)
+def fast_reconnects(monkeypatch):
+    monkeypatch.setattr(Connection, "RECONNECT_BASE_DELAY", 0.001)
+    monkeypatch.setattr(Connection, "RECONNECT_MAX_DELAY", 0.01)
+    monkeypatch.setattr(Connection, "MAX_RECONNECT_ATTEMPTS", 3)
+
+
+@pytest.fixture
+def delays(monkeypatch) -> list[int]:
+    """The number of failures in a row each reconnection backed off for."""
+    failures = []
+    reconnect_delay = Connection._reconnect_delay.__func__
+
+    def record(cls, n):
+        failures.append(n)
+        return reconnect_delay(cls, n)
+
+    monkeypatch.setattr(Connection, "_reconnect_delay", classmethod(record))
+    return failures
+
+
+def test_reconnect_delay_bounds():
+    """
+    each delay is drawn between zero and a cap that doubles with every failure, up to RECONNECT_MAX_DELAY
+    """
+    for failures in range(30):
+        cap = min(Connection.RECONNECT_MAX_DELAY, Connection.RECONNECT_BASE_DELAY * 2 ** failures)
+        draws = [Connection._reconnect_delay(failures) for _ in range(200)]
+        assert all(0 <= delay <= cap for delay in draws)
+        # Jittered over the whole range, not bunched at the cap
+        assert min(draws) < cap / 4 and max(draws) > cap * 3 / 4
+
+
+def test_gives_up_after_unstable_connections(delays):
+    """
+    connections that close before they are stable keep backing off, and the client gives up after
+    MAX_RECONNECT_ATTEMPTS of them
+    """
+    paths = run_chat(FakeEvi([([CHAT_METADATA], 1011)] * 5))
+
+    assert len(paths) == 3
+    assert delays == [1, 2]
+
+
+def test_stable_connection_resets_backoff(monkeypatch, delays):
+    """
+    a connection that stayed up for STABLE_CONNECTION_SECONDS starts the backoff over
+    """
+    monkeypatch.setattr(Connection, "STABLE_CONNECTION_SECONDS", 0)
+    paths = run_chat(FakeEvi([([CHAT_METADATA], 1011)] * 4 + [([], 1008)]))
+
+    assert len(paths) == 5
+    assert delays == [0, 0, 0, 0]
+
+
+@pytest.mark.parametrize("close_code", sorted(Connection.FATAL_CLOSE_CODES))
+def test_fatal_close_codes_stop_reconnecting(close_code):
+    """
+    after a close code for which reconnecting won't help, the client doesn't reconnect
+    """
+    assert len(run_chat(FakeEvi([([CHAT_METADATA], close_code)]))) == 1
+
+
+@pytest.mark.parametrize("code", sorted(Connection.FATAL_ERROR_CODES))
+def test_fatal_error_codes_stop_reconnecting(code):
+    """
+    after an EVI error that ends the chat for good, the client doesn't reconnect even on a normal close
+    """
+    error = {"type": "error", "code": code, "slug": "test", "message": "test"}
+
+    assert len(run_chat(FakeEvi([([CHAT_METADATA, error], 1000)]))) == 1
+
+
+def test_other_errors_reconnect():
+    """
+    an EVI error that isn't fatal is followed by a reconnection
+    """
+    error = {"type": "error", "code": "E0000", "slug": "test", "message": "test"}
+
+    assert len(run_chat(FakeEvi([([CHAT_METADATA, error], 1000), ([], 1008)]))) == 2
+
+
+def test_rejected_resume_falls_back_to_a_new_chat():
+    """
+    the chat group is resumed after a disconnection, and given up for a new chat when EVI refuses to resume it
+    """
+    paths = run_chat(FakeEvi([([CHAT_METADATA], 1011), 400, ([], 1008)]))
+
+    assert paths == [
+        "/v0/evi/chat?api_key=test",
+        "/v0/evi/chat?api_key=test&resumed_chat_group_id=group-1",
+        "/v0/evi/chat?api_key=test",
+    ]
+
+
+@pytest.mark.parametrize("status", [429, 503])
+def test_retryable_rejection_keeps_resuming(status):
+    """
+    a handshake rejected for a reason unrelated to the chat group, such as rate limiting, retries the resume
+    """
+    paths = run_chat(FakeEvi([([CHAT_METADATA], 1011), status, ([], 1008)]))
+
+    assert paths[2] == "/v0/evi/chat?api_key=test&resumed_chat_group_id=group-1"
+
+
+@pytest.mark.parametrize("status", sorted(Connection.AUTH_FAILURE_STATUS_CODES))
+def test_auth_failure_is_fatal(status):
+    """
+    an authentication failure stops the client at once, whether connecting for the first time or resuming
+    """
+    assert len(run_chat(FakeEvi([status]))) == 1
+    assert len(run_chat(FakeEvi([([CHAT_METADATA], 1011), status]))) == 2
+
+
+def test_chunk_is_requeued_when_sending_fails():
+    """
+    a chunk taken from the buffer whose send fails goes back in front of it, for the next connection
+    """
+
+    class ClosedSocket:
+        async def send(self, message):
+            raise websockets.exceptions.ConnectionClosed(None, None)
+
+    async def main():
+        mic = microphone()
+        for chunk in [b"\x01\x00", b"\x02\x00"]:
+            mic.buffer.put(chunk)
+        with pytest.raises(websockets.exceptions.ConnectionClosed):
+            await Connection._send_audio_data(ClosedSocket(), mic, 2)
+        return [await mic.buffer.get() for _ in range(len(mic.buffer))]
+
+    assert asyncio.run(main()) == [b"\x01\x00", b"\x02\x00"]
+
+
+def test_requeued_chunk_is_dropped_when_the_buffer_filled_up():
+    """
+    a chunk put back into a buffer that filled up in the meantime is the oldest one, so it is the one dropped
+    """
+    buffer = CapturedAudioBuffer(2)
+    for chunk in [b"a", b"b"]:
+        buffer.put(chunk)
+
+    buffer.put_back(b"0")
+
+    assert buffer.dropped_chunks == 1
+    assert list(buffer._chunks) == [b"a", b"b"]
@@ -0,0 +1,108 @@
+# run tests locally with:
+# cd src && pytest test_playback.py -v
+
+import io
+import wave
+
+from playback import AudioPlayer, PcmRingBuffer
+
+
+class FakePyAudio:
+    """Opens no device: the test calls the player's stream callback itself, as PortAudio's audio thread would."""
+
+    class Stream:
+        def stop_stream(self) -> None:
+            pass
+
+        def close(self) -> None:
+            pass
+
+    def get_format_from_width(self, width: int) -> int:
+        return width
+
+    def open(self, **kwargs) -> "FakePyAudio.Stream":
+        return self.Stream()
+
+
+def wav_chunk(frames: bytes, sample_rate: int = 8000) -> bytes:
+    data = io.BytesIO()
+    with wave.open(data, "wb") as wav_file:
+        wav_file.setnchannels(1)
+        wav_file.setsampwidth(2)
+        wav_file.setframerate(sample_rate)
+        wav_file.writeframes(frames)
+    return data.getvalue()
+
+
+def played(player: AudioPlayer, n_frames: int) -> bytes:
+    out, _ = player._callback(None, n_frames, {}, 0)
+    return out
+
+
+def test_ring_buffer_wraps_around():
+    """
+    reads and writes across the end of the buffer keep the bytes in order, and what doesn't fit is dropped
+    """
+    buffer = PcmRingBuffer(8)
+    out = memoryview(bytearray(8))
+    buffer.write(b"abcdef")
+    assert buffer.read_into(out[:4]) == 4
+
+    assert buffer.write(b"ghijklmn") == 6
+    assert buffer.dropped_bytes == 2
+    assert buffer.read_into(out) == 8
+    assert bytes(out) == b"efghijkl"
+
+
+def test_skip_to_keeps_later_writes():
+    """
+    skipping to a write position discards only the bytes written before it, and never moves the reader back
+    """
+    buffer = PcmRingBuffer(16)
+    buffer.write(b"old")
+    position = buffer.write_pos
+    buffer.write(b"new")
+    buffer.skip_to(position)
+    buffer.skip_to(0)
+
+    out = memoryview(bytearray(16))
+    assert bytes(out[:buffer.read_into(out)]) == b"new"
+
+
+def test_consecutive_chunks_play_without_a_gap():
+    """
+    chunks are played back to back, with silence only once the buffer runs dry
+    """
+    player = AudioPlayer(FakePyAudio())
+    player.play(wav_chunk(b"\x01\x00" * 3))
+    player.play(wav_chunk(b"\x02\x00" * 3))
+
+    assert played(player, 4) == b"\x01\x00" * 3 + b"\x02\x00"
+    assert played(player, 4) == b"\x02\x00" * 2 + b"\x00\x00" * 2
+    assert player.underruns == 1
+
+
+def test_clear_keeps_audio_queued_after_it():
+    """
+    clear() discards the audio queued before it, but not a reply that arrives before the audio thread gets to it
+    """
+    player = AudioPlayer(FakePyAudio())
+    player.play(wav_chunk(b"\x01\x00" * 100))
+    played(player, 10)
+
+    player.clear()
+    player.play(wav_chunk(b"\x02\x00" * 4))
+
+    assert played(player, 4) == b"\x02\x00" * 4
+    assert played(player, 4) == b"\x00\x00" * 4
+
+
+def test_clear_before_any_audio():
+    """
+    clear() before the first chunk does nothing, and the first chunk still plays
+    """
+    player = AudioPlayer(FakePyAudio())
+    player.clear()
+    player.play(wav_chunk(b"\x03\x00" * 2))
+
+    assert played(player, 2) == b"\x03\x00" * 2